@@ -14,60 +14,36 @@
 
 """Wrapper functions around the areca command."""
 
+from concurrent import futures
 import re
 from subprocess import PIPE
 from subprocess import Popen
 import sys
 
 from hardware import detect_utils
+from hardware import kvparser
 
 
 SEP_REGEXP = re.compile(r"\s*:\s*")
-
-
-def _split_units(lis):
-    """Return the unit name if it has a value associated."""
-    units = ['RPM', '%', ' V', ' C', 'Seconds',
-             'Times', 'MHz', 'KB', 'MB', 'GB']
-    for unit in units:
-        match = re.search("(.*)%s$" % unit, lis[1])
-        if match:
-            lis[1] = match.group(1).replace(' ', '')
-            return unit.replace(' ', '')
-    return None
+ENCLOSURE_REGEXP = re.compile(r"\[(Enclosure#.*)")
+UNITS = ['RPM', '%', ' V', ' C', 'Seconds',
+         'Times', 'MHz', 'KB', 'MB', 'GB']
+PARSER = kvparser.KVParser(
+    sep=SEP_REGEXP, key=kvparser.title_key, skip='GuiErrMsg',
+    section=(ENCLOSURE_REGEXP,
+             lambda match: match.group(1).replace('#', '') + '/'),
+    units=UNITS, int_values=True, strip_dot=True)
+# One line per drive of the 'disk info' summary, like:
+#   8  01  Slot#8  Hitachi HDS721010CLA330          1000.2GB  JBOD
+DISK_SUMMARY_REGEXP = re.compile(
+    r"^\s*(\d+)\s+\S+\s+(?:Slot#\s*\d+|SLOT\s+\d+)\s+(.+?)\s+"
+    r"[\d.]+[KMGT]B\b")
+DISK_WORKERS = 4
 
 
 def _parse_output(output, rev=False):
     """Parse the output of the areca command into an associative array."""
-    res = {}
-    append = ""
-    if rev is True:
-        sorted_output = reversed(output.split('\n'))
-    else:
-        sorted_output = output.split('\n')
-    for line in sorted_output:
-        lis = re.split(SEP_REGEXP, line.strip())
-        if len(lis) == 2:
-            if "GuiErrMsg" in lis[0]:
-                continue
-            match = re.search(r"\[(Enclosure#.*)", lis[0])
-            if match:
-                append = match.group(1).replace('#', '') + "/"
-                continue
-            if append:
-                lis[0] = "%s%s" % (append, lis[0])
-            if len(lis[1]) > 1 and lis[1][-1] == '.':
-                lis[1] = lis[1][:-1]
-            unit = _split_units(lis)
-            try:
-                res[lis[0].title().replace(' ', '')] = int(lis[1])
-                if unit:
-                    res["%s/unit" % (lis[0].title().replace(' ', ''))] = unit
-            except ValueError:
-                res[lis[0].title().replace(' ', '')] = lis[1]
-                if unit:
-                    res["%s/unit" % lis[0].title().replace(' ', '')] = unit
-    return res
+    return PARSER.parse(output, reverse=rev)
 
 
 def _split_parts(sep, output):
@@ -143,6 +119,42 @@ def _disk_info(disk):
     return output
 
 
+def _parse_disk_summary(output):
+    """Return the numbers of the populated drives of a 'disk info' output."""
+    disks = []
+    for line in output.split('\n'):
+        res = DISK_SUMMARY_REGEXP.search(line)
+        if res and res.group(2) != 'N.A.':
+            disks.append(int(res.group(1)))
+    return disks
+
+
+def _populated_disks():
+    """List the populated drives with a single 'disk info' call."""
+    return _parse_disk_summary(_run_areca('disk info'))
+
+
+def _disks_info(disks):
+    """Get the information of several hard disks concurrently.
+
+    Returns a list of (disk number, info) tuples in the disks order.
+    """
+    with futures.ThreadPoolExecutor(max_workers=DISK_WORKERS) as executor:
+        return list(zip(disks, executor.map(_disk_info, disks)))
+
+
+def _sequential_disks_info():
+    """Get hard disk information until a drive returns nothing."""
+    disks = []
+    for disk_number in range(1, 255):
+        disk_info_out = _disk_info(disk_number)
+        # If we don't have info about that disk, let's stop here
+        if len(disk_info_out) < 2:
+            break
+        disks.append((disk_number, disk_info_out))
+    return disks
+
+
 def _disable_password():
     """Command to temporarly disable password on the cli"""
     _run_areca('set password=0000')
@@ -190,11 +202,16 @@ def detect_areca():
     for info, value in pwr_info.items():
         hwlist.append(('areca', 'power', info, value))
 
-    for disk_number in range(1, 255):
-        disk_info_out = _disk_info(disk_number)
-        # If we don't have info about that disk, let's stop here
+    disks = _populated_disks()
+    if disks:
+        disks_info = _disks_info(disks)
+    else:
+        # older cli64 versions without a drive summary
+        disks_info = _sequential_disks_info()
+
+    for disk_number, disk_info_out in disks_info:
         if len(disk_info_out) < 2:
-            break
+            continue
         # Extracting disk information
         for info in disk_info_out:
             hwlist.append(('areca', "disk%d" % disk_number, info,
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Built-in CPU and memory micro-benchmarks, used when sysbench is missing.
+
+Each worker is a forked process pinned on one CPU with
+os.sched_setaffinity, which runs a kernel in a loop for a given time.
+The CPU kernel is a prime sieve followed by integer and floating point
+loops. The memory kernels are the STREAM copy/scale/add/triad with
+NumPy; without NumPy, only the copy is available, on bytearrays.
+
+The rates are comparable between machines benchmarked with this engine,
+not with the sysbench ones.
+"""
+
+from concurrent import futures
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    # the memory kernels fall back to bytearray copies
+    numpy = None
+
+
+# Same limit as the --cpu-max-prime option passed to sysbench
+CPU_MAX_PRIME = 15000
+INNER_LOOPS = 1000
+# Small blocks are copied several times per event to hide the loop cost
+MIN_EVENT_BYTES = 1024 * 1024
+STREAM_KERNELS = ('copy', 'scale', 'add', 'triad')
+# Elements of each STREAM array, 64MB of float64 to be out of the caches
+STREAM_ELEMENTS = 8 * 1024 * 1024
+# Elements of the triad chunks, 3 chunks of 128KB stay in the L2 cache
+STREAM_CHUNK = 16 * 1024
+SYSBENCH_VERSION_REGEXP = re.compile(r'sysbench (\d+)\.')
+MEGABYTE = 1024 * 1024
+LINE_SIZE = 64
+# Loads of a pointer chase event
+CHASE_STEPS = 100000
+
+
+def legacy_sysbench():
+    """Check if the installed sysbench has the --test and --max-time CLI.
+
+    The cpu and mem benchmarks run sysbench with the options of the 0.x
+    versions, sysbench 1.0 replaced them with test names and --time.
+    """
+    if not shutil.which('sysbench'):
+        return False
+    try:
+        output = subprocess.check_output(['sysbench', '--version'],
+                                         stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    res = SYSBENCH_VERSION_REGEXP.search(output.decode(errors='ignore'))
+    return res is not None and int(res.group(1)) < 1
+
+
+def select_engine(engine='auto'):
+    """Return 'sysbench' or 'builtin'.
+
+    auto picks sysbench only when a version with the legacy CLI is
+    installed.
+    """
+    if engine == 'auto':
+        return 'sysbench' if legacy_sysbench() else 'builtin'
+    return engine
+
+
+def count_primes(limit):
+    """Count the primes up to limit with a sieve of Eratosthenes."""
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0:2] = b'\0\0'
+    for number in range(2, int(limit ** 0.5) + 1):
+        if sieve[number]:
+            sieve[number * number::number] = bytes(
+                len(range(number * number, limit + 1, number)))
+    return sum(sieve)
+
+
+def cpu_event():
+    """Run one CPU event: a prime sieve, integer and FP loops."""
+    count_primes(CPU_MAX_PRIME)
+    acc = 0
+    value = 1.0
+    for idx in range(1, INNER_LOOPS + 1):
+        acc = (acc * 31 + idx) & 0xffffffff
+        value = value * 1.000001 + 0.5 / idx
+    return acc, value
+
+
+def cpu_setup():
+    """Return the CPU event and its size, the events are counted."""
+    return cpu_event, 1
+
+
+def copy_setup(block_size):
+    """Return an event copying block_size bytes and the bytes it moves."""
+    repeat = max(1, MIN_EVENT_BYTES // block_size)
+    if numpy is not None:
+        src = numpy.ones(block_size, dtype=numpy.uint8)
+        dst = numpy.empty_like(src)
+
+        def event():
+            for _ in range(repeat):
+                numpy.copyto(dst, src)
+    else:
+        # written to be backed by real pages, not the shared zero page
+        src = bytearray(b'\1') * block_size
+        dst = memoryview(bytearray(block_size))
+
+        def event():
+            for _ in range(repeat):
+                dst[:] = src
+    return event, block_size * repeat
+
+
+def stream_setup(kernel, elements=STREAM_ELEMENTS):
+    """Return a STREAM kernel event and the bytes it moves.
+
+    The bytes are counted like STREAM does: 2 arrays for copy and
+    scale, 3 arrays for add and triad. NumPy has no fused multiply-add,
+    so the triad runs its 2 operations on cache-sized chunks to read and
+    write each array once.
+    """
+    a = numpy.ones(elements)
+    b = numpy.full(elements, 2.0)
+    c = numpy.zeros(elements)
+    scalar = 3.0
+    if kernel == 'copy':
+        return (lambda: numpy.copyto(c, a)), 2 * a.nbytes
+    if kernel == 'scale':
+        return (lambda: numpy.multiply(c, scalar, out=b)), 2 * a.nbytes
+
+    if kernel == 'add':
+        return (lambda: numpy.add(a, b, out=c)), 3 * a.nbytes
+
+    chunks = [(a[start:start + STREAM_CHUNK], b[start:start + STREAM_CHUNK],
+               c[start:start + STREAM_CHUNK])
+              for start in range(0, elements, STREAM_CHUNK)]
+
+    def triad():
+        for a_chunk, b_chunk, c_chunk in chunks:
+            numpy.multiply(c_chunk, scalar, out=a_chunk)
+            numpy.add(a_chunk, b_chunk, out=a_chunk)
+    return triad, 3 * a.nbytes
+
+
+def link_chain(chain, lines, shuffle=True):
+    """Link the cache lines of a 'Q' memoryview into a single cycle.
+
+    The first word of each line holds the index of the next line to
+    load, in a random order defeating the prefetchers unless shuffle is
+    False.
+    """
+    stride = LINE_SIZE // 8
+    order = list(range(1, lines))
+    if shuffle:
+        random.shuffle(order)
+    previous = 0
+    for line in order:
+        chain[previous * stride] = line * stride
+        previous = line
+    chain[previous * stride] = 0
+
+
+def chase_setup(size, steps=CHASE_STEPS):
+    """Return a pointer chase event over size bytes and its loads.
+
+    The loads are dependent, so the rate gives the latency.
+    """
+    lines = max(2, size // LINE_SIZE)
+    chain = memoryview(bytearray(lines * LINE_SIZE)).cast('Q')
+    link_chain(chain, lines)
+
+    def event():
+        index = 0
+        for _ in range(steps):
+            index = chain[index]
+        return index
+    return event, steps
+
+
+def pin(cpu):
+    """Pin the calling process or thread on a CPU, if cpu is not None."""
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, [cpu])
+        except OSError as exc:
+            sys.stderr.write('Cannot pin on CPU %d: %s\n' % (cpu, exc))
+
+
+def run_kernel(setup, args, cpu, duration):
+    """Run a kernel on a CPU during duration seconds.
+
+    :returns: the rate of the kernel, per second
+    """
+    pin(cpu)
+    event, size = setup(*args)
+    events = 0
+    start = time.monotonic()
+    deadline = start + duration
+    while True:
+        event()
+        events += 1
+        now = time.monotonic()
+        if now >= deadline:
+            break
+    return events * size / (now - start)
+
+
+def _process_worker(function, args, cpu, conn):
+    try:
+        pin(cpu)
+        conn.send(function(*args))
+    except Exception as exc:
+        conn.send(exc)
+    finally:
+        conn.close()
+
+
+def _start_process(context, function, args, cpu):
+    reader, writer = context.Pipe(duplex=False)
+    process = context.Process(target=_process_worker,
+                              args=(function, args, cpu, writer))
+    process.start()
+    writer.close()
+    return process, reader
+
+
+def _join_process(process, reader):
+    try:
+        result = reader.recv()
+    except EOFError:
+        result = RuntimeError('benchmark worker died')
+    process.join()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def run_pinned(function, args, cpu):
+    """Run a function in a forked process pinned on a CPU.
+
+    :returns: the result of the function, its exceptions are raised again
+    """
+    context = multiprocessing.get_context('fork')
+    return _join_process(*_start_process(context, function, args, cpu))
+
+
+def run_processes(setup, args, cpus, duration):
+    """Run a kernel in one forked process per CPU, all at the same time.
+
+    :param cpus: the CPUs to pin the workers on, None for no pinning
+    :returns: the rate of each worker, in the order of cpus
+    """
+    context = multiprocessing.get_context('fork')
+    workers = [_start_process(context, run_kernel,
+                              (setup, args, cpu, duration), cpu)
+               for cpu in cpus]
+    return [_join_process(process, reader) for process, reader in workers]
+
+
+def run_threads(setup, args, cpus, duration):
+    """Run a kernel in one thread per CPU, all at the same time.
+
+    Only the kernels releasing the GIL, like the NumPy ones, scale with
+    the number of threads.
+    """
+    with futures.ThreadPoolExecutor(max_workers=len(cpus)) as executor:
+        return list(executor.map(
+            lambda cpu: run_kernel(setup, args, cpu, duration), cpus))
+
+
+def cpu_rates(cpus, duration):
+    """Return the CPU events per second of one worker per CPU."""
+    return run_processes(cpu_setup, (), cpus, duration)
+
+
+def copy_bandwidths(block_size, cpus, duration, threaded=False):
+    """Return the copy bandwidth, in MB/s, of one worker per CPU."""
+    run = run_threads if threaded else run_processes
+    return [rate / MEGABYTE
+            for rate in run(copy_setup, (block_size,), cpus, duration)]
+
+
+def stream_bandwidths(cpus, duration, elements=STREAM_ELEMENTS):
+    """Return the total STREAM bandwidths in MB/s of workers on cpus.
+
+    :returns: a dict indexed by kernel, empty without NumPy
+    """
+    if numpy is None:
+        return {}
+    bandwidths = {}
+    for kernel in STREAM_KERNELS:
+        bandwidths[kernel] = sum(run_processes(
+            stream_setup, (kernel, elements), cpus, duration)) / MEGABYTE
+    return bandwidths
@@ -18,12 +18,49 @@
 Benchmark CPU functions.
 """
 
+import statistics
 import subprocess
 import sys
 
+from hardware.benchmark import builtin
+from hardware.benchmark import topology
 from hardware.benchmark import utils
 
 
+# Duration of the calibration runs of the parallel mode, in seconds
+CALIBRATION_TIME = 2
+# Slowdown of a socket running next to the others, in percent, above
+# which the sockets are benchmarked one after the other
+INTERFERENCE_THRESHOLD = 5.0
+# Time budget of the every-core sweep, in seconds
+SWEEP_BUDGET = 60
+# Deviation from the socket median, in percent, of an outlier core
+OUTLIER_THRESHOLD = 10.0
+
+
+def start_sysbench_cpu(max_time, cpu_count, processor_num=None):
+    """Start sysbench cpu, pinned on a CPU if processor_num is set."""
+    taskset = ''
+    if processor_num is not None:
+        taskset = 'taskset %s' % hex(1 << processor_num)
+    cmds = ('%s sysbench --max-time=%d --max-requests=10000000'
+            ' --num-threads=%d --test=cpu --cpu-max-prime=15000 run'
+            % (taskset, max_time, cpu_count))
+    return subprocess.Popen(cmds, shell=True, stdout=subprocess.PIPE)
+
+
+def parse_sysbench_cpu(sysbench_cmd, max_time):
+    """Return the events per second of a sysbench cpu run, or None."""
+    value = None
+    for line in sysbench_cmd.stdout:
+        line = line.decode()
+        if "total number of events" in line:
+            line_ = line.rstrip('\n').replace(' ', '')
+            _, perf = line_.split(':')
+            value = int(int(perf) / max_time)
+    return value
+
+
 def run_sysbench_cpu(hw_lst, max_time, cpu_count, processor_num=None):
     """Running sysbench cpu stress of a give amount of logical cpu.
 
@@ -34,33 +71,210 @@ def run_sysbench_cpu(hw_lst, max_time, cpu_count, processor_num=None):
         will test all CPUs. Defaults to None.
 
     """
-    taskset = ''
     if processor_num is not None:
         sys.stderr.write('Benchmarking CPU %d for %d seconds (%d threads)\n' %
                          (processor_num, max_time, cpu_count))
-        taskset = 'taskset %s' % hex(1 << processor_num)
     else:
         sys.stderr.write('Benchmarking all CPUs for '
                          '%d seconds (%d threads)\n' % (max_time, cpu_count))
 
-    cmds = ('%s sysbench --max-time=%d --max-requests=10000000'
-            ' --num-threads=%d --test=cpu --cpu-max-prime=15000 run'
-            % (taskset, max_time, cpu_count))
-    sysbench_cmd = subprocess.Popen(cmds, shell=True, stdout=subprocess.PIPE)
+    value = parse_sysbench_cpu(
+        start_sysbench_cpu(max_time, cpu_count, processor_num), max_time)
+    if value is None:
+        return
+    if processor_num is not None:
+        hw_lst.append(('cpu', 'logical_%d' % processor_num,
+                       'loops_per_sec', str(value)))
+    else:
+        hw_lst.append(('cpu', 'logical', 'loops_per_sec', str(value)))
 
-    for line in sysbench_cmd.stdout:
-        line = line.decode()
-        if "total number of events" in line:
-            line_ = line.rstrip('\n').replace(' ', '')
-            _, perf = line_.split(':')
 
-            value = str(int(int(perf) / max_time))
-            if processor_num is not None:
-                hw_lst.append(('cpu',
-                               'logical_%d' % processor_num,
-                               'loops_per_sec', value))
-            else:
-                hw_lst.append(('cpu', 'logical', 'loops_per_sec', value))
+def run_builtin_cpu(hw_lst, max_time, cpu_count, processor_num=None):
+    """Run the built-in CPU benchmark, like run_sysbench_cpu does.
+
+    All the CPUs are benchmarked with one pinned process per CPU, the
+    result is the sum of their events per second.
+    """
+    if processor_num is not None:
+        sys.stderr.write('Benchmarking CPU %d for %d seconds (built-in)\n' %
+                         (processor_num, max_time))
+        cpus = [processor_num]
+    else:
+        sys.stderr.write('Benchmarking all CPUs for %d seconds '
+                         '(%d built-in processes)\n' % (max_time, cpu_count))
+        cpus = (topology.spread(topology.read_topology(), cpu_count)
+                or [None] * cpu_count)
+    value = int(sum(builtin.cpu_rates(cpus, max_time)))
+    if processor_num is not None:
+        hw_lst.append(('cpu', 'logical_%d' % processor_num,
+                       'loops_per_sec', str(value)))
+    else:
+        hw_lst.append(('cpu', 'logical', 'loops_per_sec', str(value)))
+
+
+def run_cpu(hw_lst, max_time, cpu_count, processor_num=None,
+            engine='sysbench'):
+    """Run the CPU benchmark with the sysbench or the builtin engine."""
+    if engine == 'builtin':
+        run_builtin_cpu(hw_lst, max_time, cpu_count, processor_num)
+    else:
+        run_sysbench_cpu(hw_lst, max_time, cpu_count, processor_num)
+
+
+def run_sysbench_cpu_parallel(max_time, processors):
+    """Run one pinned sysbench thread on each CPU at the same time.
+
+    :returns: a dict of the events per second indexed by CPU number
+    """
+    sysbench_cmds = [(processor_num, start_sysbench_cpu(max_time, 1,
+                                                        processor_num))
+                     for processor_num in processors]
+    return dict((processor_num, parse_sysbench_cpu(sysbench_cmd, max_time))
+                for processor_num, sysbench_cmd in sysbench_cmds)
+
+
+def run_cpu_parallel(max_time, processors, engine='sysbench'):
+    """Run one pinned worker on each CPU at the same time.
+
+    :returns: a dict of the events per second indexed by CPU number
+    """
+    if engine == 'builtin':
+        return dict(zip(processors,
+                        (int(rate) for rate in builtin.cpu_rates(processors,
+                                                                 max_time))))
+    return run_sysbench_cpu_parallel(max_time, processors)
+
+
+def measure_interference(processors, calibration_time=CALIBRATION_TIME,
+                         engine='sysbench'):
+    """Measure how much a socket slows down when the others are busy.
+
+    The first CPU is benchmarked alone and then next to the other ones,
+    for calibration_time seconds each.
+
+    :returns: the slowdown of the first CPU in percent, None if it
+              cannot be measured
+    """
+    first = processors[0]
+    alone = run_cpu_parallel(calibration_time, [first], engine).get(first)
+    together = run_cpu_parallel(calibration_time, processors,
+                                engine).get(first)
+    if not alone or together is None:
+        return None
+    return max(0.0, (alone - together) * 100.0 / alone)
+
+
+def run_sockets_parallel(hw_lst, max_time, processors, engine='sysbench'):
+    """Benchmark one CPU per socket concurrently after a calibration.
+
+    The sockets run on disjoint CPUs. When the calibration shows they
+    slow each other down, they are benchmarked one after the other.
+
+    :returns: True if the sockets were benchmarked concurrently
+    """
+    interference = measure_interference(processors, engine=engine)
+    if interference is not None:
+        hw_lst.append(('cpu', 'logical', 'socket_interference',
+                       '%.1f' % interference))
+    if interference is None or interference > INTERFERENCE_THRESHOLD:
+        sys.stderr.write('CPU Performance: sockets interfere with each '
+                         'other (%s%%), benchmarking them serially\n' %
+                         ('unknown' if interference is None
+                          else '%.1f' % interference))
+        hw_lst.append(('cpu', 'logical', 'socket_mode', 'serial'))
+        return False
+
+    sys.stderr.write('Benchmarking CPUs %s concurrently for %d seconds\n' %
+                     (', '.join(str(cpu) for cpu in processors), max_time))
+    hw_lst.append(('cpu', 'logical', 'socket_mode', 'parallel'))
+    results = run_cpu_parallel(max_time, processors, engine)
+    for processor_num in processors:
+        if results[processor_num] is not None:
+            hw_lst.append(('cpu', 'logical_%d' % processor_num,
+                           'loops_per_sec', str(results[processor_num])))
+    return True
+
+
+def plan_sweep_waves(topo, logical, max_waves=None):
+    """Split the logical CPUs into waves benchmarked concurrently.
+
+    A wave never holds two SMT siblings, so each CPU of a wave has its
+    core for itself. Without topology the CPUs are tested one by one.
+    When there are more waves than max_waves, consecutive waves are
+    merged so the sweep fits its time budget, at the cost of running
+    some siblings together.
+    """
+    if not topo:
+        waves = [[cpu] for cpu in range(logical)]
+    else:
+        threads = {}
+        for cpu in topo:
+            threads.setdefault(cpu.thread, []).append(cpu.cpu)
+        waves = [threads[thread] for thread in sorted(threads)]
+    if max_waves and len(waves) > max_waves:
+        merged = [[] for _ in range(max_waves)]
+        for idx, wave in enumerate(waves):
+            merged[idx * max_waves // len(waves)].extend(wave)
+        waves = merged
+    return waves
+
+
+def summarize_sweep(hw_lst, results, topo):
+    """Report the spread of the sweep results and the outliers per socket.
+
+    A CPU is an outlier when it deviates from the median of the CPUs of
+    its socket and core type by more than OUTLIER_THRESHOLD percent. The
+    keys of hybrid processors are suffixed by the core type, like
+    sweep_performance_min.
+    """
+    cpus = dict((cpu.cpu, (cpu.package, cpu.core_type or '')) for cpu in topo)
+    groups = {}
+    for processor_num, value in sorted(results.items()):
+        if value is not None:
+            groups.setdefault(cpus.get(processor_num, (0, '')), []).append(
+                (processor_num, value))
+    for (package, core_type), values in sorted(groups.items()):
+        loops = [value for _, value in values]
+        median = statistics.median(loops)
+        outliers = [processor_num for processor_num, value in values
+                    if median
+                    and (abs(value - median) * 100.0 / median
+                         > OUTLIER_THRESHOLD)]
+        physical = 'physical_%d' % package
+        prefix = 'sweep_%s' % (core_type + '_' if core_type else '')
+        hw_lst.append(('cpu', physical, prefix + 'min', str(min(loops))))
+        hw_lst.append(('cpu', physical, prefix + 'max', str(max(loops))))
+        hw_lst.append(('cpu', physical, prefix + 'median', '%d' % median))
+        hw_lst.append(('cpu', physical, prefix + 'spread', '%.1f' % (
+            (max(loops) - min(loops)) * 100.0 / median if median else 0)))
+        hw_lst.append(('cpu', physical, prefix + 'outliers',
+                       ','.join(str(cpu) for cpu in outliers)))
+
+
+def cpu_sweep(hw_lst, time_budget=SWEEP_BUDGET, engine='sysbench'):
+    """Benchmark every logical CPU to find the weak or mis-clocked ones.
+
+    The CPUs of a wave run concurrently, one pinned sysbench thread per
+    CPU, and the waves share the time budget with at least one second
+    each. There are never more waves than seconds in the budget.
+    """
+    logical = int(utils.get_value(hw_lst, 'cpu', 'logical', 'number'))
+    topo = topology.read_topology()
+    waves = plan_sweep_waves(topo, logical, max(1, time_budget))
+    wave_time = max(1, time_budget // len(waves))
+    sys.stderr.write('CPU Sweep: %d logical CPU to test in %d waves '
+                     '(ETA: %d seconds)\n' % (sum(len(wave) for wave in waves),
+                                              len(waves),
+                                              wave_time * len(waves)))
+    results = {}
+    for wave in waves:
+        results.update(run_cpu_parallel(wave_time, wave, engine))
+    for processor_num in sorted(results):
+        if results[processor_num] is not None:
+            hw_lst.append(('cpu', 'logical_%d' % processor_num,
+                           'loops_per_sec', str(results[processor_num])))
+    summarize_sweep(hw_lst, results, topo)
+    return results
 
 
 def search_cpuinfo(processor_num, item):
@@ -93,7 +307,8 @@ def get_cache_size(hw_lst, processor_num):
                        'cache_size', cache_size))
 
 
-def cpu_perf(hw_lst, max_time=10, burn_test=False):
+def cpu_perf(hw_lst, max_time=10, burn_test=False, parallel=False,
+             sweep_budget=None, engine='sysbench'):
     """Perform CPU's performance test.
 
     :param hw_lst: The hardware inventory list.
@@ -101,6 +316,13 @@ def cpu_perf(hw_lst, max_time=10, burn_test=False):
         Defaults to 10.
     :param burn_test: Boolean value. Whether to perform a burn
         test. Defaults to False.
+    :param parallel: Boolean value. Whether to benchmark the sockets
+        concurrently. Defaults to False.
+    :param sweep_budget: Benchmark every logical CPU within this time
+        budget in seconds instead of one CPU per socket. Defaults to
+        None.
+    :param engine: 'sysbench' or 'builtin', the builtin engine does not
+        need the sysbench binary. Defaults to 'sysbench'.
 
     """
     logical = utils.get_value(hw_lst, 'cpu', 'logical', 'number')
@@ -109,17 +331,32 @@ def cpu_perf(hw_lst, max_time=10, burn_test=False):
     # Individual Test aren't useful for burn_test
     if burn_test is False:
         if physical is not None:
-            sys.stderr.write('CPU Performance: %d logical '
-                             'CPU to test (ETA: %d seconds)\n'
-                             % (int(physical),
-                                (int(physical) + 1) * max_time))
-            for processor_num in utils.get_one_cpu_per_socket(hw_lst):
+            processors = utils.get_benchmark_cpus(hw_lst)
+            for processor_num in processors:
                 get_bogomips(hw_lst, processor_num)
                 get_cache_size(hw_lst, processor_num)
-                run_sysbench_cpu(hw_lst, max_time, 1, processor_num)
+            if sweep_budget:
+                cpu_sweep(hw_lst, sweep_budget, engine)
+            elif parallel and len(processors) > 1:
+                sys.stderr.write('CPU Performance: %d logical '
+                                 'CPU to test concurrently (ETA: %d '
+                                 'seconds)\n'
+                                 % (len(processors),
+                                    2 * max_time + 2 * CALIBRATION_TIME))
+                if not run_sockets_parallel(hw_lst, max_time, processors,
+                                            engine):
+                    for processor_num in processors:
+                        run_cpu(hw_lst, max_time, 1, processor_num, engine)
+            else:
+                sys.stderr.write('CPU Performance: %d logical '
+                                 'CPU to test (ETA: %d seconds)\n'
+                                 % (len(processors),
+                                    (len(processors) + 1) * max_time))
+                for processor_num in processors:
+                    run_cpu(hw_lst, max_time, 1, processor_num, engine)
     else:
         sys.stderr.write('CPU Burn: %d logical'
                          ' CPU to test (ETA: %d seconds)\n' % (
                              int(logical), max_time))
 
-    run_sysbench_cpu(hw_lst, max_time, int(logical))
+    run_cpu(hw_lst, max_time, int(logical), engine=engine)
@@ -18,10 +18,15 @@
 Benchmark Disk functions.
 """
 
+import collections
 import json
 import os
+import re
 import subprocess
 import sys
+import tempfile
+
+from hardware.benchmark import topology
 
 
 # NOTE(lucasagomes): The amount of time a specified workload will run before
@@ -31,6 +36,20 @@ import sys
 # thus it will increase the total runtime if a special timeout or runtime
 # is specified.
 RAMP_TIME = 5
+# Default points of the block size, queue depth and numjobs sweep
+SWEEP_BLOCK_SIZES = ('4k', '16k', '64k', '256k', '1M')
+SWEEP_IODEPTHS = (1, 4, 16, 64, 256)
+SWEEP_NUMJOBS = (1,)
+SWEEP_RAMP_TIME = 2
+# Completion latency percentiles reported by the sweep
+SWEEP_PERCENTILES = ('50', '99', '99.9')
+PCI_ADDRESS = re.compile(r'^[0-9a-f]{4}:[0-9a-f]{2}:[0-9a-f]{2}\.[0-7]$')
+
+# A group of jobs running concurrently on disks, options holds the
+# extra job options like iodepth or numjobs
+FioGroup = collections.namedtuple('FioGroup', ['label', 'mode', 'io_size',
+                                               'disks', 'options'],
+                                  defaults=[()])
 
 
 def is_booted_storage_device(disk):
@@ -64,39 +83,119 @@ def get_disks_name(hw_lst, without_bootable=False):
     return disks
 
 
-def run_fio(hw_lst, disks_list, mode, io_size, time, rampup_time):
-    """Run the 'fio' benchmark tool."""
-    filelist = [f for f in os.listdir(".") if f.endswith(".fio")]
-    for myfile in filelist:
-        os.remove(myfile)
-    fio = ("fio --ioengine=libaio --invalidate=1 --ramp_time=%d --iodepth=32 "
-           "--runtime=%d --time_based --direct=1 --output-format=json "
-           "--bs=%s --rw=%s --random_generator=tausworthe64" %
-           (rampup_time, time, io_size, mode))
-
-    global_disk_list = ''
-    for disk in disks_list:
-        if '/dev/' not in disk:
-            disk = '/dev/%s' % disk
+def get_disk_cpus(disk, topo=None):
+    """Return the CPU list of the NUMA node of a disk, or None."""
+    node = topology.device_node('/sys/block/%s/device' % disk)
+    if node is None:
+        return None
+    if topo is None:
+        topo = topology.read_topology()
+    return topology.format_cpu_list(topology.node_cpus(topo, node)) or None
+
+
+def get_disk_controller(disk, sysfs_root=topology.SYS_ROOT):
+    """Return the PCI address of the controller of a disk, or None."""
+    path = os.path.join(sysfs_root, 'block', disk, 'device')
+    if not os.path.exists(path):
+        return None
+    controller = None
+    # the closest PCI device to the disk is its controller
+    for part in os.path.realpath(path).split(os.sep):
+        if PCI_ADDRESS.match(part):
+            controller = part
+    return controller
+
+
+def controller_waves(disks):
+    """Split the disks into waves with at most one disk per controller.
+
+    The disks of a wave do not share a controller, so their standalone
+    tests can run concurrently. The disks of an unknown controller are
+    tested one after the other.
+    """
+    controllers = collections.OrderedDict()
+    for disk in disks:
+        controllers.setdefault(get_disk_controller(disk), []).append(disk)
+    waves = []
+    for controller_disks in controllers.values():
+        for idx, disk in enumerate(controller_disks):
+            if idx == len(waves):
+                waves.append([])
+            waves[idx].append(disk)
+    return waves
+
+
+def fio_job_file(groups, time, rampup_time, topo=None, global_options=()):
+    """Return a fio job file running the groups one after the other.
+
+    :param groups: a list of FioGroup, the jobs of the disks of a group
+                   run concurrently and are named <label>@<disk>
+    :param global_options: extra options of the global section
+    """
+    if topo is None:
+        topo = topology.read_topology()
+    lines = ['[global]',
+             'ioengine=libaio',
+             'invalidate=1',
+             'ramp_time=%d' % rampup_time,
+             'iodepth=32',
+             'runtime=%d' % time,
+             'time_based',
+             'direct=1',
+             'random_generator=tausworthe64']
+    lines.extend(global_options)
+    for label, mode, io_size, disks, options in groups:
+        for idx, disk in enumerate(disks):
+            lines.extend(['', '[%s@%s]' % (label, disk)])
+            if idx == 0:
+                # wait for the previous group and report this one apart
+                lines.extend(['stonewall', 'new_group'])
+            lines.extend(['filename=/dev/%s' % disk,
+                          'bs=%s' % io_size,
+                          'rw=%s' % mode])
+            lines.extend(options)
+            # the job runs on the NUMA node of the disk controller
+            cpus = get_disk_cpus(disk, topo)
+            if cpus:
+                lines.append('cpus_allowed=%s' % cpus)
+    return '\n'.join(lines) + '\n'
+
+
+def run_fio_job_file(groups, time, rampup_time, global_options=()):
+    """Run the groups of fio jobs with a single fio process.
+
+    :returns: the JSON output of fio
+    """
+    disks = []
+    for group in groups:
+        sys.stderr.write('Benchmarking storage %s for %s seconds in '
+                         '%s mode with blocksize=%s%s\n' %
+                         (','.join(group.disks), time, group.mode,
+                          group.io_size,
+                          ''.join(' %s' % option
+                                  for option in group.options)))
+        disks.extend(disk for disk in group.disks if disk not in disks)
+    for disk in disks:
         # Flusing Disk's cache prior benchmark
-        os.system("hdparm -f %s >/dev/null 2>&1" % disk)
-        short_disk = disk.replace('/dev/', '')
-        fio = "%s --name=MYJOB-%s --filename='%s'" % (fio, short_disk, disk)
-        global_disk_list += '%s,' % short_disk
-    global_disk_list = global_disk_list.rstrip(',')
-    sys.stderr.write(
-        'Benchmarking storage %s for %s seconds in '
-        '%s mode with blocksize=%s\n' %
-        (global_disk_list, time, mode, io_size))
-    fio_cmd = subprocess.check_output(fio, shell=True)
-    data = json.loads(fio_cmd)
-    for job in data['jobs']:
-        current_disk = job['jobname'].replace("MYJOB-", "")
-        if len(disks_list) > 1:
-            mode_str = "simultaneous_%s_%s" % (mode, io_size)
-        else:
-            mode_str = "standalone_%s_%s" % (mode, io_size)
+        os.system("hdparm -f /dev/%s >/dev/null 2>&1" % disk)
 
+    with tempfile.NamedTemporaryFile('w', suffix='.fio',
+                                     delete=False) as job_file:
+        job_file.write(fio_job_file(groups, time, rampup_time,
+                                    global_options=global_options))
+    try:
+        fio_cmd = subprocess.check_output(
+            'fio --output-format=json %s' % job_file.name, shell=True)
+    finally:
+        os.remove(job_file.name)
+    return json.loads(fio_cmd)
+
+
+def run_fio_groups(hw_lst, groups, time, rampup_time):
+    """Run the groups of fio jobs and report their bandwidth and IOPS."""
+    data = run_fio_job_file(groups, time, rampup_time)
+    for job in data['jobs']:
+        mode_str, _, current_disk = job['jobname'].partition('@')
         for item in ['read', 'write']:
             if job[item]['runtime'] > 0:
                 hw_lst.append(('disk', current_disk, mode_str + '_KBps',
@@ -105,45 +204,161 @@ def run_fio(hw_lst, disks_list, mode, io_size, time, rampup_time):
                                str(job[item]['iops'])))
 
 
+def run_fio(hw_lst, disks_list, mode, io_size, time, rampup_time):
+    """Run the 'fio' benchmark tool on disks at the same time."""
+    disks_list = [disk.replace('/dev/', '') for disk in disks_list]
+    if len(disks_list) > 1:
+        mode_str = "simultaneous_%s_%s" % (mode, io_size)
+    else:
+        mode_str = "standalone_%s_%s" % (mode, io_size)
+    run_fio_groups(hw_lst, [FioGroup(mode_str, mode, io_size, disks_list)],
+                   time, rampup_time)
+
+
 def disk_perf(hw_lst, destructive=False, running_time=10):
-    """Reporting disk performance."""
+    """Reporting disk performance.
+
+    All the tests run from a single fio job file. The standalone tests
+    of disks on different controllers run concurrently, then all the
+    disks are tested simultaneously.
+    """
     mode = "non destructive"
-    # Let's count the number of runs in safe mode
     disks = get_disks_name(hw_lst)
-    disks_num = len(disks)
-    total_runtime = disks_num * (running_time + RAMP_TIME) * 2
-    if disks_num > 1:
-        total_runtime += 2 * (running_time + RAMP_TIME)
-
+    tests = [("read", "1M", disks), ("randread", "4k", disks)]
     if destructive:
-        total_runtime = total_runtime * 2
         mode = 'destructive'
+        writable = get_disks_name(hw_lst, True)
+        tests = [("write", "1M", writable),
+                 ("randwrite", "4k", writable)] + tests
+
+    groups = []
+    for fio_mode, io_size, test_disks in tests:
+        for wave in controller_waves(test_disks):
+            groups.append(FioGroup("standalone_%s_%s" % (fio_mode, io_size),
+                                   fio_mode, io_size, wave))
+    if len(disks) > 1:
+        for fio_mode, io_size, test_disks in tests:
+            groups.append(FioGroup("simultaneous_%s_%s" % (fio_mode,
+                                                           io_size),
+                                   fio_mode, io_size, test_disks))
+    groups = [group for group in groups if group.disks]
+    if not groups:
+        return
 
     sys.stderr.write('Running storage bench on %d disks in'
                      ' %s mode for %d seconds\n' %
-                     (disks_num, mode, total_runtime))
-    for disk in disks:
-        is_booted_storage_device(disk)
-        if destructive:
-            if is_booted_storage_device(disk):
-                sys.stderr.write("Skipping disk %s in destructive mode,"
-                                 " this is the booted device !" % disk)
-            else:
-                run_fio(hw_lst, ['%s' % disk], "write", "1M",
-                        running_time, RAMP_TIME)
-                run_fio(hw_lst, ['%s' % disk], "randwrite", "4k",
-                        running_time, RAMP_TIME)
-
-        run_fio(hw_lst, ['%s' % disk],
-                "read", "1M", running_time, RAMP_TIME)
-        run_fio(hw_lst, ['%s' % disk],
-                "randread", "4k", running_time, RAMP_TIME)
-
-    if disks_num > 1:
-        if destructive:
-            run_fio(hw_lst, get_disks_name(hw_lst, True),
-                    "write", "1M", running_time, RAMP_TIME)
-            run_fio(hw_lst, get_disks_name(hw_lst, True),
-                    "randwrite", "4k", running_time, RAMP_TIME)
-        run_fio(hw_lst, disks, "read", "1M", running_time, RAMP_TIME)
-        run_fio(hw_lst, disks, "randread", "4k", running_time, RAMP_TIME)
+                     (len(disks), mode,
+                      len(groups) * (running_time + RAMP_TIME)))
+    run_fio_groups(hw_lst, groups, running_time, RAMP_TIME)
+
+
+def find_knee(points):
+    """Return the point of a queue depth series where the disk saturates.
+
+    The knee maximizes the power, the IOPS divided by the mean
+    completion latency: below it more depth adds IOPS, above it only
+    adds latency.
+
+    :param points: a list of (iodepth, IOPS, mean latency)
+    """
+    points = [point for point in points if point[1] > 0 and point[2] > 0]
+    if not points:
+        return None
+    return max(points, key=lambda point: point[1] / point[2])
+
+
+def report_sweep(hw_lst, data):
+    """Report the sweep points, their latency percentiles and the knees.
+
+    :returns: a dict of the (iodepth, IOPS, mean latency) points indexed
+              by (disk, series label)
+    """
+    series = collections.OrderedDict()
+    for job in data['jobs']:
+        label, _, current_disk = job['jobname'].partition('@')
+        for item in ['read', 'write']:
+            if job[item]['runtime'] <= 0:
+                continue
+            clat = job[item].get('clat_ns', {})
+            hw_lst.append(('disk', current_disk, label + '_KBps',
+                           str(job[item]['bw'])))
+            hw_lst.append(('disk', current_disk, label + '_IOps',
+                           str(int(job[item]['iops']))))
+            percentiles = clat.get('percentile', {})
+            for percentile in SWEEP_PERCENTILES:
+                value = percentiles.get('%f' % float(percentile))
+                if value is not None:
+                    hw_lst.append(('disk', current_disk,
+                                   '%s_clat_p%s_usec' % (label, percentile),
+                                   '%.1f' % (value / 1000.0)))
+            series_label, _, iodepth = label.rpartition('_qd')
+            series.setdefault((current_disk, series_label), []).append(
+                (int(iodepth), job[item]['iops'], clat.get('mean', 0)))
+
+    for (current_disk, series_label), points in series.items():
+        knee = find_knee(points)
+        if knee:
+            hw_lst.append(('disk', current_disk,
+                           series_label + '_knee_iodepth', str(knee[0])))
+            hw_lst.append(('disk', current_disk, series_label + '_knee_IOps',
+                           str(int(knee[1]))))
+    return series
+
+
+def merge_runs(runs):
+    """Merge the fio outputs of several runs into one.
+
+    The jobs of all the runs follow each other, with the number of their
+    run from 1 under 'run'.
+    """
+    merged = dict(runs[0])
+    merged['jobs'] = [dict(job, run=run)
+                      for run, data in enumerate(runs, 1)
+                      for job in data.get('jobs', [])]
+    return merged
+
+
+def disk_sweep(hw_lst, destructive=False, running_time=5,
+               block_sizes=SWEEP_BLOCK_SIZES, iodepths=SWEEP_IODEPTHS,
+               numjobs=SWEEP_NUMJOBS, report_file=None, runs=None):
+    """Sweep the block sizes, queue depths and numjobs of each disk.
+
+    Each point runs alone, with the jobs of numjobs reported as one. The
+    disks are tested in random read, and in random write in destructive
+    mode.
+
+    :param report_file: write the full JSON output of fio in this file
+    :param runs: the fio outputs of the previous runs of a repeated
+                 sweep, this run is added and the report merges them
+    """
+    tests = [('randread', get_disks_name(hw_lst))]
+    if destructive:
+        tests.append(('randwrite', get_disks_name(hw_lst, True)))
+    # the label of a point is its series label and its queue depth
+    groups = [FioGroup('sweep_%s_%s_j%d_qd%d' % (mode, io_size, jobs,
+                                                 iodepth),
+                       mode, io_size, [disk],
+                       ('iodepth=%d' % iodepth, 'numjobs=%d' % jobs))
+              for mode, disks in tests
+              for disk in disks
+              for io_size in block_sizes
+              for jobs in numjobs
+              for iodepth in iodepths]
+    if not groups:
+        return None
+
+    sys.stderr.write('Running storage sweep on %d points for %d seconds\n' %
+                     (len(groups),
+                      len(groups) * (running_time + SWEEP_RAMP_TIME)))
+    data = run_fio_job_file(groups, running_time, SWEEP_RAMP_TIME,
+                            global_options=(
+                                'group_reporting',
+                                'percentile_list=%s' %
+                                ':'.join(SWEEP_PERCENTILES)))
+    if runs is not None:
+        runs.append(data)
+    if report_file:
+        with open(report_file, 'w') as report:
+            json.dump(merge_runs(runs) if runs else data, report, indent=2)
+    report_sweep(hw_lst, data)
+    return data
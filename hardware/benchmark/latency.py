@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Memory latency ladder.
+
+A pointer chase is timed on working sets doubling from 4K to 256M, with
+random and sequential strides. The plateaus of the random curve give
+the capacity and the latency of each cache level, they are checked
+against the cache sizes reported by lscpu. The sequential curve shows
+whether the prefetchers work.
+
+The latencies include the cost of a load in the interpreter, reported
+as latency_overhead, and are meant to be compared between machines.
+The plateaus are searched above this overhead; a cache whose step is
+below the resolution of the ladder, LEVEL_STEP ns, is reported as
+unresolved rather than not detected.
+"""
+
+import math
+import mmap
+import re
+import statistics
+import sys
+import time
+
+from hardware.benchmark import builtin
+from hardware.benchmark import mem
+from hardware.benchmark import utils
+
+
+MIN_SIZE = 4 * 1024
+MAX_SIZE = 256 * 1024 * 1024
+PATTERNS = ('random', 'sequential')
+# Loads of a measure, the best of REPEAT measures is kept
+LOADS = 200000
+REPEAT = 3
+# A new level starts when the latency above the overhead grows by
+# LEVEL_RATIO and by LEVEL_STEP ns over the highest one of the level
+LEVEL_RATIO = 1.2
+LEVEL_STEP = 2.0
+# Caches reported by detect_utils.get_cpus
+CACHES = (('L1', 'l1d cache'), ('L2', 'l2 cache'), ('L3', 'l3 cache'))
+CACHE_SIZE_REGEXP = re.compile(r'^([\d.]+)\s*([KMG]?)(?:i?B)?'
+                               r'(?:\s*\((\d+) instances?\))?$')
+
+
+def format_size(size):
+    """Convert bytes into a block size like 4K, 1M or 1G."""
+    for unit, factor in (('G', 1024 ** 3), ('M', 1024 ** 2), ('K', 1024)):
+        if size >= factor and size % factor == 0:
+            return '%d%s' % (size // factor, unit)
+    return str(size)
+
+
+def parse_cache_size(value):
+    """Convert an lscpu cache size into the bytes of one instance.
+
+    lscpu reports 512K, or 8 MiB (16 instances) with the total of all
+    the instances on recent versions.
+    """
+    res = CACHE_SIZE_REGEXP.match(str(value).strip())
+    if not res:
+        return None
+    size = float(res.group(1)) * {'': 1, 'K': 1024, 'M': 1024 ** 2,
+                                  'G': 1024 ** 3}[res.group(2)]
+    if res.group(3):
+        size /= int(res.group(3))
+    return int(size)
+
+
+def ladder_sizes(max_size=MAX_SIZE):
+    """Return the working set sizes, doubling from MIN_SIZE."""
+    sizes = []
+    size = MIN_SIZE
+    while size <= max_size:
+        sizes.append(size)
+        size *= 2
+    return sizes
+
+
+def chase(chain, loads):
+    """Return the time of a dependent load through the chain, in ns."""
+    rounds = max(1, loads // 8)
+    index = 0
+    start = time.perf_counter()
+    # unrolled to lower the cost of the loop
+    for _ in range(rounds):
+        index = chain[index]
+        index = chain[index]
+        index = chain[index]
+        index = chain[index]
+        index = chain[index]
+        index = chain[index]
+        index = chain[index]
+        index = chain[index]
+    return (time.perf_counter() - start) * 1e9 / (rounds * 8)
+
+
+def measure(size, pattern, hugepages=False, loads=LOADS):
+    """Return the latency of a pointer chase on size bytes, in ns."""
+    lines = max(2, size // builtin.LINE_SIZE)
+    buf = mmap.mmap(-1, lines * builtin.LINE_SIZE)
+    if hugepages and hasattr(mmap, 'MADV_HUGEPAGE'):
+        buf.madvise(mmap.MADV_HUGEPAGE)
+    chain = memoryview(buf).cast('Q')
+    try:
+        builtin.link_chain(chain, lines, shuffle=pattern == 'random')
+        # the first run warms the caches and the TLB
+        chase(chain, min(loads, lines))
+        return min(chase(chain, loads) for _ in range(REPEAT))
+    finally:
+        chain.release()
+        buf.close()
+
+
+def run_ladder(sizes, hugepages=False, loads=LOADS):
+    """Measure the latency of each pattern and size.
+
+    :returns: the overhead of a load in the interpreter and a dict of
+              the latencies indexed by (pattern, size)
+    """
+    # 2 lines always stay in the L1 cache
+    overhead = measure(2 * builtin.LINE_SIZE, 'sequential', loads=loads)
+    latencies = {}
+    for pattern in PATTERNS:
+        for size in sizes:
+            latencies[(pattern, size)] = measure(size, pattern, hugepages,
+                                                 loads)
+    return overhead, latencies
+
+
+def detect_levels(sizes, latencies):
+    """Split a latency curve into plateaus.
+
+    :param latencies: the latency of each size, above the overhead
+    :returns: a list of (largest size, median latency) per plateau, the
+              sizes between two steps of a gradual rise are dropped
+    """
+    segments = [[0]]
+    for idx in range(1, len(sizes)):
+        # the noise of the plateau is not a step
+        highest = max(latencies[pos] for pos in segments[-1])
+        if (latencies[idx] - highest >= LEVEL_STEP
+                and latencies[idx] >= LEVEL_RATIO * highest):
+            segments.append([])
+        segments[-1].append(idx)
+    return [(sizes[segment[-1]],
+             statistics.median(latencies[idx] for idx in segment))
+            for pos, segment in enumerate(segments)
+            if len(segment) > 1 or pos in (0, len(segments) - 1)]
+
+
+def check_caches(levels, caches):
+    """Match the cache levels with the sizes reported by lscpu.
+
+    A level matches a cache when its capacity is within a factor 2 of
+    the cache size, the ladder only measures powers of 2.
+
+    :param caches: a list of (name, size in bytes)
+    :returns: a list of (name, matching level index or None)
+    """
+    checks = []
+    for name, size in caches:
+        matches = [(abs(math.log(capacity / float(size))), idx)
+                   for idx, (capacity, _) in enumerate(levels[:-1], 1)
+                   if size / 2 <= capacity <= size * 2]
+        checks.append((name, min(matches)[1] if matches else None))
+    return checks
+
+
+def resolved(sizes, latencies, size):
+    """Check if the ladder can see the step of a cache of size bytes.
+
+    The latency rises over the 2 sizes after the largest one fitting in
+    the cache, a rise below LEVEL_STEP ns is lost in the noise of the
+    interpreter.
+
+    :param latencies: the latency of each size, above the overhead
+    """
+    fitting = [idx for idx, ladder_size in enumerate(sizes)
+               if ladder_size <= size]
+    start = fitting[-1] if fitting else 0
+    after = latencies[start + 1:start + 3]
+    return bool(after) and max(after) - latencies[start] >= LEVEL_STEP
+
+
+def expected_caches(hw_lst):
+    """Return the (name, size in bytes) of the caches lscpu reported."""
+    caches = []
+    for name, key in CACHES:
+        size = parse_cache_size(utils.get_value(hw_lst, 'cpu', 'physical_0',
+                                                key))
+        if size:
+            caches.append((name, size))
+    return caches
+
+
+def report_ladder(hw_lst, processor_num, sizes, overhead, latencies):
+    """Report the ladder, its cache levels and their check."""
+    ltag = 'logical_%d' % processor_num
+    hw_lst.append(('cpu', ltag, 'latency_overhead', '%.1f' % overhead))
+    for pattern in PATTERNS:
+        for size in sizes:
+            hw_lst.append(('cpu', ltag,
+                           'latency_%s_%s' % (pattern, format_size(size)),
+                           '%.1f' % latencies[(pattern, size)]))
+
+    # the overhead hides the small steps in the ratio of the latencies
+    random = [max(0.0, latencies[('random', size)] - overhead)
+              for size in sizes]
+    levels = detect_levels(sizes, random)
+    for idx, (capacity, latency) in enumerate(levels[:-1], 1):
+        hw_lst.append(('cpu', ltag, 'cache_level_%d_size' % idx,
+                       format_size(capacity)))
+        hw_lst.append(('cpu', ltag, 'cache_level_%d_latency' % idx,
+                       '%.1f' % latency))
+    hw_lst.append(('cpu', ltag, 'memory_latency', '%.1f' % levels[-1][1]))
+
+    caches = expected_caches(hw_lst)
+    for (name, level), (_, size) in zip(check_caches(levels, caches),
+                                        caches):
+        if level:
+            check = 'ok'
+        elif resolved(sizes, random, size):
+            check = 'not_detected'
+            sys.stderr.write('Latency ladder: no cache level of CPU %d '
+                             'matches the %s cache\n' % (processor_num, name))
+        else:
+            check = 'unresolved'
+            sys.stderr.write('Latency ladder: the %s cache of CPU %d is '
+                             'below the resolution of the ladder\n' %
+                             (name, processor_num))
+        hw_lst.append(('cpu', ltag, 'cache_%s_check' % name, check))
+
+    # the prefetchers hide the latency of sequential loads in memory
+    largest = sizes[-1]
+    if latencies[('sequential', largest)] > 0:
+        hw_lst.append(('cpu', ltag, 'prefetch_ratio', '%.1f' % (
+            latencies[('random', largest)]
+            / latencies[('sequential', largest)])))
+
+
+def latency_perf(hw_lst, max_size=MAX_SIZE, hugepages=False):
+    """Run the latency ladder from one CPU per socket and core type."""
+    # a ladder step needs its buffer and the list shuffling it
+    while max_size > MIN_SIZE and 2 * max_size > mem.get_available_memory():
+        max_size //= 2
+    sizes = ladder_sizes(max_size)
+    processors = utils.get_benchmark_cpus(hw_lst)
+    sys.stderr.write('Latency ladder: %d logical CPU to test from %s to %s'
+                     '%s\n' % (len(processors), format_size(sizes[0]),
+                               format_size(sizes[-1]),
+                               ' with hugepages' if hugepages else ''))
+    for processor_num in processors:
+        overhead, latencies = builtin.run_pinned(run_ladder,
+                                                 (sizes, hugepages),
+                                                 processor_num)
+        report_ladder(hw_lst, processor_num, sizes, overhead, latencies)
@@ -18,10 +18,14 @@
 Benchmark Memory functions.
 """
 
+from concurrent import futures
 import re
 import subprocess
 import sys
+import threading
 
+from hardware.benchmark import builtin
+from hardware.benchmark import topology
 from hardware.benchmark import utils
 
 
@@ -34,8 +38,8 @@ def get_available_memory():
     return -1
 
 
-def check_mem_size(block_size, cpu_count):
-    """Check if a test can run with a given block size and cpu count."""
+def get_block_size(block_size):
+    """Convert a sysbench block size (4K, 1M...) into bytes."""
     dsplit = re.compile(r'\d+')
     ssplit = re.compile(r'[A-Z]+')
     unit = ssplit.findall(block_size)
@@ -46,15 +50,30 @@ def check_mem_size(block_size, cpu_count):
         unit_in_bytes = 1024 * 1024
     elif unit[0] == 'G':
         unit_in_bytes = 1024 * 1024 * 1024
+    return unit_in_bytes * int(dsplit.findall(block_size)[0])
 
-    size_in_bytes = (unit_in_bytes * int(dsplit.findall(block_size)[0])
-                     * cpu_count)
+
+def check_mem_size(block_size, cpu_count):
+    """Check if a test can run with a given block size and cpu count."""
+    size_in_bytes = get_block_size(block_size) * cpu_count
     if size_in_bytes > get_available_memory():
         return False
 
     return True
 
 
+def parse_sysbench_memory(sysbench_cmd):
+    """Return the MB/s of a sysbench memory run, or None."""
+    value = None
+    for line in sysbench_cmd.stdout:
+        line = line.decode()
+        if "transferred" in line:
+            _, right = line.rstrip('\n').replace(' ', '').split('(')
+            perf, _ = right.split('.')
+            value = int(perf)
+    return value
+
+
 def run_sysbench_memory_threaded(hw_lst, max_time, block_size, cpu_count,
                                  processor_num=None):
     """Running memtest on a processor."""
@@ -87,24 +106,66 @@ def run_sysbench_memory_threaded(hw_lst, max_time, block_size, cpu_count,
                                             cpu_count, block_size),
                                     shell=True, stdout=subprocess.PIPE)
 
-    for line in sysbench_cmd.stdout:
-        line = line.decode()
-        if "transferred" in line:
-            _, right = line.rstrip('\n').replace(' ', '').split('(')
-            perf, _ = right.split('.')
-            if processor_num is not None:
-                hw_lst.append(('cpu',
-                               'logical_%d' % processor_num,
-                               'bandwidth_%s' % block_size,
-                               perf))
-            else:
-                hw_lst.append(('cpu', 'logical',
-                               'threaded_bandwidth_%s' % block_size,
-                               perf))
+    perf = parse_sysbench_memory(sysbench_cmd)
+    if perf is None:
+        return
+    if processor_num is not None:
+        hw_lst.append(('cpu',
+                       'logical_%d' % processor_num,
+                       'bandwidth_%s' % block_size,
+                       str(perf)))
+    else:
+        hw_lst.append(('cpu', 'logical',
+                       'threaded_bandwidth_%s' % block_size,
+                       str(perf)))
+
+
+def get_forked_cpus(cpu_count):
+    """Return the CPUs of the forked workers, on their own core first."""
+    # without sysfs the logical CPUs are assumed to be numbered from 0
+    return (topology.spread(topology.read_topology(), cpu_count)
+            or list(range(cpu_count)))
+
+
+def report_forked(hw_lst, block_size, results):
+    """Report the aggregate, minimum and per-worker forked bandwidths.
+
+    :param results: a list of (CPU number, MB/s or None) per worker
+    """
+    values = [value for _, value in results if value is not None]
+    if len(values) < len(results):
+        sys.stderr.write('Benchmarking memory @%s: %d of %d workers '
+                         'failed\n' % (block_size,
+                                       len(results) - len(values),
+                                       len(results)))
+    if not values:
+        return
+    hw_lst.append(('cpu', 'logical', 'forked_bandwidth_%s' % block_size,
+                   str(sum(values))))
+    hw_lst.append(('cpu', 'logical', 'forked_min_bandwidth_%s' % block_size,
+                   str(min(values))))
+    for processor_num, value in results:
+        if value is not None:
+            hw_lst.append(('cpu', 'logical_%d' % processor_num,
+                           'forked_bandwidth_%s' % block_size, str(value)))
+
+
+def _sysbench_memory_worker(barrier, max_time, block_size, processor_num):
+    barrier.wait()
+    _cmd = ('taskset -c %d sysbench --max-time=%d --max-requests=100000000 '
+            '--num-threads=1 --test=memory --memory-block-size=%s run')
+    return parse_sysbench_memory(subprocess.Popen(
+        _cmd % (processor_num, max_time, block_size),
+        shell=True, stdout=subprocess.PIPE))
 
 
 def run_sysbench_memory_forked(hw_lst, max_time, block_size, cpu_count):
-    """Running forked memtest on a processor."""
+    """Running forked memtest on a processor.
+
+    One single-threaded sysbench is pinned on each CPU, they are all
+    started when the workers reach a barrier and each one reports its
+    own bandwidth.
+    """
     if check_mem_size(block_size, cpu_count) is False:
         cmd = ('Avoid benchmarking memory @%s from all'
                ' CPUs (%d forked processes), not enough memory\n')
@@ -113,53 +174,119 @@ def run_sysbench_memory_forked(hw_lst, max_time, block_size, cpu_count):
     sys.stderr.write('Benchmarking memory @%s from all CPUs'
                      ' for %d seconds (%d forked processes)\n'
                      % (block_size, max_time, cpu_count))
-    sysbench_cmd = '('
-    for _ in range(cpu_count):
-        _cmd = ('sysbench --max-time=%d --max-requests=100000000 '
-                '--num-threads=1 --test=memory --memory-block-size=%s run &')
-        sysbench_cmd += _cmd % (max_time, block_size)
-
-    sysbench_cmd.rstrip('&')
-    sysbench_cmd += ')'
-
-    global_perf = 0
-    process = subprocess.Popen(
-        sysbench_cmd, shell=True, stdout=subprocess.PIPE)
-    for line in process.stdout:
-        line = line.decode()
-        if "transferred" in line:
-            _, right = line.rstrip('\n').replace(' ', '').split('(')
-            perf, _ = right.split('.')
-            global_perf += int(perf)
+    # each process is pinned on its own core, SMT threads come last
+    cpus = get_forked_cpus(cpu_count)
+    barrier = threading.Barrier(len(cpus))
+    with futures.ThreadPoolExecutor(max_workers=len(cpus)) as executor:
+        values = list(executor.map(
+            lambda cpu: _sysbench_memory_worker(barrier, max_time,
+                                                block_size, cpu), cpus))
+    report_forked(hw_lst, block_size, list(zip(cpus, values)))
 
-    hw_lst.append(('cpu', 'logical', 'forked_bandwidth_%s' %
-                   (block_size), str(global_perf)))
 
+def run_builtin_memory(hw_lst, max_time, block_size, cpu_count,
+                       processor_num=None, forked=False):
+    """Run the built-in copy benchmark, with the keys of sysbench.
 
-def mem_perf(hw_lst, max_time=5):
-    """Report the memory performance."""
+    Each worker copies a block into another one, the block size is
+    checked twice against the available memory.
+    """
+    if check_mem_size(block_size, 2 * cpu_count) is False:
+        sys.stderr.write('Avoid benchmarking memory @%s (built-in), '
+                         'not enough memory\n' % block_size)
+        return
+    if processor_num is not None:
+        sys.stderr.write('Benchmarking memory @%s from CPU %d'
+                         ' for %d seconds (built-in)\n' %
+                         (block_size, processor_num, max_time))
+        cpus = [processor_num]
+        key = ('logical_%d' % processor_num, 'bandwidth_%s' % block_size)
+    else:
+        sys.stderr.write('Benchmarking memory @%s from all CPUs for %d '
+                         'seconds (%d built-in %s)\n' %
+                         (block_size, max_time, cpu_count,
+                          'processes' if forked else 'threads'))
+        if forked:
+            cpus = get_forked_cpus(cpu_count)
+        else:
+            cpus = (topology.spread(topology.read_topology(), cpu_count)
+                    or [None] * cpu_count)
+        key = ('logical', 'threaded_bandwidth_%s' % block_size)
+    bandwidths = builtin.copy_bandwidths(get_block_size(block_size), cpus,
+                                         max_time, threaded=not forked)
+    if forked:
+        report_forked(hw_lst, block_size,
+                      [(cpu, int(value))
+                       for cpu, value in zip(cpus, bandwidths)])
+    else:
+        hw_lst.append(('cpu',) + key + (str(int(sum(bandwidths))),))
+
+
+def run_builtin_stream(hw_lst, max_time, cpu_count):
+    """Run the STREAM kernels from all CPUs, if NumPy is available."""
+    cpus = (topology.spread(topology.read_topology(), cpu_count)
+            or [None] * cpu_count)
+    bandwidths = builtin.stream_bandwidths(cpus, max_time)
+    if not bandwidths:
+        sys.stderr.write('Info: NumPy is not installed, '
+                         'skipping the STREAM benchmark\n')
+    for kernel in builtin.STREAM_KERNELS:
+        if kernel in bandwidths:
+            hw_lst.append(('cpu', 'logical', 'stream_%s' % kernel,
+                           str(int(bandwidths[kernel]))))
+
+
+def run_memory_threaded(hw_lst, max_time, block_size, cpu_count,
+                        processor_num=None, engine='sysbench'):
+    if engine == 'builtin':
+        run_builtin_memory(hw_lst, max_time, block_size, cpu_count,
+                           processor_num)
+    else:
+        run_sysbench_memory_threaded(hw_lst, max_time, block_size, cpu_count,
+                                     processor_num)
+
+
+def run_memory_forked(hw_lst, max_time, block_size, cpu_count,
+                      engine='sysbench'):
+    if engine == 'builtin':
+        run_builtin_memory(hw_lst, max_time, block_size, cpu_count,
+                           forked=True)
+    else:
+        run_sysbench_memory_forked(hw_lst, max_time, block_size, cpu_count)
+
+
+def mem_perf(hw_lst, max_time=5, engine='sysbench'):
+    """Report the memory performance.
+
+    :param engine: 'sysbench' or 'builtin', the builtin engine also runs
+        the STREAM kernels when NumPy is installed.
+    """
     all_cpu_testing_time = 5
     block_size_list = ['1K', '4K', '1M', '16M', '128M', '1G', '2G']
     logical = utils.get_value(hw_lst, 'cpu', 'logical', 'number')
     physical = utils.get_value(hw_lst, 'cpu', 'physical', 'number')
     if physical:
-        eta = int(physical) * len(block_size_list) * max_time
+        processors = utils.get_benchmark_cpus(hw_lst, per_node=True)
+        eta = len(processors) * len(block_size_list) * max_time
         eta += 2 * (all_cpu_testing_time * len(block_size_list))
         sys.stderr.write('Memory Performance: %d logical CPU'
                          ' to test (ETA: %d seconds)\n'
-                         % (int(physical), int(eta)))
-        for cpu_nb in utils.get_one_cpu_per_socket(hw_lst):
+                         % (len(processors), int(eta)))
+        for cpu_nb in processors:
             for block_size in block_size_list:
-                run_sysbench_memory_threaded(hw_lst, max_time,
-                                             block_size, 1, cpu_nb)
+                run_memory_threaded(hw_lst, max_time, block_size, 1,
+                                    cpu_nb, engine)
 
         # There is not need to test fork vs thread
         #  if only a single logical cpu is present
         if int(logical) > 1:
             for block_size in block_size_list:
-                run_sysbench_memory_threaded(hw_lst, all_cpu_testing_time,
-                                             block_size, int(logical))
+                run_memory_threaded(hw_lst, all_cpu_testing_time,
+                                    block_size, int(logical), engine=engine)
 
             for block_size in block_size_list:
-                run_sysbench_memory_forked(hw_lst, all_cpu_testing_time,
-                                           block_size, int(logical))
+                run_memory_forked(hw_lst, all_cpu_testing_time,
+                                  block_size, int(logical), engine)
+
+        if engine == 'builtin':
+            run_builtin_stream(hw_lst, all_cpu_testing_time, int(logical))
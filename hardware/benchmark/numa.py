@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Benchmark the memory of each NUMA node from the CPUs of each node.
+
+For each (CPU node, memory node) pair, a worker is forked and pinned on
+a CPU of the first node, its memory policy binds its allocations to the
+second node with set_mempolicy, then the copy bandwidth and the pointer
+chase latency of the builtin engine are measured.
+"""
+
+import ctypes
+import errno
+import os
+import platform
+import sys
+
+from hardware.benchmark import builtin
+from hardware.benchmark import topology
+
+
+MPOL_BIND = 2
+# set_mempolicy has no wrapper in the libc, only in libnuma. aarch64
+# uses the generic table of asm-generic/unistd.h
+SET_MEMPOLICY_SYSCALLS = {'x86_64': 238,
+                          'aarch64': 237,
+                          'ppc64': 261,
+                          'ppc64le': 261,
+                          's390x': 270}
+# Size of the copied blocks and of the pointer chase buffer, both are
+# larger than the caches to measure the memory
+BANDWIDTH_SIZE = 64 * 1024 * 1024
+LATENCY_SIZE = 64 * 1024 * 1024
+
+
+def memory_nodes(sysfs_root=topology.SYS_ROOT):
+    """Return the NUMA nodes having memory, including CPU-less ones."""
+    try:
+        with open(os.path.join(sysfs_root, 'devices', 'system', 'node',
+                               'has_memory')) as has_memory:
+            return topology.parse_cpu_list(has_memory.readline())
+    except IOError:
+        return []
+
+
+def node_mask(nodes):
+    """Return the nodemask and maxnode arguments of set_mempolicy."""
+    bits = ctypes.sizeof(ctypes.c_ulong) * 8
+    words = max(nodes) // bits + 1
+    mask = (ctypes.c_ulong * words)()
+    for node in nodes:
+        mask[node // bits] |= 1 << (node % bits)
+    # the kernel only reads maxnode - 1 bits
+    return mask, words * bits + 1
+
+
+def bind_memory(node):
+    """Bind the future allocations of the calling process to a node."""
+    syscall = SET_MEMPOLICY_SYSCALLS.get(platform.machine())
+    if syscall is None:
+        raise OSError(errno.ENOSYS, 'set_mempolicy is not supported on %s' %
+                      platform.machine())
+    mask, maxnode = node_mask([node])
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(syscall, MPOL_BIND, mask, ctypes.c_ulong(maxnode)) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+
+def bound_setup(node, setup, *args):
+    """Setup a builtin kernel with its memory allocated on a node."""
+    bind_memory(node)
+    return setup(*args)
+
+
+def measure_pair(cpu, node, max_time):
+    """Measure the memory of a node from a CPU.
+
+    :returns: the copy bandwidth in MB/s and the latency in ns
+    """
+    bandwidth = builtin.run_processes(
+        bound_setup, (node, builtin.copy_setup, BANDWIDTH_SIZE), [cpu],
+        max_time)[0] / builtin.MEGABYTE
+    loads = builtin.run_processes(
+        bound_setup, (node, builtin.chase_setup, LATENCY_SIZE), [cpu],
+        max_time)[0]
+    return bandwidth, 1e9 / loads
+
+
+def numa_perf(hw_lst, max_time=2, sysfs_root=topology.SYS_ROOT):
+    """Report the bandwidth and latency matrix of the NUMA nodes.
+
+    The pairs are measured one after the other, with one CPU per node.
+    """
+    cpu_nodes = topology.per_node(topology.read_topology(sysfs_root))
+    if not cpu_nodes:
+        sys.stderr.write('Info: No CPU topology, skipping the NUMA '
+                         'benchmark\n')
+        return
+    mem_nodes = memory_nodes(sysfs_root) or list(cpu_nodes)
+    sys.stderr.write('NUMA Performance: %d CPU nodes x %d memory nodes '
+                     'to test (ETA: %d seconds)\n' %
+                     (len(cpu_nodes), len(mem_nodes),
+                      2 * max_time * len(cpu_nodes) * len(mem_nodes)))
+    for node, cpu in cpu_nodes.items():
+        for mem_node in mem_nodes:
+            sys.stderr.write('Benchmarking memory of node %d from CPU %d '
+                             '(node %d)\n' % (mem_node, cpu, node))
+            try:
+                bandwidth, latency = measure_pair(cpu, mem_node, max_time)
+            except OSError as exc:
+                sys.stderr.write('NUMA Performance: cannot bind the memory '
+                                 'to node %d: %s\n' % (mem_node, exc))
+                continue
+            hw_lst.append(('numa', 'node_%d' % node,
+                           'bandwidth_to_node_%d' % mem_node,
+                           str(int(bandwidth))))
+            hw_lst.append(('numa', 'node_%d' % node,
+                           'latency_to_node_%d' % mem_node,
+                           '%.1f' % latency))
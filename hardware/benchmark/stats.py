@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Repeat the benchmarks and report the statistics of their measurements.
+
+A benchmark is run several times after discarding warm-up runs, or
+until the 95% confidence interval of each of its measurements is
+narrow enough. Each numeric measurement is then reported with its
+mean under its usual key, completed by the median, the stddev, the
+confidence interval of the mean and a stability flag.
+
+A repetition runs the whole benchmark again: the imprecise measurement
+of one disk repeats the fio runs of all the disks.
+"""
+
+import math
+import statistics
+import sys
+
+
+# Two-sided 95% critical values of the Student t distribution, indexed
+# by degrees of freedom
+T_TABLE = (None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306,
+           2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110,
+           2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056,
+           2.052, 2.048, 2.045, 2.042)
+T_INFINITY = 1.960
+# Relative error of the confidence interval, in percent, above which a
+# measurement is unstable when no target error is given
+UNSTABLE_ERROR = 5.0
+MAX_REPETITIONS = 20
+
+
+def t_value(degrees):
+    """Return the 95% two-sided critical value of Student t."""
+    if degrees < len(T_TABLE):
+        return T_TABLE[degrees]
+    return T_INFINITY
+
+
+def summarize(values):
+    """Return the statistics of the samples of a measurement.
+
+    :returns: a dict with the samples count, median, mean, stddev, the
+              95% confidence interval of the mean and its relative
+              error in percent, the last ones are None for a single
+              sample
+    """
+    summary = {'samples': len(values),
+               'median': statistics.median(values),
+               'mean': statistics.mean(values),
+               'stddev': None,
+               'ci_low': None,
+               'ci_high': None,
+               'error': None}
+    if len(values) > 1:
+        stddev = statistics.stdev(values)
+        half = t_value(len(values) - 1) * stddev / math.sqrt(len(values))
+        summary.update(stddev=stddev,
+                       ci_low=summary['mean'] - half,
+                       ci_high=summary['mean'] + half,
+                       error=(half * 100.0 / abs(summary['mean'])
+                              if summary['mean'] else 0.0))
+    return summary
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _decimals(value):
+    """Return the decimals of a value to format its statistics alike."""
+    value = str(value)
+    return len(value.split('.')[1]) if '.' in value else 0
+
+
+def collect(runs):
+    """Group the measurements of several runs by key.
+
+    :param runs: the list of the tuples each run added
+    :returns: a dict of the values indexed by the first 3 fields of the
+              tuples, in the order they were first reported
+    """
+    measurements = {}
+    for run in runs:
+        for entry in run:
+            measurements.setdefault(entry[:3], []).append(entry[3])
+    return measurements
+
+
+def report(hw_lst, measurements, target_error=None):
+    """Report the mean and the statistics of each measurement.
+
+    The values which are not numbers are reported as the last run saw
+    them.
+
+    :returns: the keys of the unstable measurements
+    """
+    threshold = target_error if target_error is not None else UNSTABLE_ERROR
+    unstable = []
+    for key, values in measurements.items():
+        numbers = [_number(value) for value in values]
+        if None in numbers:
+            hw_lst.append(key + (values[-1],))
+            continue
+        summary = summarize(numbers)
+        fmt = '%%.%df' % _decimals(values[0])
+        hw_lst.append(key + (fmt % summary['mean'],))
+        hw_lst.append(key[:2] + (key[2] + '_median',
+                                 fmt % summary['median']))
+        hw_lst.append(key[:2] + (key[2] + '_samples',
+                                 str(summary['samples'])))
+        if summary['error'] is None:
+            continue
+        hw_lst.append(key[:2] + (key[2] + '_stddev',
+                                 fmt % summary['stddev']))
+        hw_lst.append(key[:2] + (key[2] + '_ci95_low',
+                                 fmt % summary['ci_low']))
+        hw_lst.append(key[:2] + (key[2] + '_ci95_high',
+                                 fmt % summary['ci_high']))
+        hw_lst.append(key[:2] + (key[2] + '_error',
+                                 '%.1f' % summary['error']))
+        stable = summary['error'] <= threshold
+        hw_lst.append(key[:2] + (key[2] + '_stability',
+                                 'stable' if stable else 'unstable'))
+        if not stable:
+            unstable.append(key)
+    return unstable
+
+
+def _precise(runs, target_error):
+    """Check if all the measurements reached the target error."""
+    for values in collect(runs).values():
+        numbers = [_number(value) for value in values]
+        if None not in numbers:
+            error = summarize(numbers)['error']
+            if error is None or error > target_error:
+                return False
+    return True
+
+
+def run_repeated(hw_lst, benchmark, kwargs=None, repetitions=1, warmup=0,
+                 target_error=None, max_repetitions=MAX_REPETITIONS):
+    """Run a benchmark several times and report its statistics.
+
+    :param benchmark: a function adding its measurements to the
+                      hardware list it is given
+    :param kwargs: the keyword arguments of the benchmark
+    :param repetitions: the number of measured runs, the minimum one
+                        with a target error
+    :param warmup: the number of runs discarded before them
+    :param target_error: repeat the runs until the relative error of the
+                         confidence interval of each measurement is below
+                         this percentage
+    :param max_repetitions: the maximum number of measured runs with a
+                            target error, repetitions included
+    :returns: the keys of the unstable measurements
+    """
+    kwargs = kwargs or {}
+    if repetitions <= 1 and not warmup and target_error is None:
+        benchmark(hw_lst, **kwargs)
+        return []
+
+    name = getattr(benchmark, '__name__', 'benchmark')
+    runs = []
+    if target_error is None:
+        limit = repetitions
+    else:
+        repetitions = min(repetitions, max_repetitions)
+        limit = max_repetitions
+    for run in range(warmup + limit):
+        if run >= warmup + repetitions and _precise(runs, target_error):
+            break
+        sys.stderr.write('Running %s: %s %d\n' %
+                         (name, 'warm-up' if run < warmup else 'repetition',
+                          run + 1 if run < warmup else run - warmup + 1))
+        # the benchmark reads the inventory and appends its measurements
+        run_lst = list(hw_lst)
+        benchmark(run_lst, **kwargs)
+        if run >= warmup:
+            runs.append(run_lst[len(hw_lst):])
+
+    unstable = report(hw_lst, collect(runs), target_error)
+    for key in unstable:
+        sys.stderr.write('Warning: %s measurement %s is unstable\n' %
+                         (name, '/'.join(key)))
+    return unstable
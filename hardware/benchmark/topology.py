@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+CPU topology and benchmark placement.
+
+The topology is read from sysfs without running any command. The
+placement functions pick the CPUs the benchmarks are pinned on: one
+representative per socket, per NUMA node or per core type, preferring
+the first SMT thread of a core and the performance cores.
+"""
+
+import collections
+import os
+
+
+SYS_ROOT = '/sys'
+
+PERFORMANCE = 'performance'
+EFFICIENCY = 'efficiency'
+
+# cpu: logical CPU number, package: socket, core: core id in the socket,
+# node: NUMA node, core_type: PERFORMANCE, EFFICIENCY or None, thread:
+# rank of the CPU in its SMT siblings
+Cpu = collections.namedtuple('Cpu', ['cpu', 'package', 'core', 'node',
+                                     'core_type', 'thread'])
+
+
+def parse_cpu_list(value):
+    """Convert a sysfs CPU list (0-3,8,10-11) into a list of numbers."""
+    cpus = []
+    for part in (value or '').strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def format_cpu_list(cpus):
+    """Convert CPU numbers into a CPU list like taskset -c and fio use."""
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join('%d' % first if first == last else '%d-%d' % (first, last)
+                    for first, last in ranges)
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as sysfs:
+            return sysfs.readline().strip()
+    except IOError:
+        return None
+
+
+def _read_int(path, default=None):
+    try:
+        return int(_read(path))
+    except (TypeError, ValueError):
+        return default
+
+
+def _cpu_nodes(sysfs_root):
+    nodes = {}
+    node_dir = os.path.join(sysfs_root, 'devices', 'system', 'node')
+    try:
+        entries = os.listdir(node_dir)
+    except OSError:
+        return nodes
+    for entry in entries:
+        if entry.startswith('node') and entry[4:].isdigit():
+            for cpu in parse_cpu_list(_read(os.path.join(node_dir, entry,
+                                                         'cpulist'))):
+                nodes[cpu] = int(entry[4:])
+    return nodes
+
+
+def _core_types(sysfs_root, cpus, cpu_dir):
+    """Return the core type of the CPUs of hybrid processors.
+
+    Intel hybrid processors list their P and E cores in the cpu_core and
+    cpu_atom PMUs, big.LITTLE ARM processors have a cpu_capacity lower
+    than the maximum on their little cores.
+    """
+    types = {}
+    for pmu, core_type in (('cpu_core', PERFORMANCE),
+                           ('cpu_atom', EFFICIENCY)):
+        for cpu in parse_cpu_list(_read(os.path.join(
+                sysfs_root, 'devices', pmu, 'cpus'))):
+            types[cpu] = core_type
+    if types:
+        return types
+
+    capacities = {}
+    for cpu in cpus:
+        capacity = _read_int(os.path.join(cpu_dir, 'cpu%d' % cpu,
+                                          'cpu_capacity'))
+        if capacity is not None:
+            capacities[cpu] = capacity
+    if capacities and len(set(capacities.values())) > 1:
+        highest = max(capacities.values())
+        for cpu, capacity in capacities.items():
+            types[cpu] = PERFORMANCE if capacity == highest else EFFICIENCY
+    return types
+
+
+def read_topology(sysfs_root=SYS_ROOT):
+    """Read the topology of the online CPUs.
+
+    :returns: a list of Cpu sorted by CPU number, empty if sysfs cannot
+              be read
+    """
+    cpu_dir = os.path.join(sysfs_root, 'devices', 'system', 'cpu')
+    cpus = parse_cpu_list(_read(os.path.join(cpu_dir, 'online')))
+    if not cpus:
+        return []
+    nodes = _cpu_nodes(sysfs_root)
+    types = _core_types(sysfs_root, cpus, cpu_dir)
+    topology = []
+    for cpu in cpus:
+        topo_dir = os.path.join(cpu_dir, 'cpu%d' % cpu, 'topology')
+        siblings = parse_cpu_list(_read(os.path.join(
+            topo_dir, 'thread_siblings_list'))) or [cpu]
+        topology.append(Cpu(
+            cpu=cpu,
+            package=_read_int(os.path.join(topo_dir, 'physical_package_id'),
+                              0),
+            core=_read_int(os.path.join(topo_dir, 'core_id'), cpu),
+            node=nodes.get(cpu, 0),
+            core_type=types.get(cpu),
+            thread=siblings.index(cpu) if cpu in siblings else 0))
+    return topology
+
+
+def _representative(cpus):
+    """Pick the first thread of a core, on a performance core if any."""
+    return min(cpus, key=lambda cpu: (cpu.thread,
+                                      cpu.core_type == EFFICIENCY,
+                                      cpu.cpu)).cpu
+
+
+def _per(topology, field):
+    groups = collections.OrderedDict()
+    for cpu in topology:
+        groups.setdefault(getattr(cpu, field), []).append(cpu)
+    return collections.OrderedDict(
+        (key, _representative(cpus)) for key, cpus in sorted(groups.items()))
+
+
+def per_socket(topology):
+    """Return {package: CPU number} with one CPU on each socket."""
+    return _per(topology, 'package')
+
+
+def per_node(topology):
+    """Return {NUMA node: CPU number} with one CPU on each node."""
+    return _per(topology, 'node')
+
+
+def per_core_type(topology):
+    """Return {core type: CPU number}, empty if all the cores are alike."""
+    if not any(cpu.core_type for cpu in topology):
+        return collections.OrderedDict()
+    return _per([cpu for cpu in topology if cpu.core_type], 'core_type')
+
+
+def smt_siblings(topology):
+    """Return the groups of SMT siblings, for cores with several threads."""
+    cores = collections.OrderedDict()
+    for cpu in topology:
+        cores.setdefault((cpu.package, cpu.core), []).append(cpu.cpu)
+    return [sorted(cpus) for cpus in cores.values() if len(cpus) > 1]
+
+
+def node_cpus(topology, node):
+    """Return the CPU numbers of a NUMA node."""
+    return [cpu.cpu for cpu in topology if cpu.node == node]
+
+
+def spread(topology, count):
+    """Return count CPUs spread over the cores before using SMT threads."""
+    ordered = sorted(topology, key=lambda cpu: (cpu.thread, cpu.cpu))
+    return [cpu.cpu for cpu in ordered[:count]]
+
+
+def device_node(sysfs_path):
+    """Return the NUMA node of a device, or None if it is unknown.
+
+    :param sysfs_path: the sysfs directory of the device, its parents are
+                       searched for the numa_node of the PCI device
+    """
+    path = os.path.realpath(sysfs_path)
+    while path and path != os.path.dirname(path):
+        node = _read_int(os.path.join(path, 'numa_node'))
+        if node is not None:
+            return node if node >= 0 else None
+        path = os.path.dirname(path)
+    return None
@@ -18,7 +18,7 @@
 Benchmark utility functions.
 """
 
-import subprocess
+from hardware.benchmark import topology
 
 
 def get_value(hw_lst, level1, level2, level3):
@@ -29,19 +29,31 @@ def get_value(hw_lst, level1, level2, level3):
     return None
 
 
-def get_one_cpu_per_socket(hw_lst):
-    """Return a list of physical CPU ids."""
-    logical = get_value(hw_lst, 'cpu', 'logical', 'number')
-    current_phys_package_id = -1
-    cpu_list = []
-    for processor_num in range(int(logical)):
-        cmdline = ("cat /sys/devices/system/cpu/cpu%d/topology"
-                   "/physical_package_id" % int(processor_num))
-        phys_cmd = subprocess.Popen(cmdline,
-                                    shell=True, stdout=subprocess.PIPE)
-        for phys_str in phys_cmd.stdout:
-            phys_id = int(phys_str.strip())
-            if phys_id > current_phys_package_id:
-                current_phys_package_id = phys_id
-                cpu_list.append(current_phys_package_id)
-    return cpu_list
+def get_one_cpu_per_socket(hw_lst, topo=None):
+    """Return one logical CPU number on each physical CPU.
+
+    :param topo: the topology.read_topology() result, read if not given
+    """
+    if topo is None:
+        topo = topology.read_topology()
+    if not topo:
+        # without sysfs, the first CPU is the only known one
+        return [0] if get_value(hw_lst, 'cpu', 'logical', 'number') else []
+    return list(topology.per_socket(topo).values())
+
+
+def get_benchmark_cpus(hw_lst, per_node=False):
+    """Return the logical CPU numbers to run the pinned benchmarks on.
+
+    One CPU per socket, completed by one CPU on each NUMA node when
+    per_node is set and one CPU of each core type on hybrid processors.
+    """
+    topo = topology.read_topology()
+    cpus = list(get_one_cpu_per_socket(hw_lst, topo))
+    extra = list(topology.per_core_type(topo).values())
+    if per_node:
+        extra = list(topology.per_node(topo).values()) + extra
+    for cpu in extra:
+        if cpu not in cpus:
+            cpus.append(cpu)
+    return cpus
@@ -20,17 +20,20 @@ import os
 import pprint
 import sys
 
-from hardware import areca
+from hardware.benchmark import builtin as bm_builtin
 from hardware.benchmark import cpu as bm_cpu
 from hardware.benchmark import disk as bm_disk
+from hardware.benchmark import latency as bm_latency
 from hardware.benchmark import mem as bm_mem
+from hardware.benchmark import numa as bm_numa
+from hardware.benchmark import stats as bm_stats
 from hardware import bios_hp
 from hardware import detect_utils
 from hardware import diskinfo
-from hardware import hpacucli
 from hardware import infiniband as ib
 from hardware import ipmi
-from hardware import megacli
+from hardware import openipmi
+from hardware import raid
 from hardware import rtc
 from hardware import sensors
 from hardware import system
@@ -44,18 +47,117 @@ def parse_args(arguments):
                         help='Print output in human readable format',
                         action='store_true',
                         default=False)
+    parser.add_argument('--no-ipmi-sdr-cache',
+                        help=('Read the whole IPMI SDR instead of the copy '
+                              'kept by the previous runs'),
+                        dest='ipmi_sdr_cache',
+                        action='store_false',
+                        default=True)
+
+    parser.add_argument('--disk-probe',
+                        help=('Measure the read throughput and latency '
+                              'percentiles of each disk with O_DIRECT reads '
+                              'during this number of seconds'),
+                        type=float,
+                        default=None)
+    parser.add_argument('--disk-probe-parallel',
+                        help='Probe all the disks at the same time',
+                        action='store_true',
+                        default=False)
+
+    sampling = parser.add_argument_group('sensors sampling')
+    sampling.add_argument('--sensors-sampling-frequency',
+                          help=('Sample the hwmon sensors during the whole '
+                                'run at this frequency in Hz, and report '
+                                'their min/max/avg values'),
+                          type=float,
+                          default=None)
+    sampling.add_argument('--sensors-sampling-ipmi',
+                          help=('Sample the IPMI sensors too, only their '
+                                'readings are polled once the SDR is read'),
+                          action='store_true',
+                          default=False)
+    sampling.add_argument('--sensors-sampling-size',
+                          help=('Number of samples kept for each sensor '
+                                '(default: 300)'),
+                          type=int,
+                          default=300)
 
     benchmark = parser.add_argument_group('benchmark')
     benchmark.add_argument('--benchmark', '-b',
-                           choices=['cpu', 'mem', 'disk'],
+                           choices=['cpu', 'mem', 'disk', 'numa',
+                                    'latency'],
                            nargs='+',
                            help=('Run benchmark for specific components. '
-                                 'Valid components are: cpu, mem, disk'))
+                                 'Valid components are: cpu, mem, disk, '
+                                 'numa, latency'))
     benchmark.add_argument('--benchmark-disk-destructive',
                            help=('If specified make the disk component '
                                  'benchmark to be destructive'),
                            action='store_true',
                            default=False)
+    benchmark.add_argument('--benchmark-disk-sweep',
+                           help=('Sweep the block sizes and queue depths '
+                                 'of the disks and report their latency '
+                                 'percentiles and saturation knee'),
+                           action='store_true',
+                           default=False)
+    benchmark.add_argument('--benchmark-disk-sweep-report',
+                           help=('Write the full JSON output of fio for '
+                                 'the disk sweep in this file'),
+                           metavar='FILE',
+                           default=None)
+    benchmark.add_argument('--benchmark-cpu-parallel',
+                           help=('Benchmark the CPU sockets concurrently '
+                                 'when they do not interfere with each '
+                                 'other'),
+                           action='store_true',
+                           default=False)
+    benchmark.add_argument('--benchmark-cpu-sweep',
+                           help=('Benchmark every logical CPU within this '
+                                 'time budget in seconds'),
+                           metavar='SECONDS',
+                           type=int,
+                           default=None)
+    benchmark.add_argument('--benchmark-latency-hugepages',
+                           help=('Back the buffers of the latency ladder '
+                                 'with transparent hugepages'),
+                           action='store_true',
+                           default=False)
+    benchmark.add_argument('--benchmark-repetitions',
+                           help=('Run each benchmark this number of times '
+                                 'and report the mean, median, stddev and '
+                                 '95%% confidence interval of its '
+                                 'measurements. With --benchmark-target-'
+                                 'error, the minimum number of runs '
+                                 '(default: 1)'),
+                           metavar='N',
+                           type=int,
+                           default=1)
+    benchmark.add_argument('--benchmark-warmup',
+                           help=('Number of discarded runs before the '
+                                 'repetitions of each benchmark '
+                                 '(default: 0)'),
+                           metavar='N',
+                           type=int,
+                           default=0)
+    benchmark.add_argument('--benchmark-target-error',
+                           help=('Repeat each benchmark, up to %d times, '
+                                 'until the confidence interval of its '
+                                 'measurements is within this percentage '
+                                 'of their mean. The whole benchmark runs '
+                                 'again: a single noisy disk repeats the '
+                                 'disk benchmarks of all the disks'
+                                 % bm_stats.MAX_REPETITIONS),
+                           metavar='PERCENT',
+                           type=float,
+                           default=None)
+    benchmark.add_argument('--benchmark-engine',
+                           choices=['auto', 'sysbench', 'builtin'],
+                           help=('Engine of the cpu and mem benchmarks, '
+                                 'auto uses sysbench when a version older '
+                                 'than 1.0 is installed (default: auto)'),
+                           default='auto')
 
     return parser.parse_args(arguments)
 
@@ -68,10 +170,15 @@ def main():
 
     hrdw = []
 
-    hrdw.extend(areca.detect())
-    hrdw.extend(hpacucli.detect())
-    hrdw.extend(megacli.detect())
-    hrdw.extend(diskinfo.detect())
+    sampler = None
+    if args.sensors_sampling_frequency:
+        sampler = sensors.HwmonSampler(args.sensors_sampling_frequency,
+                                       args.sensors_sampling_size)
+        sampler.start()
+
+    hrdw.extend(raid.detect())
+    hrdw.extend(diskinfo.detect(hrdw, probe_duration=args.disk_probe,
+                                probe_parallel=args.disk_probe_parallel))
 
     system_info = system.detect()
     if not system_info:
@@ -81,20 +188,55 @@ def main():
     hrdw.extend(ipmi.detect())
     hrdw.extend(ib.detect())
     hrdw.extend(sensors.detect_temperatures())
-    hrdw.extend(ipmi.get_ipmi_sdr())
+    hrdw.extend(sensors.detect_hwmon())
+    hrdw.extend(ipmi.get_ipmi_sdr(cache=args.ipmi_sdr_cache))
+    ipmi_sampler = None
+    if args.sensors_sampling_frequency and args.sensors_sampling_ipmi:
+        ipmi_sampler = ipmi.IpmiSampler(
+            args.sensors_sampling_frequency, args.sensors_sampling_size,
+            cache_file=(openipmi.SDR_CACHE_FILE if args.ipmi_sdr_cache
+                        else None))
+        ipmi_sampler.start()
     hrdw.extend(rtc.detect_rtc_clock())
     hrdw.extend(detect_utils.detect_auxv())
     hrdw.extend(detect_utils.parse_dmesg())
     hrdw.extend(bios_hp.dump_hp_bios(hrdw))
 
     if args.benchmark:
+        engine = bm_builtin.select_engine(args.benchmark_engine)
+
+        def run_benchmark(benchmark, **kwargs):
+            bm_stats.run_repeated(hrdw, benchmark, kwargs,
+                                  repetitions=args.benchmark_repetitions,
+                                  warmup=args.benchmark_warmup,
+                                  target_error=args.benchmark_target_error)
+
         if 'cpu' in args.benchmark:
-            bm_cpu.cpu_perf(hrdw)
+            run_benchmark(bm_cpu.cpu_perf,
+                          parallel=args.benchmark_cpu_parallel,
+                          sweep_budget=args.benchmark_cpu_sweep,
+                          engine=engine)
         if 'mem' in args.benchmark:
-            bm_mem.mem_perf(hrdw)
+            run_benchmark(bm_mem.mem_perf, engine=engine)
+        if 'numa' in args.benchmark:
+            run_benchmark(bm_numa.numa_perf)
+        if 'latency' in args.benchmark:
+            run_benchmark(bm_latency.latency_perf,
+                          hugepages=args.benchmark_latency_hugepages)
         if 'disk' in args.benchmark:
-            bm_disk.disk_perf(hrdw,
-                              destructive=args.benchmark_disk_destructive)
+            run_benchmark(bm_disk.disk_perf,
+                          destructive=args.benchmark_disk_destructive)
+            if args.benchmark_disk_sweep:
+                # the report keeps the fio output of every repetition
+                run_benchmark(bm_disk.disk_sweep,
+                              destructive=args.benchmark_disk_destructive,
+                              report_file=args.benchmark_disk_sweep_report,
+                              runs=[])
+
+    for running in (sampler, ipmi_sampler):
+        if running:
+            running.stop()
+            hrdw.extend(running.report())
 
     hrdw = detect_utils.clean_tuples(hrdw)
 
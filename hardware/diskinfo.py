@@ -12,61 +12,174 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from concurrent import futures
+import errno
+import math
+import mmap
 import os
 import re
 import sys
+import time
 
 from hardware import detect_utils
+from hardware import nvme
 from hardware import smart_utils
 
 
+SYS_BLOCK = '/sys/block'
+DEVICE_ATTRS = ('vendor', 'model', 'rev')
+# dm uuid prefixes set by the userspace tools owning the mapping
+DM_UUID_TYPES = (('mpath-', 'multipath'), ('LVM-', 'lvm'),
+                 ('CRYPT-', 'crypt'), ('part', 'partition'))
+
+# Defaults of the native read throughput probe
+PROBE_BLOCK_SIZE = 1024 * 1024
+PROBE_DURATION = 3
+PROBE_ALIGNMENT = 4096
+PROBE_PERCENTILES = (50, 90, 99)
+
+
 def sizeingb(size):
     return int((size * 512) / (1000 * 1000 * 1000))
 
 
-def disksize(name):
-    size = open('/sys/block/' + name + '/size').read(-1)
-    return sizeingb(int(size))
-
-
-def disknames():
-    names = []
-    for name in os.listdir('/sys/block'):
-        if (name[1] == 'd' and name[0] in 'shv') or name.startswith('nvme'):
-            names.append(name)
-    return names
-
-
-def get_disk_info(name, sizes, hw_lst):
-    hw_lst.append(('disk', name, 'size', str(sizes[name])))
-    info_list = ['device/vendor', 'device/model', 'device/rev',
-                 'queue/optimal_io_size', 'queue/physical_block_size',
-                 'queue/rotational', 'queue/nr_requests']
-    for info in info_list:
-        disk_sys_info = '/sys/block/%s/%s' % (name, info)
-        # revision can be explicitly named
-        if not os.path.exists(disk_sys_info) and info == 'device/rev':
-            info = 'device/revision'
-        # for nvme devices we can have a nested device dir
-        if not os.path.exists(disk_sys_info):
-            disk_sys_info = '/sys/block/%s/device/%s' % (name, info)
-        try:
-            with open(disk_sys_info, 'r') as dev:
-                hw_lst.append(('disk', name, info.split('/')[1],
-                               dev.readline().rstrip('\n').strip()))
-        except Exception as exc:
-            sys.stderr.write(
-                'Failed retrieving disk information %s for %s: %s\n' % (
-                    info, name, str(exc)))
+def is_disk_name(name):
+    """Tell if a /sys/block entry is a disk handled by the detection."""
+    return (name[1] == 'd' and name[0] in 'shv') or name.startswith('nvme')
+
+
+def _read_attr(path):
     try:
-        with open('/sys/block/%s/queue/scheduler' % name, 'r') as dev:
-            s_line = dev.readline().rstrip('\n').strip()
-            sched = re.findall(r'\[(.*?)\]', s_line)
+        with open(path, 'r') as attr:
+            return attr.readline().rstrip('\n').strip()
+    except (IOError, OSError):
+        return None
+
+
+def _list_dir(path):
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+
+def _walk_block_device(path, name):
+    info = {'queue': {}, 'device': {}, 'partitions': [], 'holders': [],
+            'slaves': []}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name == 'size':
+                info['size'] = int(_read_attr(entry.path) or 0)
+            elif entry.name == 'queue':
+                with os.scandir(entry.path) as queue:
+                    for attr in queue:
+                        if attr.is_file():
+                            value = _read_attr(attr.path)
+                            if value is not None:
+                                info['queue'][attr.name] = value
+            elif entry.name == 'mq':
+                info['nr_hw_queues'] = len(_list_dir(entry.path))
+            elif entry.name in ('holders', 'slaves'):
+                info[entry.name] = _list_dir(entry.path)
+            elif entry.name == 'device':
+                real_path = os.path.realpath(entry.path)
+                for attr in DEVICE_ATTRS:
+                    value = _read_attr(os.path.join(real_path, attr))
+                    # revision can be explicitly named
+                    if value is None and attr == 'rev':
+                        value = _read_attr(os.path.join(real_path,
+                                                        'revision'))
+                    # for nvme devices we can have a nested device dir
+                    if value is None:
+                        value = _read_attr(os.path.join(real_path, 'device',
+                                                        attr))
+                    if value is not None:
+                        info['device'][attr] = value
+                if name.startswith('nvme'):
+                    info['controller'] = os.path.basename(real_path)
+            elif entry.name == 'dm':
+                info['dm'] = {'name': _read_attr(os.path.join(entry.path,
+                                                              'name')),
+                              'uuid': _read_attr(os.path.join(entry.path,
+                                                              'uuid'))}
+            elif entry.name == 'md':
+                info['md'] = {'level': _read_attr(os.path.join(entry.path,
+                                                               'level')),
+                              'raid_disks': _read_attr(
+                                  os.path.join(entry.path, 'raid_disks'))}
+            elif (entry.name.startswith(name)
+                  and os.path.exists(os.path.join(entry.path,
+                                                  'partition'))):
+                info['partitions'].append(entry.name)
+    info['partitions'].sort()
+    return info
+
+
+def walk_block_devices(root=SYS_BLOCK):
+    """Build the block device tree in a single walk of /sys/block.
+
+    :param root: the sysfs directory listing the block devices
+    :returns: a dict mapping each block device to its queue attributes,
+              device identification, partitions, holders and slaves.
+              dm and md devices get their mapping information and NVMe
+              namespaces the name of their controller.
+    """
+    tree = {}
+    for name in _list_dir(root):
+        try:
+            tree[name] = _walk_block_device(os.path.join(root, name), name)
+        except OSError as exc:
+            sys.stderr.write('Cannot walk block device %s: %s\n' %
+                             (name, exc))
+    return tree
+
+
+def block_device_type(name, info):
+    """Return the kind of a virtual block device (dm, md, multipath...)."""
+    if 'dm' in info:
+        uuid = info['dm'].get('uuid') or ''
+        for prefix, dm_type in DM_UUID_TYPES:
+            if uuid.startswith(prefix):
+                return dm_type
+        return 'dm'
+    if 'md' in info:
+        return 'md'
+    return re.sub(r'\d+$', '', name)
+
+
+def get_block_info(name, info, hw_lst, hw_cls='disk'):
+    """Add the tuning inventory of a block device walked from sysfs."""
+    for attr in DEVICE_ATTRS:
+        if attr in info['device']:
+            hw_lst.append((hw_cls, name, attr, info['device'][attr]))
+    for attr, value in sorted(info['queue'].items()):
+        if attr == 'scheduler':
+            sched = re.findall(r'\[(.*?)\]', value)
             if sched:
-                hw_lst.append(('disk', name, 'scheduler', sched[0]))
-    except Exception as exc:
-        sys.stderr.write('Cannot extract scheduler for disk %s: %s' % (
-            name, exc))
+                hw_lst.append((hw_cls, name, 'scheduler', sched[0]))
+        else:
+            hw_lst.append((hw_cls, name, attr, value))
+    if 'nr_hw_queues' in info:
+        hw_lst.append((hw_cls, name, 'nr_hw_queues',
+                       str(info['nr_hw_queues'])))
+    for key in ('partitions', 'holders', 'slaves'):
+        if info[key]:
+            hw_lst.append((hw_cls, name, key, ' '.join(info[key])))
+    if 'controller' in info:
+        hw_lst.append((hw_cls, name, 'nvme_controller', info['controller']))
+
+
+def get_block_devices_info(tree, hw_lst):
+    """Add the dm, md and multipath devices stacked on top of the disks."""
+    for name, info in sorted(tree.items()):
+        if 'dm' not in info and 'md' not in info:
+            continue
+        hw_lst.append(('block', name, 'type', block_device_type(name, info)))
+        if 'dm' in info and info['dm'].get('name'):
+            hw_lst.append(('block', name, 'dm_name', info['dm']['name']))
+        if 'md' in info and info['md'].get('level'):
+            hw_lst.append(('block', name, 'level', info['md']['level']))
+        get_block_info(name, info, hw_lst, 'block')
 
 
 def get_disk_cache(name, hw_lst):
@@ -112,36 +225,154 @@ def get_disk_id(name, hw_lst):
                 hw_lst.append(('disk', name, id_name, entry))
 
 
-def parse_hdparm_output(output):
-    res = output.split(' = ')
-    if len(res) != 2:
+def percentile(values, percent):
+    """Return the nearest-rank percentile of a sorted list of values."""
+    if not values:
         return 0.0
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def _open_for_probe(path):
+    """Open a device or a file with O_DIRECT when the filesystem allows it.
+
+    Returns the file descriptor and whether reads bypass the page cache.
+    """
     try:
-        mbsec = res[1].split(' ')[-2]
-        return float(mbsec)
-    except (ValueError, KeyError):
-        return 0.0
+        return os.open(path, os.O_RDONLY | os.O_DIRECT), True
+    except OSError as exc:
+        # tmpfs and some FUSE filesystems refuse O_DIRECT
+        if exc.errno != errno.EINVAL:
+            raise
+    return os.open(path, os.O_RDONLY), False
+
 
+def probe_throughput(path, duration=PROBE_DURATION,
+                     block_size=PROBE_BLOCK_SIZE):
+    """Measure the sequential read throughput of a block device or a file.
 
-def diskperfs(names):
-    return dict((name, parse_hdparm_output(
-        detect_utils.cmd('hdparm -t /dev/%s' % name))) for name in names)
+    Reads are issued with O_DIRECT into a page aligned buffer, wrapping
+    around at the end of the device, until duration seconds elapsed.
+    When O_DIRECT is not supported the page cache is dropped with
+    posix_fadvise() before each pass instead.
 
+    :param path: the device or file to read
+    :param duration: the probe duration in seconds
+    :param block_size: the size of each read, a multiple of 4096
+    :returns: a dict with the MB/s, the number of reads and the read
+              latency percentiles in milliseconds
+    """
+    if block_size <= 0 or block_size % PROBE_ALIGNMENT:
+        raise ValueError('block size must be a multiple of %d bytes' %
+                         PROBE_ALIGNMENT)
+
+    fd, direct = _open_for_probe(path)
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+        # small files are read with a single aligned read per pass
+        block_size = min(block_size, size - size % PROBE_ALIGNMENT)
+        if block_size <= 0:
+            raise ValueError('%s is too small to be probed' % path)
+        size = size - size % block_size
+        # anonymous maps are page aligned as O_DIRECT requires
+        buf = mmap.mmap(-1, block_size)
+        latencies = []
+        total = 0
+        offset = 0
+        start = time.perf_counter()
+        deadline = start + duration
+        now = start
+        while now < deadline or not latencies:
+            if offset == 0 and not direct:
+                os.posix_fadvise(fd, 0, size, os.POSIX_FADV_DONTNEED)
+            read = os.preadv(fd, [buf], offset)
+            end = time.perf_counter()
+            latencies.append(end - now)
+            now = end
+            if read <= 0:
+                break
+            total += read
+            offset = (offset + block_size) % size
+        elapsed = now - start
+        buf.close()
+    finally:
+        os.close(fd)
 
-def disksizes(names):
-    return dict((name, disksize(name)) for name in names)
+    latencies.sort()
+    result = {'MBps': (total / elapsed / (1000 * 1000)) if elapsed else 0.0,
+              'reads': len(latencies),
+              'block_size': block_size,
+              'direct': direct,
+              'latency_max_ms': latencies[-1] * 1000}
+    for percent in PROBE_PERCENTILES:
+        result['latency_p%d_ms' % percent] = (
+            percentile(latencies, percent) * 1000)
+    return result
 
 
-def detect():
-    """Detect disks."""
+def probe_disks(names, duration=PROBE_DURATION, block_size=PROBE_BLOCK_SIZE,
+                parallel=False):
+    """Run probe_throughput() on several disks.
+
+    :param names: disk names (sda) or paths (/dev/sda, /tmp/file)
+    :param parallel: probe all the disks at the same time
+    :returns: a dict mapping each name to its probe result, None when
+              the disk cannot be read
+    """
+    def _probe(name):
+        path = name if '/' in name else '/dev/%s' % name
+        try:
+            return probe_throughput(path, duration, block_size)
+        except (OSError, ValueError) as exc:
+            sys.stderr.write('Cannot probe the throughput of %s: %s\n' %
+                             (path, exc))
+            return None
+
+    if parallel and len(names) > 1:
+        with futures.ThreadPoolExecutor(max_workers=len(names)) as executor:
+            return dict(zip(names, executor.map(_probe, names)))
+    return dict((name, _probe(name)) for name in names)
+
+
+def diskperfs(names, hw_lst, duration=PROBE_DURATION, parallel=False):
+    """Report the read throughput and latency percentiles of each disk."""
+    results = probe_disks(names, duration, parallel=parallel)
+    for name in names:
+        result = results[name]
+        if not result:
+            continue
+        hw_lst.append(('disk', name, 'read_MBps', '%.1f' % result['MBps']))
+        for percent in PROBE_PERCENTILES:
+            key = 'latency_p%d_ms' % percent
+            hw_lst.append(('disk', name, 'read_' + key,
+                           '%.3f' % result[key]))
+        hw_lst.append(('disk', name, 'read_latency_max_ms',
+                       '%.3f' % result['latency_max_ms']))
+
+
+def detect(hw_inventory=None, probe_duration=None, probe_parallel=False):
+    """Detect disks.
+
+    :param hw_inventory: the RAID controllers inventory already detected,
+                         used to find the disks behind RAID logical volumes
+    :param probe_duration: measure the read throughput of each disk
+                           during this number of seconds
+    :param probe_parallel: probe all the disks at the same time
+    """
 
     hw_lst = []
-    names = disknames()
-    sizes = disksizes(names)
+    tree = walk_block_devices()
+    sizes = dict((name, sizeingb(info.get('size', 0)))
+                 for name, info in tree.items() if is_disk_name(name))
     disks = [name for name, size in sizes.items() if size > 0]
     hw_lst.append(('disk', 'logical', 'count', str(len(disks))))
+    passthrough = None
+    if detect_utils.which("smartctl"):
+        passthrough = smart_utils.get_passthrough_disks(hw_inventory)
+    get_block_devices_info(tree, hw_lst)
     for name in disks:
-        get_disk_info(name, sizes, hw_lst)
+        hw_lst.append(('disk', name, 'size', str(sizes[name])))
+        get_block_info(name, tree[name], hw_lst)
 
         # nvme devices do not need standard cache mechanisms
         if not name.startswith('nvme'):
@@ -149,15 +380,28 @@ def detect():
 
         get_disk_id(name, hw_lst)
 
+        # nvme health log is read natively through the admin ioctl
+        if (name.startswith('nvme')
+                and nvme.read_nvme_smart(hw_lst, name) is not None):
+            continue
+
         # smartctl support
         # run only if smartctl command is there
         if detect_utils.which("smartctl"):
+            # smartctl >= 7.0 gives everything in a single JSON run
+            if smart_utils.read_smart_json(
+                    hw_lst, "/dev/%s" % name,
+                    passthrough=passthrough) is not None:
+                continue
             if name.startswith('nvme'):
                 sys.stderr.write('Reading SMART for nvme\n')
                 smart_utils.read_smart_nvme(hw_lst, name)
             else:
-                smart_utils.read_smart(hw_lst, "/dev/%s" % name)
+                smart_utils.read_smart(hw_lst, "/dev/%s" % name,
+                                       passthrough=passthrough)
         else:
             sys.stderr.write("Cannot find smartctl, exiting\n")
 
+    if probe_duration:
+        diskperfs(disks, hw_lst, probe_duration, probe_parallel)
     return hw_lst
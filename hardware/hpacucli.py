@@ -21,16 +21,24 @@ import os
 import re
 import sys
 
-import pexpect
+try:
+    import pexpect
+except ImportError:
+    # only needed by the interactive Cli
+    pexpect = None
 
 from hardware import detect_utils
 
 
 ALL_SHOW_REGEXP = re.compile(r'^(.*) in Slot ([0-9]+).*\(sn: (.*)\)', re.M)
+ARRAY_REGEXP = re.compile(r'^array:? (\S+)', re.I)
+CTRL_REGEXP = re.compile(r'^(.*) in Slot ([0-9]+)')
+LOGICAL_DRIVE_REGEXP = re.compile(r'^Logical Drive: (\S+)')
 ERROR_REGEXP = re.compile('Error: (.*)', re.M)
 LOGICAL_REGEXP = re.compile(r'\s*logicaldrive (.*) \((.*), (.*), (.*)\)')
 PHYSICAL_REGEXP = re.compile(r'\s*physicaldrive (.*) \(.*, (.*), (.*), (.*)\)')
 PROMPT_REGEXP = re.compile('=> ')
+CLI_PATHS = ('/usr/sbin/ssacli', '/usr/sbin/hpssacli', '/usr/sbin/hpacucli')
 
 
 class Error(Exception):
@@ -156,6 +164,97 @@ def parse_error(output):
         raise Error(res.group(1))
 
 
+def _indent_tree(output):
+    """Turn an indented output into a list of (line, children) nodes."""
+    root = []
+    stack = [(-1, root)]
+    for line in output.split('\n'):
+        if not line.strip():
+            continue
+        indent = len(line) - len(line.lstrip())
+        node = (line.strip(), [])
+        while stack[-1][0] >= indent:
+            stack.pop()
+        stack[-1][1].append(node)
+        stack.append((indent, node[1]))
+    return root
+
+
+def _flatten(nodes):
+    for line, children in nodes:
+        yield line
+        for child in _flatten(children):
+            yield child
+
+
+def _parse_config_devices(nodes, ctrl, array=None):
+    for line, children in nodes:
+        res = ARRAY_REGEXP.search(line)
+        if res:
+            _parse_config_devices(children, ctrl, res.group(1))
+            continue
+        # one line physicaldrive summaries have no children, their type
+        # is the one 'pd all show' reported
+        if not children:
+            res = PHYSICAL_REGEXP.search(line)
+            if res:
+                ctrl['physical_types'].setdefault(res.group(1),
+                                                  res.group(2))
+            continue
+        if line.startswith('physicaldrive '):
+            disk = line.split()[1]
+            status = {}
+            if array:
+                status['array'] = array
+            for child in _flatten(children):
+                _generic_parsing(child, status, ['port', 'bay', 'box'])
+            ctrl['physical_drives'].append((disk, status))
+            continue
+        res = LOGICAL_DRIVE_REGEXP.search(line)
+        if res:
+            status = {'array': array}
+            for child in _flatten(children):
+                _generic_parsing(child, status, [])
+            ctrl['logical_drives'].append((res.group(1), status))
+            continue
+        _parse_config_devices(children, ctrl, array)
+
+
+def parse_ctrl_all_show_config_detail(output):
+    """Parse the output of the
+
+    'ctrl all show config detail' hpacucli sub-command.
+
+    Returns a list of dicts, one per controller, with the slot, the
+    name, the controller information like parse_ctrl_show(), the
+    (name, information) lists of the logical and physical drives, and
+    the type of each physical drive in its one line summary.
+    """
+    controllers = []
+    for line, children in _indent_tree(output):
+        res = CTRL_REGEXP.search(line)
+        if not res:
+            continue
+        ctrl = {'slot': int(res.group(2)),
+                'name': res.group(1),
+                'info': {},
+                'logical_drives': [],
+                'physical_drives': [],
+                'physical_types': {}}
+        devices = []
+        for child, grandchildren in children:
+            if not grandchildren:
+                _generic_parsing(child, ctrl['info'], ['slot'])
+            elif child.startswith('Sensor ID'):
+                for sensor_line in _flatten([(child, grandchildren)]):
+                    _generic_parsing(sensor_line, ctrl['info'], ['slot'])
+            else:
+                devices.append((child, grandchildren))
+        _parse_config_devices(devices, ctrl)
+        controllers.append(ctrl)
+    return controllers
+
+
 def parse_ctrl_ld_show(output):
     """Parse the output of the
 
@@ -188,6 +287,13 @@ def parse_ctrl_ld_show(output):
     return arr
 
 
+def _cli_path():
+    for path in CLI_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
 class Cli:
     """Cli class.
 
@@ -208,14 +314,8 @@ class Cli:
         # module before to have everything working. So we always load
         # it.
         os.system('modprobe sg')
-        path = None
-        for path2 in ('/usr/sbin/ssacli',
-                      '/usr/sbin/hpssacli',
-                      '/usr/sbin/hpacucli'):
-            if os.path.exists(path2):
-                path = path2
-                break
-        if path:
+        path = _cli_path()
+        if path and pexpect:
             try:
                 if self.debug:
                     print('Launching', path)
@@ -315,8 +415,78 @@ class Cli:
         return info['Disk Name']
 
 
+def _add_disk(hwlist, slot, disk, disk_type, disk_infos):
+    """Add the entries of a physical drive and return its size in GB."""
+    size = 0
+    hwlist.append(('disk', disk, 'type', disk_type))
+    hwlist.append(('disk', disk, 'slot', str(slot)))
+    for disk_info in disk_infos.keys():
+        value = disk_infos[disk_info]
+        if disk_info == 'size':
+            value = detect_utils.size_in_gb(disk_infos[disk_info])
+            size = float(value)
+        hwlist.append(('disk', disk, disk_info, value))
+    return size
+
+
+def detect_config_detail():
+    """Detect HP RAID controller configuration in a single command.
+
+    Returns None if the configuration cannot be read this way.
+    """
+    path = _cli_path()
+    if not path:
+        return None
+    # Like in Cli.launch, the sg module is needed with hpsa
+    os.system('modprobe sg')
+    status, output = detect_utils.cmd('%s ctrl all show config detail' %
+                                      path)
+    hwlist = []
+    try:
+        parse_error(output)
+    except Error as expt:
+        sys.stderr.write('Info: detect_hpa : %s\n' % expt.value)
+        return hwlist
+    controllers = parse_ctrl_all_show_config_detail(output)
+    if status != 0 or not controllers:
+        return None
+
+    disk_count = 0
+    global_pdisk_size = 0
+    hwlist.append(('hpa', 'slots', 'count', str(len(controllers))))
+    for controller in controllers:
+        slot = 'slot_%d' % controller['slot']
+        for controller_info, value in controller['info'].items():
+            hwlist.append(('hpa', slot, controller_info, value))
+        for disk, disk_infos in controller['physical_drives']:
+            disk_count += 1
+            global_pdisk_size += _add_disk(
+                hwlist, controller['slot'], disk,
+                controller['physical_types'].get(
+                    disk, disk_infos.get('interface_type')),
+                disk_infos)
+
+    if global_pdisk_size > 0:
+        hwlist.append(('disk', 'hpa', 'size', '%.2f' % global_pdisk_size))
+
+    hwlist.append(('disk', 'hpa', 'count', str(disk_count)))
+    return hwlist
+
+
 def detect():
-    """Detect HP RAID controller configuration."""
+    """Detect HP RAID controller configuration.
+
+    Use a single 'ctrl all show config detail' command and fall back to
+    an interactive hpacucli session when its output is not usable.
+    """
+    hwlist = detect_config_detail()
+    if hwlist is not None:
+        return hwlist
+    return detect_interactive()
+
+
+def detect_interactive():
+    """Detect HP RAID controller configuration with an hpacucli session."""
     hwlist = []
     disk_count = 0
     try:
@@ -345,19 +515,9 @@ def detect():
             for _, disks in cli.ctrl_pd_all_show(slot):
                 for disk in disks:
                     disk_count += 1
-                    hwlist.append(('disk', disk[0], 'type', disk[1]))
-                    hwlist.append(('disk', disk[0], 'slot',
-                                   str(controller[0])))
-                    disk_infos = cli.ctrl_pd_disk_show(slot, disk[0])
-                    for disk_info in disk_infos.keys():
-                        value = disk_infos[disk_info]
-                        if disk_info == 'size':
-                            value = detect_utils.size_in_gb(
-                                disk_infos[disk_info])
-                            global_pdisk_size = (
-                                global_pdisk_size + float(value))
-                        hwlist.append(('disk', disk[0], disk_info,
-                                       value))
+                    global_pdisk_size += _add_disk(
+                        hwlist, controller[0], disk[0], disk[1],
+                        cli.ctrl_pd_disk_show(slot, disk[0]))
         except Error as expt:
             sys.stderr.write('Info: detect_hpa : controller %d : %s\n'
                              % (controller[0], expt.value))
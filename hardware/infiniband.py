@@ -12,13 +12,45 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-"""Fetch information about Infiniband cards."""
+"""Fetch information about Infiniband cards.
 
-import re
+The inventory is read from /sys/class/infiniband, where ibstat takes it
+from too, so no command is run. The ibstat helpers are kept for the
+callers that still use them.
+"""
+
+import os
 import sys
 
-from hardware import detect_utils
 from hardware.detect_utils import cmd
+from hardware import kvparser
+
+
+GLOBAL_PARSER = kvparser.KVParser(
+    sep=': ', first=True, strip=False, key=str.strip,
+    keymap={'CA type': 'device_type',
+            'Number of ports': 'nb_ports',
+            'Firmware version': 'fw_ver',
+            'Hardware version': 'hw_ver',
+            'Node GUID': 'node_guid',
+            'System image GUID': 'sys_guid'})
+# ibstat has always reported the 'State' line as the physical state too
+PORT_PARSER = kvparser.KVParser(
+    sep=': ', first=True, strip=False, key=str.strip,
+    keymap={'State': ('state', 'physical_state'),
+            'Rate': 'rate',
+            'Base lid': 'base_lid',
+            'LMC': 'lmc',
+            'SM lid': 'sm_lid',
+            'Port GUID': 'port_guid'})
+SYS_CLASS_INFINIBAND = '/sys/class/infiniband'
+
+# numeric port states of sysfs, named as ibstat prints them
+PORT_STATES = {'0': 'Unknown', '1': 'Down', '2': 'Initializing',
+               '3': 'Armed', '4': 'Active'}
+PHYS_STATES = {'0': 'No state change', '1': 'Sleep', '2': 'Polling',
+               '3': 'Disabled', '4': 'PortConfigurationTraining',
+               '5': 'LinkUp', '6': 'LinkErrorRecovery', '7': 'PhyTest'}
 
 
 def ib_card_drv():
@@ -44,25 +76,7 @@ def ib_global_info(card_drv):
     global_card_info = {}
     ret, global_info = cmd('ibstat %s -s' % card_drv)
     if ret == 0:
-        for line in global_info.split('\n'):
-            re_dev = re.search('CA type: (.*)', line)
-            if re_dev is not None:
-                global_card_info['device_type'] = re_dev.group(1)
-            re_nb_ports = re.search('Number of ports: (.*)', line)
-            if re_nb_ports is not None:
-                global_card_info['nb_ports'] = re_nb_ports.group(1)
-            re_fw_ver = re.search('Firmware version: (.*)', line)
-            if re_fw_ver is not None:
-                global_card_info['fw_ver'] = re_fw_ver.group(1)
-            re_hw_ver = re.search('Hardware version: (.*)', line)
-            if re_hw_ver is not None:
-                global_card_info['hw_ver'] = re_hw_ver.group(1)
-            re_node_guid = re.search('Node GUID: (.*)', line)
-            if re_node_guid is not None:
-                global_card_info['node_guid'] = re_node_guid.group(1)
-            re_sys_guid = re.search('System image GUID: (.*)', line)
-            if re_sys_guid is not None:
-                global_card_info['sys_guid'] = re_sys_guid.group(1)
+        GLOBAL_PARSER.parse(global_info, res=global_card_info)
     return global_card_info
 
 
@@ -78,78 +92,167 @@ def ib_port_info(card_drv, port):
     port_infos = {}
     ret, port_desc = cmd('ibstat %s %i' % (card_drv, port))
     if ret == 0:
-        for line in port_desc.split('\n'):
-            re_state = re.search('State: (.*)', line)
-            if re_state is not None:
-                port_infos['state'] = re_state.group(1)
-            re_phy_state = re.search('State: (.*)', line)
-            if re_phy_state is not None:
-                port_infos['physical_state'] = re_phy_state.group(1)
-            re_rate = re.search('Rate: (.*)', line)
-            if re_rate is not None:
-                port_infos['rate'] = re_rate.group(1)
-            re_blid = re.search('Base lid: (.*)', line)
-            if re_blid is not None:
-                port_infos['base_lid'] = re_blid.group(1)
-            re_lmc = re.search('LMC: (.*)', line)
-            if re_lmc is not None:
-                port_infos['lmc'] = re_lmc.group(1)
-            re_smlid = re.search('SM lid: (.*)', line)
-            if re_smlid is not None:
-                port_infos['sm_lid'] = re_smlid.group(1)
-            re_pguid = re.search('Port GUID: (.*)', line)
-            if re_pguid is not None:
-                port_infos['port_guid'] = re_pguid.group(1)
+        PORT_PARSER.parse(port_desc, res=port_infos)
     return port_infos
 
 
-def detect():
-    """Detect Infiniband devices.
+def _read_sysfs(path):
+    try:
+        with open(path, 'r') as sysfs:
+            return sysfs.readline().strip()
+    except IOError:
+        return None
+
+
+def _guid(value):
+    """Convert a sysfs GUID (0002:c903:0056:b9e6) as ibstat prints it."""
+    if not value:
+        return ''
+    return '0x' + value.replace(':', '')
+
+
+def _state(value, names):
+    """Convert a sysfs state (4: ACTIVE) as ibstat prints it."""
+    if not value:
+        return ''
+    number = value.split(':')[0]
+    return names.get(number, value.split(':')[-1].strip())
+
 
-    To detect if an IB device is present, we search for a pci device.
-    This pci device shall be from vendor Mellanox (15b3) from class 0280
-    Class 280 stands for a Network Controller while ethernet device are 0200.
+def _lid(value):
+    """Convert a sysfs lid (0x1a) in decimal as ibstat prints it."""
+    try:
+        return str(int(value, 16))
+    except (TypeError, ValueError):
+        return ''
+
+
+def _port_numbers(card_dir):
+    try:
+        ports = os.listdir(os.path.join(card_dir, 'ports'))
+    except OSError:
+        return []
+    return sorted(int(port) for port in ports if port.isdigit())
+
+
+def _is_infiniband(card_dir, ports):
+    """Tell if a card has an Infiniband port, RoCE cards are skipped."""
+    for port in ports:
+        link_layer = _read_sysfs(os.path.join(card_dir, 'ports', str(port),
+                                              'link_layer'))
+        # old kernels have no link_layer and only Infiniband ports
+        if link_layer is None or link_layer == 'InfiniBand':
+            return True
+    return False
+
+
+def ib_sysfs_global_info(card_dir):
+    """Return the global info of an IB card read from sysfs.
+
+    :param card_dir: the sysfs directory of the card
+    :returns: a dict with the keys of ib_global_info
     """
-    hw_lst = []
-    status, _ = detect_utils.cmd(
-        "lspci -d 15b3: -n|awk '{print $2}'|grep -q '0280'")
-    if status != 0:
-        sys.stderr.write('Info: No Infiniband device found\n')
+    return {'device_type': _read_sysfs(os.path.join(card_dir,
+                                                    'hca_type')) or '',
+            'fw_ver': _read_sysfs(os.path.join(card_dir, 'fw_ver')) or '',
+            'hw_ver': _read_sysfs(os.path.join(card_dir, 'hw_rev')) or '',
+            'node_guid': _guid(_read_sysfs(os.path.join(card_dir,
+                                                        'node_guid'))),
+            'sys_guid': _guid(_read_sysfs(os.path.join(card_dir,
+                                                       'sys_image_guid'))),
+            'nb_ports': str(len(_port_numbers(card_dir)))}
+
+
+def ib_sysfs_port_info(port_dir):
+    """Return the port info of an IB card read from sysfs.
+
+    :param port_dir: the sysfs directory of the port
+    :returns: a dict with the keys of ib_port_info
+    """
+    rate = _read_sysfs(os.path.join(port_dir, 'rate'))
+    # the port GUID is the interface id of the first GID
+    gid = _read_sysfs(os.path.join(port_dir, 'gids', '0'))
+    return {'state': _state(_read_sysfs(os.path.join(port_dir, 'state')),
+                            PORT_STATES),
+            'physical_state': _state(
+                _read_sysfs(os.path.join(port_dir, 'phys_state')),
+                PHYS_STATES),
+            'rate': rate.split()[0] if rate else '',
+            'base_lid': _lid(_read_sysfs(os.path.join(port_dir, 'lid'))),
+            'lmc': _read_sysfs(os.path.join(port_dir,
+                                            'lid_mask_count')) or '',
+            'sm_lid': _lid(_read_sysfs(os.path.join(port_dir, 'sm_lid'))),
+            'port_guid': _guid(':'.join(gid.split(':')[4:])) if gid else ''}
+
+
+def ib_port_counters(port_dir):
+    """Return the port counters of an IB card as a sorted list.
+
+    The port_xmit_data and port_rcv_data counters are in units of 4
+    bytes, as the kernel reports them.
+
+    :param port_dir: the sysfs directory of the port
+    :returns: a list of (counter name, int value)
+    """
+    counters_dir = os.path.join(port_dir, 'counters')
+    try:
+        names = sorted(os.listdir(counters_dir))
+    except OSError:
         return []
+    counters = []
+    for name in names:
+        try:
+            counters.append((name, int(_read_sysfs(
+                os.path.join(counters_dir, name)))))
+        except (TypeError, ValueError):
+            # some counters cannot be read on some adapters
+            continue
+    return counters
+
+
+def detect(sysfs_root=SYS_CLASS_INFINIBAND):
+    """Detect Infiniband devices from sysfs.
 
-    for ib_card in range(len(ib_card_drv())):
-        card_type = ib_card_drv()[ib_card]
-        ib_infos = ib_global_info(card_type)
-        nb_ports = ib_infos['nb_ports']
-        hw_lst.append(('infiniband', 'card%i' % ib_card,
-                       'card_type', card_type))
-        hw_lst.append(('infiniband', 'card%i' % ib_card,
-                       'device_type', ib_infos['device_type']))
-        hw_lst.append(('infiniband', 'card%i' % ib_card,
-                       'fw_version', ib_infos['fw_ver']))
-        hw_lst.append(('infiniband', 'card%i' % ib_card,
-                       'hw_version', ib_infos['hw_ver']))
-        hw_lst.append(('infiniband', 'card%i' % ib_card,
-                       'nb_ports', nb_ports))
-        hw_lst.append(('infiniband', 'card%i' % ib_card,
-                       'sys_guid', ib_infos['sys_guid']))
-        hw_lst.append(('infiniband', 'card%i' % ib_card,
-                       'node_guid', ib_infos['node_guid']))
-        for port in range(1, int(nb_ports) + 1):
-            ib_port_infos = ib_port_info(card_type, port)
-            hw_lst.append(('infiniband', 'card%i_port%i' % (ib_card, port),
-                           'state', ib_port_infos['state']))
-            hw_lst.append(('infiniband', 'card%i_port%i' % (ib_card, port),
-                           'physical_state',
-                           ib_port_infos['physical_state']))
-            hw_lst.append(('infiniband', 'card%i_port%i' % (ib_card, port),
-                           'rate', ib_port_infos['rate']))
-            hw_lst.append(('infiniband', 'card%i_port%i' % (ib_card, port),
-                           'base_lid', ib_port_infos['base_lid']))
-            hw_lst.append(('infiniband', 'card%i_port%i' % (ib_card, port),
-                           'lmc', ib_port_infos['lmc']))
-            hw_lst.append(('infiniband', 'card%i_port%i' % (ib_card, port),
-                           'sm_lid', ib_port_infos['sm_lid']))
-            hw_lst.append(('infiniband', 'card%i_port%i' % (ib_card, port),
-                           'port_guid', ib_port_infos['port_guid']))
+    The cards are numbered in the sorted order of their device names like
+    'ibstat -l' lists them, and cards without Infiniband port are skipped.
+
+    :param sysfs_root: where the infiniband class lives in sysfs
+    """
+    hw_lst = []
+    try:
+        cards = sorted(os.listdir(sysfs_root))
+    except OSError:
+        cards = []
+
+    ib_card = 0
+    for card_type in cards:
+        card_dir = os.path.join(sysfs_root, card_type)
+        ports = _port_numbers(card_dir)
+        if not _is_infiniband(card_dir, ports):
+            continue
+        ib_infos = ib_sysfs_global_info(card_dir)
+        card = 'card%i' % ib_card
+        hw_lst.append(('infiniband', card, 'card_type', card_type))
+        for key, name in (('device_type', 'device_type'),
+                          ('fw_ver', 'fw_version'),
+                          ('hw_ver', 'hw_version'),
+                          ('nb_ports', 'nb_ports'),
+                          ('sys_guid', 'sys_guid'),
+                          ('node_guid', 'node_guid')):
+            hw_lst.append(('infiniband', card, name, ib_infos[key]))
+        for port in ports:
+            port_dir = os.path.join(card_dir, 'ports', str(port))
+            ib_port_infos = ib_sysfs_port_info(port_dir)
+            card_port = '%s_port%i' % (card, port)
+            for key in ('state', 'physical_state', 'rate', 'base_lid', 'lmc',
+                        'sm_lid', 'port_guid'):
+                hw_lst.append(('infiniband', card_port, key,
+                               ib_port_infos[key]))
+            for name, value in ib_port_counters(port_dir):
+                hw_lst.append(('infiniband', card_port, 'counter/%s' % name,
+                               value))
+        ib_card += 1
+
+    if not hw_lst:
+        sys.stderr.write('Info: No Infiniband device found\n')
     return hw_lst
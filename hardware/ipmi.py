@@ -14,15 +14,38 @@
 
 """Set of functions to manage IPMI."""
 
+import json
 import os
-import re
+import shlex
 import subprocess
 import sys
 
 from hardware import detect_utils
+from hardware import kvparser
+from hardware import openipmi
+from hardware import sensors as hw_sensors
 
 
-LINE_REGEXP = re.compile(r'^([^:]+[^ ])\s*:\s*(.*[^ ])\s*$')
+def _lan_key(key):
+    # a key is at least two characters long and the lines without a
+    # value are ignored, as ipmitool prints continuation lines like
+    # "                        : User     : MD2 MD5"
+    if len(key) < 2:
+        return None
+    return '-'.join([s.lower() for s in key.split(' ')])
+
+
+LAN_PARSER = kvparser.KVParser(first=True, strip=False, key=_lan_key,
+                               value=lambda value: value.rstrip(' ') or None)
+# keys of 'ipmitool mc info' and 'ipmitool sdr info' which change with
+# the content of the SDR repository
+SDR_STAMP_PARSER = kvparser.KVParser(
+    first=True, keymap={'Firmware Revision': 'firmware',
+                        'Record Count': 'count',
+                        'Most recent Addition': 'addition',
+                        'Most recent Erase': 'erase'})
+
+SDR_DUMP_FILE = '/var/cache/hardware/ipmitool_sdr.dump'
 
 
 # NOTE(elfosardo): this function is not used anywhere, but we leave it
@@ -81,12 +104,8 @@ def setup_network(channel, ipv4, netmask, gateway, vlan_id=-1):
 
 def parse_lan_info(output, lst):
     """Parse the output of ipmi lan info and turns add it to the hw list."""
-    for line in output.split('\n'):
-        res = LINE_REGEXP.search(line)
-        if res:
-            lst.append(('ipmi', 'lan',
-                        '-'.join([s.lower() for s in res.group(1).split(' ')]),
-                        res.group(2)))
+    for key, value in LAN_PARSER.items(output):
+        lst.append(('ipmi', 'lan', key, value))
     return lst
 
 
@@ -115,7 +134,193 @@ def parse_ipmi_sdr(output):
     return hrdw
 
 
-def get_ipmi_sdr():
+def parse_sensor_reading(output):
+    """Parse the output of ipmitool sensor reading into a dict."""
+    readings = {}
+    for line in output.split('\n'):
+        items = line.split('|')
+        if len(items) == 2 and items[1].strip():
+            readings[items[0].strip()] = items[1].strip()
+    return readings
+
+
+def get_sdr_stamp():
+    """Return what identifies the SDR repository content, or None.
+
+    The dumped SDR is still valid as long as the BMC firmware and the
+    timestamps of the repository are the same.
+    """
+    stamp = {}
+    for command in ('ipmitool mc info', 'ipmitool sdr info'):
+        status, output = detect_utils.cmd(command)
+        if status != 0:
+            return None
+        SDR_STAMP_PARSER.parse(output, res=stamp)
+    return stamp
+
+
+def _load_sdr_index(dump_file):
+    try:
+        with open(dump_file + '.json') as index:
+            return json.load(index)
+    except (IOError, ValueError):
+        return None
+
+
+def _save_sdr_index(dump_file, index):
+    try:
+        with open(dump_file + '.json', 'w') as index_file:
+            json.dump(index, index_file)
+    except IOError as exc:
+        sys.stderr.write('Info: cannot write the SDR index: %s\n' % exc)
+
+
+def get_ipmi_sdr_cached(dump_file=SDR_DUMP_FILE):
+    """Read the sensors with ipmitool from a local copy of the SDR.
+
+    The SDR is dumped with 'ipmitool sdr dump' and read back with '-S',
+    so it is only downloaded from the BMC when its stamp changes. The
+    sensors found are saved next to the dump for refresh_ipmi_sdr().
+
+    Returns None if the SDR cannot be dumped.
+    """
+    stamp = get_sdr_stamp()
+    if stamp is None:
+        return None
+    index = _load_sdr_index(dump_file)
+    if (not index or index.get('stamp') != stamp
+            or not os.path.exists(dump_file)):
+        cache_dir = os.path.dirname(dump_file)
+        if cache_dir and not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                return None
+        sys.stderr.write('Info: dumping the IPMI SDR to %s\n' % dump_file)
+        status, _ = detect_utils.cmd('ipmitool sdr dump %s' %
+                                     shlex.quote(dump_file))
+        if status != 0:
+            return None
+
+    hrdw = parse_ipmi_sdr(detect_utils.output_lines(
+        'ipmitool -S %s sdr' % shlex.quote(dump_file)))
+    sensors = []
+    units = {}
+    for _, name, key, value in hrdw:
+        if key == 'value':
+            sensors.append(name)
+        else:
+            units[name] = value
+    _save_sdr_index(dump_file, {'stamp': stamp, 'sensors': sensors,
+                                'units': units})
+    return hrdw
+
+
+def refresh_ipmi_sdr(dump_file=SDR_DUMP_FILE):
+    """Read again the sensors found by the last get_ipmi_sdr_cached().
+
+    Only the sensor readings are queried, without reading the SDR nor
+    checking its stamp, which makes it suitable for frequent polling.
+
+    Returns None if no sensor is known yet.
+    """
+    index = _load_sdr_index(dump_file)
+    if not index or not index.get('sensors') or not os.path.exists(
+            dump_file):
+        return None
+    _, output = detect_utils.cmd(
+        'ipmitool -S %s sensor reading %s' %
+        (shlex.quote(dump_file),
+         ' '.join(shlex.quote(name) for name in index['sensors'])))
+    readings = parse_sensor_reading(output)
+    hrdw = []
+    for name in index['sensors']:
+        hrdw.append(('ipmi', name, 'value',
+                     readings.get(name, 'Not Readable')))
+        if name in readings and name in index['units']:
+            hrdw.append(('ipmi', name, 'unit', index['units'][name]))
+    return hrdw
+
+
+def get_ipmi_sdr_native(cache_file=openipmi.SDR_CACHE_FILE):
+    """Read the sensors through the OpenIPMI device.
+
+    Returns None if the device cannot be used.
+    """
+    try:
+        with openipmi.OpenIPMI() as transport:
+            sensors = openipmi.get_sensors(transport, cache_file)
+            return openipmi.read_sensors(transport, sensors)
+    except (openipmi.IPMIError, IOError, OSError) as exc:
+        sys.stderr.write('Info: native IPMI SDR reading failed: %s\n' % exc)
+        return None
+
+
+class IpmiSampler(hw_sensors.Sampler):
+    """Sample the numeric readings of the IPMI sensors.
+
+    Only the readings of the sensors already known are polled, through
+    the OpenIPMI device with the sensors of its SDR cache, or else with
+    refresh_ipmi_sdr() and the SDR dump of get_ipmi_sdr_cached().
+    """
+
+    hw_class = 'ipmi'
+
+    def __init__(self, frequency=1.0, size=300,
+                 cache_file=openipmi.SDR_CACHE_FILE, dump_file=SDR_DUMP_FILE):
+        super(IpmiSampler, self).__init__(frequency, size)
+        self.dump_file = dump_file
+        self.transport = None
+        self.sensors = None
+        if openipmi.find_device():
+            try:
+                self.transport = openipmi.OpenIPMI()
+                self.sensors = openipmi.get_sensors(self.transport,
+                                                    cache_file)
+            except (openipmi.IPMIError, IOError, OSError) as exc:
+                sys.stderr.write('Info: native IPMI sampling failed: %s\n' %
+                                 exc)
+                self.close()
+
+    def read(self):
+        if self.transport:
+            try:
+                hrdw = openipmi.read_sensors(self.transport, self.sensors)
+            except (openipmi.IPMIError, IOError, OSError):
+                hrdw = None
+        else:
+            hrdw = refresh_ipmi_sdr(self.dump_file)
+        values = []
+        for _, name, key, value in hrdw or []:
+            if key != 'value':
+                continue
+            try:
+                values.append((name, key, float(value)))
+            except ValueError:
+                # discrete states and unreadable sensors
+                continue
+        return values
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+
+def get_ipmi_sdr(cache=True):
+    """Read the IPMI sensors.
+
+    :param cache: reuse the SDR read by the previous runs while the BMC
+                  reports the same firmware and SDR timestamps
+    """
+    hrdw = get_ipmi_sdr_native(openipmi.SDR_CACHE_FILE if cache else None)
+    if hrdw is not None:
+        return hrdw
+    if cache:
+        hrdw = get_ipmi_sdr_cached()
+        if hrdw is not None:
+            return hrdw
+
     ipmi_cmd = subprocess.Popen("ipmitool -I open sdr",
                                 shell=True,
                                 stdout=subprocess.PIPE,
@@ -124,6 +329,26 @@ def get_ipmi_sdr():
     return parse_ipmi_sdr(ipmi_cmd.stdout)
 
 
+def detect_native():
+    """Read the LAN channel and its settings through the OpenIPMI device.
+
+    Returns None if the device cannot be used.
+    """
+    hw_lst = []
+    try:
+        with openipmi.OpenIPMI() as transport:
+            channel = openipmi.find_lan_channel(transport)
+            if channel is None:
+                return hw_lst
+            hw_lst.append(('system', 'ipmi', 'channel', '%s' % channel))
+            for key, value in openipmi.get_lan_info(transport, channel):
+                hw_lst.append(('ipmi', 'lan', key, value))
+    except (openipmi.IPMIError, IOError, OSError) as exc:
+        sys.stderr.write('Info: native IPMI detection failed: %s\n' % exc)
+        return None
+    return hw_lst
+
+
 def detect():
     """Detect IPMI interfaces."""
 
@@ -132,9 +357,11 @@ def detect():
     detect_utils.modprobe("ipmi_smb")
     detect_utils.modprobe("ipmi_si")
     detect_utils.modprobe("ipmi_devintf")
-    if (os.path.exists('/dev/ipmi0')
-            or os.path.exists('/dev/ipmi/0')
-            or os.path.exists('/dev/ipmidev/0')):
+    if openipmi.find_device():
+        native_lst = detect_native()
+        if native_lst is not None:
+            return native_lst
+
         for channel in range(0, 16):
             status, _ = detect_utils.cmd(
                 'ipmitool channel info %d 2>&1 | grep -sq Volatile' % channel)
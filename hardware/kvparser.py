@@ -0,0 +1,160 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Single pass parser for the "key : value" output of vendor tools.
+
+Each tool builds one KVParser at import time with its rules (separator,
+key normalization, units, sections...). All the regexps are compiled
+once and every line of an output is split at most once.
+"""
+
+import re
+
+
+def title_key(key):
+    """Normalize 'Serial No' into 'SerialNo'."""
+    return key.title().replace(' ', '')
+
+
+class KVParser(object):
+    """Rule table to turn a tool output into keys and values.
+
+    :param sep: a compiled regexp, or a plain string separator
+    :param first: split on the first separator only instead of ignoring
+                  the lines with several separators
+    :param strip: strip the lines before splitting them
+    :param key: function normalizing the keys, lines are ignored when
+                it returns None
+    :param value: function normalizing the values, lines are ignored
+                  when it returns None
+    :param skip: regexp of the raw keys whose lines are dropped
+    :param keymap: normalized keys renamed to one name or to a tuple of
+                   names, the other keys are dropped
+    :param units: unit suffixes split from the values into '<key>/unit',
+                  none of them may end another one
+    :param section: (regexp, function) where the regexp matches the raw
+                    keys starting a section, and the function returns
+                    the prefix of the next keys from the match object
+    :param int_values: convert the values to int when possible
+    :param strip_dot: remove a trailing dot from the values
+    """
+
+    def __init__(self, sep=re.compile(r'\s*:\s*'), first=False, strip=True,
+                 key=None, value=None, skip=None, keymap=None,
+                 units=(), section=None, int_values=False, strip_dot=False):
+        if isinstance(sep, str):
+            self.literal = sep
+            self.maxsplit = 1 if first else -1
+        else:
+            self.literal = None
+            self.regexp = sep
+            self.maxsplit = 1 if first else 0
+        self.strip = strip
+        self.key = key
+        # the normalized keys are cached as tools repeat the same keys
+        self.keys = {}
+        self.value = value
+        self.skip = re.compile(skip) if isinstance(skip, str) else skip
+        self.keymap = keymap
+        self.units = None
+        if units:
+            # the units are alternatives of one regexp, and a quick check
+            # on the last character avoids most of the searches
+            self.units = re.compile('^(.*)(%s)$' % '|'.join(
+                [re.escape(unit) for unit in units]))
+            self.unit_ends = frozenset([unit[-1] for unit in units])
+        self.section = section
+        self.int_values = int_values
+        self.strip_dot = strip_dot
+
+    def items(self, output, reverse=False):
+        """Parse an output and return the list of (key, value) tuples.
+
+        :param output: the text to parse
+        :param reverse: parse the lines from the last one
+        """
+        lines = output.split('\n')
+        if reverse:
+            lines.reverse()
+        res = []
+        prefix = ''
+        for line in lines:
+            if self.strip:
+                line = line.strip()
+            if self.literal:
+                if self.literal not in line:
+                    continue
+                parts = line.split(self.literal, self.maxsplit)
+            else:
+                parts = self.regexp.split(line, self.maxsplit)
+            if len(parts) != 2:
+                continue
+            key, value = parts
+
+            if self.skip and self.skip.search(key):
+                continue
+            if self.section:
+                match = self.section[0].search(key)
+                if match:
+                    prefix = self.section[1](match)
+                    continue
+                key = prefix + key
+
+            if self.value:
+                value = self.value(value)
+                if value is None:
+                    continue
+            if self.strip_dot and len(value) > 1 and value[-1] == '.':
+                value = value[:-1]
+            unit = None
+            if self.units and value and value[-1] in self.unit_ends:
+                match = self.units.search(value)
+                if match:
+                    value = match.group(1).replace(' ', '')
+                    unit = match.group(2).replace(' ', '')
+            if self.key:
+                if key not in self.keys:
+                    self.keys[key] = self.key(key)
+                key = self.keys[key]
+                if key is None:
+                    continue
+            if self.int_values:
+                try:
+                    value = int(value)
+                except ValueError:
+                    pass
+
+            if self.keymap is not None:
+                names = self.keymap.get(key)
+                if names is None:
+                    continue
+                if isinstance(names, tuple):
+                    for name in names:
+                        res.append((name, value))
+                    continue
+                key = names
+            res.append((key, value))
+            if unit:
+                res.append(('%s/unit' % key, unit))
+        return res
+
+    def parse(self, output, reverse=False, res=None):
+        """Parse an output into a dict, the last value of a key wins.
+
+        :param output: the text to parse
+        :param reverse: parse the lines from the last one
+        :param res: an existing dict to complete
+        """
+        if res is None:
+            res = {}
+        res.update(self.items(output, reverse))
+        return res
@@ -14,6 +14,7 @@
 
 """Wrapper functions around the megacli command."""
 
+import functools
 import os
 import re
 from subprocess import PIPE
@@ -21,9 +22,19 @@ from subprocess import Popen
 import sys
 
 from hardware import detect_utils
+from hardware import kvparser
 
 
 SEP_REGEXP = re.compile(r'\s*:\s*')
+PARSER = kvparser.KVParser(sep=SEP_REGEXP, key=kvparser.title_key,
+                           int_values=True, strip_dot=True)
+MEGACLI_NAMES = ["megacli", "MegaCli", "MegaCli64"]
+
+# Section headers of the commands run on all the adapters at once
+ADAPTER_SEP = r'^\s*Adapter #?(\d+)'
+ENC_ADAPTER_SEP = r'Number of enclosures on adapter (\d+)'
+PD_SEP = r'^\s*Enclosure Device ID\s*:\s*(\S+)'
+LD_SEP = r'^\s*Virtual Drive\s*:\s*(\d+)'
 
 
 def which(cmd, mode=os.F_OK | os.X_OK, path=None):
@@ -90,17 +101,7 @@ def search_exec(possible_names):
 
 def parse_output(output):
     """Parse the output of the megacli command into an associative array."""
-    res = {}
-    for line in output.split('\n'):
-        lis = re.split(SEP_REGEXP, line.strip())
-        if len(lis) == 2:
-            if len(lis[1]) > 1 and lis[1][-1] == '.':
-                lis[1] = lis[1][:-1]
-            try:
-                res[lis[0].title().replace(' ', '')] = int(lis[1])
-            except ValueError:
-                res[lis[0].title().replace(' ', '')] = lis[1]
-    return res
+    return PARSER.parse(output)
 
 
 def split_parts(sep, output):
@@ -122,9 +123,32 @@ def split_parts(sep, output):
     return arr
 
 
+def split_sections(sep, output):
+    """Split the output string on the lines matching the regexp sep.
+
+    Returns a list of (key, text) tuples where key is the first group
+    of sep. The lines before the first match are dropped.
+    """
+    regexp = re.compile(sep)
+    sections = []
+    for line in output.split('\n'):
+        res = regexp.search(line)
+        if res:
+            sections.append((res.group(1), [line]))
+        elif sections:
+            sections[-1][1].append(line)
+    return [(key, '\n'.join(lines)) for key, lines in sections]
+
+
+@functools.lru_cache(maxsize=None)
+def megacli_path():
+    """Return the path of the megacli binary, looked up only once."""
+    return search_exec(MEGACLI_NAMES)
+
+
 def run_megacli(*args):
     """Run the megacli command in a subprocess and return the output."""
-    prog_exec = search_exec(["megacli", "MegaCli", "MegaCli64"])
+    prog_exec = megacli_path()
     if prog_exec:
         cmd = prog_exec + ' - ' + ' '.join(args)
         proc = Popen(cmd, shell=True, stdout=PIPE, universal_newlines=True)
@@ -153,13 +177,26 @@ def adp_count():
 
 def adp_all_info(ctrl):
     """Get adaptater info."""
-    arr = run_and_parse('adpallinfo -a%d' % ctrl)
+    return _split_adp_lists(run_and_parse('adpallinfo -a%d' % ctrl))
+
+
+def _split_adp_lists(arr):
     for key in ('RaidLevelSupported', 'SupportedDrives'):
         if key in arr:
             arr[key] = arr[key].split(', ')
     return arr
 
 
+def adp_all_info_all():
+    """Get the info of all the adapters in one megacli call.
+
+    Returns a dict indexed by adapter number.
+    """
+    return dict((int(ctrl), _split_adp_lists(parse_output(text)))
+                for ctrl, text in split_sections(
+                    ADAPTER_SEP, run_megacli('adpallinfo -aALL')))
+
+
 def pd_get_num(ctrl):
     """Get the number of physical drives on a controller."""
     try:
@@ -171,8 +208,11 @@ def pd_get_num(ctrl):
 
 def enc_info(ctrl):
     """Get enclosing info on a controller."""
-    parts = split_parts(' +Enclosure [0-9]+:',
-                        run_megacli('EncInfo -a%d' % ctrl))
+    return _parse_enclosures(run_megacli('EncInfo -a%d' % ctrl))
+
+
+def _parse_enclosures(output):
+    parts = split_parts(' +Enclosure [0-9]+:', output)
     all_ = list(map(parse_output, parts))
     for entry in all_:
         for key in entry.keys():
@@ -183,11 +223,35 @@ def enc_info(ctrl):
     return all_
 
 
+def enc_info_all():
+    """Get enclosing info of all the controllers in one megacli call.
+
+    Returns a dict of enclosure lists indexed by adapter number.
+    """
+    return dict((int(ctrl), _parse_enclosures(text))
+                for ctrl, text in split_sections(
+                    ENC_ADAPTER_SEP, run_megacli('EncInfo -aALL'))
+                if re.search(' +Enclosure [0-9]+:', text))
+
+
 def pdinfo(ctrl, encl, disk):
     """Get info about a physical drive on an enclosure and a controller."""
     return run_and_parse('pdinfo -PhysDrv[%d:%d] -a%d' % (encl, disk, ctrl))
 
 
+def pd_list():
+    """Get info about all the physical drives in one megacli call.
+
+    Returns a dict of physical drive lists indexed by adapter number.
+    """
+    pdisks = {}
+    for ctrl, text in split_sections(ADAPTER_SEP,
+                                     run_megacli('PDList -aALL')):
+        pdisks[int(ctrl)] = [parse_output(part)
+                             for _, part in split_sections(PD_SEP, text)]
+    return pdisks
+
+
 def ld_get_num(ctrl):
     """Get the number of logical drives on a controller."""
     try:
@@ -202,8 +266,156 @@ def ld_get_info(ctrl, ldrv):
     return run_and_parse('LDInfo -L%d -a%d' % (ldrv, ctrl))
 
 
-def detect():
-    """Detect LSI MegaRAID controller configuration."""
+def ld_info_all():
+    """Get info about all the logical drives in one megacli call.
+
+    Returns a dict of (logical drive number, info) lists indexed by
+    adapter number.
+    """
+    ldisks = {}
+    for ctrl, text in split_sections(ADAPTER_SEP,
+                                     run_megacli('LDInfo -Lall -aALL')):
+        header = text.split('\n')[0]
+        ldisks[int(ctrl)] = []
+        for ldrv, part in split_sections(LD_SEP, text):
+            # keep the adapter header to get the same keys as ld_get_info
+            info = parse_output(header + '\n' + part)
+            info.pop('ExitCode', None)
+            ldisks[int(ctrl)].append((int(ldrv), info))
+    return ldisks
+
+
+def add_controller(hw_lst, ctrl, ctrl_info):
+    for entry in ctrl_info.keys():
+        hw_lst.append(('megaraid', 'Controller_%d' % ctrl, '%s' % entry,
+                       '%s' % ctrl_info[entry]))
+
+
+def add_enclosure(hw_lst, ctrl, enc):
+    for key in enc.keys():
+        ignore_list = ["ExitCode", "Enclosure"]
+        if key in ignore_list:
+            continue
+        hw_lst.append(('megaraid',
+                       'Controller_%d/Enclosure_%s' %
+                       (ctrl, enc["Enclosure"]),
+                       '%s' % key, '%s' % enc[key]))
+
+
+def add_pdisk(hw_lst, ctrl, slot_num, info):
+    """Add the tuples of a physical drive and return its size in GB.
+
+    :param ctrl: the index of the adapter of the drive
+    """
+    disk = 'disk%d' % slot_num
+    hw_lst.append(('pdisk', disk, 'ctrl', str(ctrl)))
+    hw_lst.append(('pdisk', disk, 'type', info['PdType']))
+    hw_lst.append(('pdisk', disk, 'id',
+                   '%s:%d' % (info['EnclosureDeviceId'], slot_num)))
+    disk_size = detect_utils.size_in_gb(
+        "%s %s" % (info['CoercedSize'].split()[0],
+                   info['CoercedSize'].split()[1]))
+    hw_lst.append(('pdisk', disk, 'size', disk_size))
+
+    for key in info.keys():
+        ignore_list = ['PdType', 'EnclosureDeviceId',
+                       'CoercedSize', 'ExitCode']
+        if key not in ignore_list:
+            if "DriveTemperature" in key:
+                if "C" in str(info[key].split()[0]):
+                    pdisk = info[key].split()[0].split("C")[0]
+                    hw_lst.append(('pdisk', disk, key,
+                                   str(pdisk).strip()))
+                    hw_lst.append(('pdisk', disk,
+                                   "%s_units" % key,
+                                   "Celsius"))
+                else:
+                    hw_lst.append(('pdisk', disk, key,
+                                   str(info[key]).strip()))
+            elif "InquiryData" in key:
+                count = 0
+                for mystring in info[key].split():
+                    hw_lst.append(('pdisk', disk,
+                                   "%s[%d]" % (key, count),
+                                   str(mystring.strip())))
+                    count = count + 1
+            else:
+                hw_lst.append(('pdisk', disk, key,
+                               str(info[key]).strip()))
+    return float(disk_size)
+
+
+def add_ldisk(hw_lst, ld_num, info):
+    disk = 'disk%d' % ld_num
+    ignore_list = ['Size']
+
+    for item in info.keys():
+        if item not in ignore_list:
+            hw_lst.append(('ldisk', disk, item,
+                           str(info[item])))
+    if 'Size' in info:
+        hw_lst.append(('ldisk', disk, 'Size',
+                       detect_utils.size_in_gb(info['Size'])))
+
+
+def detect_batched():
+    """Detect LSI MegaRAID controller configuration.
+
+    Same output as detect_per_device() but megacli is only called once
+    per kind of object (adapters, enclosures, physical and logical
+    drives) for all the adapters.
+    """
+    hw_lst = []
+    adapters = adp_all_info_all()
+    if not adapters:
+        return hw_lst
+
+    enclosures = enc_info_all()
+    pdisks = pd_list()
+    ldisks = ld_info_all()
+    disk_count = 0
+    global_pdisk_size = 0
+
+    for ctrl in sorted(adapters):
+        add_controller(hw_lst, ctrl, adapters[ctrl])
+
+        for enc in enclosures.get(ctrl, []):
+            if "Enclosure" in enc.keys():
+                add_enclosure(hw_lst, ctrl, enc)
+
+            infos = [info for info in pdisks.get(ctrl, [])
+                     if info.get('EnclosureDeviceId') == enc.get('DeviceId')]
+            for info in sorted(infos, key=lambda info: info['SlotNumber']):
+                # If no PdType, it means that's not a disk
+                if 'PdType' not in info.keys():
+                    continue
+
+                disk_count += 1
+                global_pdisk_size += add_pdisk(hw_lst, ctrl,
+                                               info['SlotNumber'], info)
+            if global_pdisk_size > 0:
+                hw_lst.append(('pdisk', 'all', 'size',
+                               "%.2f" % global_pdisk_size))
+
+        for ld_num, info in ldisks.get(ctrl, []):
+            add_ldisk(hw_lst, ld_num, info)
+    hw_lst.append(('disk', 'megaraid', 'count', str(disk_count)))
+    return hw_lst
+
+
+def detect(batched=True):
+    """Detect LSI MegaRAID controller configuration.
+
+    :param batched: query all the adapters at once instead of running
+                    megacli for every slot and logical drive
+    """
+    if batched:
+        return detect_batched()
+    return detect_per_device()
+
+
+def detect_per_device():
+    """Detect LSI MegaRAID controller configuration, one call per device."""
     hw_lst = []
     ctrl_num = adp_count()
     if ctrl_num == 0:
@@ -213,24 +425,13 @@ def detect():
     global_pdisk_size = 0
 
     for ctrl in range(ctrl_num):
-        ctrl_info = adp_all_info(ctrl)
-        for entry in ctrl_info.keys():
-            hw_lst.append(('megaraid', 'Controller_%d' % ctrl, '%s' % entry,
-                           '%s' % ctrl_info[entry]))
+        add_controller(hw_lst, ctrl, adp_all_info(ctrl))
 
         for enc in enc_info(ctrl):
             if "Enclosure" in enc.keys():
-                for key in enc.keys():
-                    ignore_list = ["ExitCode", "Enclosure"]
-                    if key in ignore_list:
-                        continue
-                    hw_lst.append(('megaraid',
-                                   'Controller_%d/Enclosure_%s' %
-                                   (ctrl, enc["Enclosure"]),
-                                   '%s' % key, '%s' % enc[key]))
+                add_enclosure(hw_lst, ctrl, enc)
 
             for slot_num in range(enc['NumberOfSlots']):
-                disk = 'disk%d' % slot_num
                 info = pdinfo(ctrl, enc['DeviceId'], slot_num)
 
                 # If no PdType, it means that's not a disk
@@ -238,56 +439,11 @@ def detect():
                     continue
 
                 disk_count += 1
-                hw_lst.append(('pdisk', disk, 'ctrl', str(ctrl_num)))
-                hw_lst.append(('pdisk', disk, 'type', info['PdType']))
-                hw_lst.append(('pdisk', disk, 'id',
-                               '%s:%d' % (info['EnclosureDeviceId'],
-                                          slot_num)))
-                disk_size = detect_utils.size_in_gb(
-                    "%s %s" % (info['CoercedSize'].split()[0],
-                               info['CoercedSize'].split()[1]))
-                global_pdisk_size = global_pdisk_size + float(disk_size)
-                hw_lst.append(('pdisk', disk, 'size', disk_size))
-
-                for key in info.keys():
-                    ignore_list = ['PdType', 'EnclosureDeviceId',
-                                   'CoercedSize', 'ExitCode']
-                    if key not in ignore_list:
-                        if "DriveTemperature" in key:
-                            if "C" in str(info[key].split()[0]):
-                                pdisk = info[key].split()[0].split("C")[0]
-                                hw_lst.append(('pdisk', disk, key,
-                                               str(pdisk).strip()))
-                                hw_lst.append(('pdisk', disk,
-                                               "%s_units" % key,
-                                               "Celsius"))
-                            else:
-                                hw_lst.append(('pdisk', disk, key,
-                                               str(info[key]).strip()))
-                        elif "InquiryData" in key:
-                            count = 0
-                            for mystring in info[key].split():
-                                hw_lst.append(('pdisk', disk,
-                                               "%s[%d]" % (key, count),
-                                               str(mystring.strip())))
-                                count = count + 1
-                        else:
-                            hw_lst.append(('pdisk', disk, key,
-                                           str(info[key]).strip()))
+                global_pdisk_size += add_pdisk(hw_lst, ctrl, slot_num, info)
             if global_pdisk_size > 0:
                 hw_lst.append(('pdisk', 'all', 'size',
                                "%.2f" % global_pdisk_size))
             for ld_num in range(ld_get_num(ctrl)):
-                disk = 'disk%d' % ld_num
-                info = ld_get_info(ctrl, ld_num)
-                ignore_list = ['Size']
-
-                for item in info.keys():
-                    if item not in ignore_list:
-                        hw_lst.append(('ldisk', disk, item,
-                                       str(info[item])))
-                if 'Size' in info:
-                    hw_lst.append(('ldisk', disk, 'Size',
-                                   detect_utils.size_in_gb(info['Size'])))
+                add_ldisk(hw_lst, ld_num, ld_get_info(ctrl, ld_num))
     hw_lst.append(('disk', 'megaraid', 'count', str(disk_count)))
     return hw_lst
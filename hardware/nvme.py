@@ -0,0 +1,220 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Read NVMe health information natively, without forking smartctl.
+
+Identify strings come from /sys/class/nvme/<ctrl>/ and the SMART/Health
+log page is fetched with the NVME_IOCTL_ADMIN_CMD ioctl.
+"""
+
+import ctypes
+import fcntl
+import os
+import struct
+import sys
+
+
+SYS_CLASS_NVME = '/sys/class/nvme'
+
+NVME_ADMIN_GET_LOG_PAGE = 0x02
+NVME_ADMIN_IDENTIFY = 0x06
+NVME_IDENTIFY_CNS_CTRL = 0x01
+NVME_LOG_SMART = 0x02
+NVME_NSID_ALL = 0xffffffff
+NVME_IDENTIFY_SIZE = 4096
+NVME_LOG_SMART_SIZE = 512
+
+# struct nvme_admin_cmd from linux/nvme_ioctl.h
+ADMIN_CMD_FORMAT = '=BBHIIIQQIIIIIIIIII'
+# _IOWR('N', 0x41, struct nvme_admin_cmd)
+NVME_IOCTL_ADMIN_CMD = ((3 << 30) | (struct.calcsize(ADMIN_CMD_FORMAT) << 16)
+                        | (ord('N') << 8) | 0x41)
+
+# SMART / Health Information log page (Log Identifier 02h)
+SMART_LOG_FORMAT = '<BHBBBB25x' + '16s' * 10 + 'II'
+SMART_LOG_COUNTERS = ['data_units_read', 'data_units_written',
+                      'host_reads', 'host_writes', 'controller_busy_time',
+                      'power_cycles', 'power_on_hours', 'unsafe_shutdowns',
+                      'media_errors', 'num_err_log_entries']
+
+# Identify Controller data structure offsets
+IDENTIFY_STRINGS = {'serial_number': (4, 20),
+                    'model_number': (24, 40),
+                    'firmware_version': (64, 8)}
+IDENTIFY_WCTEMP = 266
+IDENTIFY_CCTEMP = 268
+IDENTIFY_TNVMCAP = 280
+
+KELVIN = 273
+
+
+def _le_int(data):
+    return int.from_bytes(data, 'little')
+
+
+def format_capacity(size):
+    """Format a capacity in bytes like smartctl does (256 GB, 1.92 TB)."""
+    value = float(size)
+    units = ['B', 'kB', 'MB', 'GB', 'TB', 'PB']
+    unit = 0
+    while value >= 1000 and unit < len(units) - 1:
+        value /= 1000
+        unit += 1
+    if value >= 100:
+        human = '%.0f' % value
+    elif value >= 10:
+        human = '%.1f' % value
+    else:
+        human = '%.2f' % value
+    return '{:,} [{} {}]'.format(size, human, units[unit])
+
+
+def parse_smart_log(data):
+    """Decode a raw SMART / Health Information log page.
+
+    :param data: the 512 bytes of the log page
+    :returns: a dict of the log fields, temperatures in Celsius
+    """
+    fields = struct.unpack_from(SMART_LOG_FORMAT, data)
+    log = {'critical_warning': fields[0],
+           'temperature': fields[1] - KELVIN,
+           'available_spare': fields[2],
+           'available_spare_threshold': fields[3],
+           'percentage_used': fields[4],
+           'endurance_critical_warning': fields[5],
+           'warning_temp_time': fields[-2],
+           'critical_comp_time': fields[-1]}
+    for name, value in zip(SMART_LOG_COUNTERS, fields[6:-2]):
+        log[name] = _le_int(value)
+    return log
+
+
+def parse_identify_ctrl(data):
+    """Decode the fields of an Identify Controller data structure.
+
+    :param data: the 4096 bytes returned by the Identify command
+    :returns: a dict of the decoded fields, temperatures in Celsius
+    """
+    ident = {}
+    for name, (offset, length) in IDENTIFY_STRINGS.items():
+        ident[name] = data[offset:offset + length].decode(
+            'ascii', 'ignore').strip(' \0')
+    for name, offset in (('warning_temp_threshold', IDENTIFY_WCTEMP),
+                         ('critical_temp_threshold', IDENTIFY_CCTEMP)):
+        kelvin = struct.unpack_from('<H', data, offset)[0]
+        if kelvin:
+            ident[name] = kelvin - KELVIN
+    ident['total_nvm_capacity'] = _le_int(
+        data[IDENTIFY_TNVMCAP:IDENTIFY_TNVMCAP + 16])
+    return ident
+
+
+def admin_command(fd, opcode, nsid, cdw10, size):
+    """Send an admin command and return the data buffer it filled."""
+    buf = ctypes.create_string_buffer(size)
+    cmd = bytearray(struct.pack(ADMIN_CMD_FORMAT, opcode, 0, 0, nsid, 0, 0,
+                                0, ctypes.addressof(buf), 0, size,
+                                cdw10, 0, 0, 0, 0, 0, 0, 0))
+    status = fcntl.ioctl(fd, NVME_IOCTL_ADMIN_CMD, cmd)
+    if status != 0:
+        raise IOError('NVMe admin command 0x%02x failed with status 0x%x' %
+                      (opcode, status))
+    return buf.raw
+
+
+def get_smart_log(fd):
+    """Fetch the controller wide SMART / Health Information log page."""
+    numd = NVME_LOG_SMART_SIZE // 4 - 1
+    return admin_command(fd, NVME_ADMIN_GET_LOG_PAGE, NVME_NSID_ALL,
+                         (numd << 16) | NVME_LOG_SMART, NVME_LOG_SMART_SIZE)
+
+
+def get_identify_ctrl(fd):
+    """Fetch the Identify Controller data structure."""
+    return admin_command(fd, NVME_ADMIN_IDENTIFY, 0, NVME_IDENTIFY_CNS_CTRL,
+                         NVME_IDENTIFY_SIZE)
+
+
+def controller_name(device_name):
+    """Return the controller of a namespace (nvme0n1 -> nvme0)."""
+    device_path = '/sys/block/%s/device' % device_name
+    if os.path.exists(device_path):
+        return os.path.basename(os.path.realpath(device_path))
+    return device_name
+
+
+def _read_sysfs(path):
+    try:
+        with open(path, 'r') as sysfs:
+            return sysfs.readline().strip()
+    except IOError:
+        return None
+
+
+def read_nvme_smart(hwlst, device_name, sysfs_root=SYS_CLASS_NVME):
+    """Read NVMe health information into the same keys as smartctl.
+
+    :param hwlst: the hardware list to complete
+    :param device_name: a controller or namespace name (e.g. nvme0n1)
+    :param sysfs_root: where the nvme class lives in sysfs
+    :returns: hwlst, or None if the health log cannot be read natively
+    """
+    ctrl = controller_name(device_name)
+    sysfs_dir = os.path.join(sysfs_root, ctrl)
+    try:
+        fd = os.open('/dev/%s' % ctrl, os.O_RDONLY)
+        try:
+            smart_log = parse_smart_log(get_smart_log(fd))
+            try:
+                ident = parse_identify_ctrl(get_identify_ctrl(fd))
+            except IOError as exc:
+                sys.stderr.write('read_nvme_smart: no identify data for '
+                                 '%s: %s\n' % (ctrl, exc))
+                ident = {}
+        finally:
+            os.close(fd)
+    except (IOError, OSError) as exc:
+        sys.stderr.write('read_nvme_smart: cannot read the health log of '
+                         '%s: %s\n' % (ctrl, exc))
+        return None
+
+    for title, attr in (('model_number', 'model'),
+                        ('serial_number', 'serial'),
+                        ('firmware_version', 'firmware_rev')):
+        value = _read_sysfs(os.path.join(sysfs_dir, attr)) or ident.get(title)
+        if value:
+            hwlst.append(('disk', device_name, 'SMART/%s' % title, value))
+
+    if ident.get('total_nvm_capacity'):
+        hwlst.append(('disk', device_name, 'SMART/total_nvm_capacity',
+                      format_capacity(ident['total_nvm_capacity'])))
+    for title in ('warning_temp_threshold', 'critical_temp_threshold'):
+        if title in ident:
+            hwlst.append(('disk', device_name, 'SMART/%s' % title,
+                          str(ident[title])))
+            hwlst.append(('disk', device_name, 'SMART/%s_unit' % title,
+                          'Celsius'))
+
+    hwlst.append(('disk', device_name, 'SMART/critical_warning',
+                  '0x%02x' % smart_log['critical_warning']))
+    hwlst.append(('disk', device_name, 'SMART/temperature',
+                  str(smart_log['temperature'])))
+    hwlst.append(('disk', device_name, 'SMART/temperature_unit', 'Celsius'))
+    for title, key in (('power_cycles', 'power_cycles'),
+                       ('power_on_hours', 'power_on_hours'),
+                       ('unsafe_shutdowns', 'unsafe_shutdowns'),
+                       ('media_data_integrity_errors', 'media_errors'),
+                       ('error_information_log_entries',
+                        'num_err_log_entries')):
+        hwlst.append(('disk', device_name, 'SMART/%s' % title,
+                      str(smart_log[key])))
+    return hwlst
@@ -0,0 +1,512 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Talk to the BMC in process through the OpenIPMI device driver.
+
+Commands are sent with the IPMICTL_SEND_COMMAND ioctl of /dev/ipmi0 and
+the responses are read with IPMICTL_RECEIVE_MSG_TRUNC. The functions
+accept any transport with a command(netfn, cmd, data, lun) method, so
+they can be used against a simulated BMC.
+
+The SDR repository is only downloaded when its timestamps change, the
+decoded sensors are cached in a JSON file in between.
+"""
+
+import ctypes
+import fcntl
+import json
+import os
+import select
+import struct
+import sys
+
+
+IPMI_DEVICES = ('/dev/ipmi0', '/dev/ipmi/0', '/dev/ipmidev/0')
+SDR_CACHE_FILE = '/var/cache/hardware/ipmi_sdr.json'
+
+# linux/ipmi.h
+IPMI_SYSTEM_INTERFACE_ADDR_TYPE = 0x0c
+IPMI_BMC_CHANNEL = 0x0f
+IPMI_RESPONSE_RECV_TYPE = 1
+IPMI_MAX_ADDR_SIZE = 32
+IPMI_MAX_MSG_LENGTH = 272
+
+NETFN_SENSOR = 0x04
+NETFN_APP = 0x06
+NETFN_STORAGE = 0x0a
+NETFN_TRANSPORT = 0x0c
+
+CMD_GET_SENSOR_READING = 0x2d
+CMD_GET_CHANNEL_INFO = 0x42
+CMD_GET_LAN_CONFIG = 0x02
+CMD_GET_SDR_REPOSITORY_INFO = 0x20
+CMD_RESERVE_SDR_REPOSITORY = 0x22
+CMD_GET_SDR = 0x23
+
+CC_OK = 0x00
+CC_RESERVATION_CANCELLED = 0xc5
+CC_CANNOT_RETURN_BYTES = 0xca
+CC_PARAMETER_NOT_SUPPORTED = 0x80
+
+CHANNEL_MEDIUM_LAN = 0x04
+BMC_SLAVE_ADDRESS = 0x20
+SDR_LAST_RECORD = 0xffff
+SDR_HEADER_SIZE = 5
+# small reads are the only ones every BMC accepts
+SDR_CHUNK_SIZE = 16
+SDR_FULL_SENSOR = 0x01
+SDR_COMPACT_SENSOR = 0x02
+THRESHOLD_READING_TYPE = 0x01
+ANALOG_NONE = 3
+
+READING_UNAVAILABLE = 0x20
+SCANNING_ENABLED = 0x40
+
+# IPMI 2.0 table 43-15, sensor unit type codes
+UNITS = ['unspecified', 'degrees C', 'degrees F', 'degrees K', 'Volts',
+         'Amps', 'Watts', 'Joules', 'Coulombs', 'VA', 'Nits', 'lumen',
+         'lux', 'Candela', 'kPa', 'PSI', 'Newton', 'CFM', 'RPM', 'Hz',
+         'microsecond', 'millisecond', 'second', 'minute', 'hour', 'day',
+         'week', 'mil', 'inches', 'feet', 'cu in', 'cu feet', 'mm', 'cm',
+         'm', 'cu cm', 'cu m', 'liters', 'fluid ounce', 'radians',
+         'steradians', 'revolutions', 'cycles', 'gravities', 'ounce',
+         'pound', 'ft-lb', 'oz-in', 'gauss', 'gilberts', 'henry',
+         'millihenry', 'farad', 'microfarad', 'ohms', 'siemens', 'mole',
+         'becquerel', 'PPM', 'reserved', 'Decibels', 'DbA', 'DbC', 'gray',
+         'sievert', 'color temp deg K', 'bit', 'kilobit', 'megabit',
+         'gigabit', 'byte', 'kilobyte', 'megabyte', 'gigabyte', 'word',
+         'dword', 'qword', 'line', 'hit', 'miss', 'retry', 'reset',
+         'overrun / overflow', 'underrun', 'collision', 'packets',
+         'messages', 'characters', 'error', 'correctable error',
+         'uncorrectable error', 'fatal error', 'grams']
+
+LAN_SET_IN_PROGRESS = {0: 'Set Complete', 1: 'Set In Progress',
+                       2: 'Commit Write', 3: 'Reserved'}
+LAN_IP_SOURCES = {0: 'Unspecified', 1: 'Static Address',
+                  2: 'DHCP Address', 3: 'BIOS Assigned Address',
+                  4: 'Other'}
+
+
+class IPMIError(Exception):
+    """Exception raised when a command fails or gets no response."""
+
+    def __init__(self, value, completion_code=None):
+        super(IPMIError, self).__init__(value)
+        self.value = value
+        self.completion_code = completion_code
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class IpmiSystemInterfaceAddr(ctypes.Structure):
+    _fields_ = [('addr_type', ctypes.c_int),
+                ('channel', ctypes.c_short),
+                ('lun', ctypes.c_ubyte)]
+
+
+class IpmiMsg(ctypes.Structure):
+    _fields_ = [('netfn', ctypes.c_ubyte),
+                ('cmd', ctypes.c_ubyte),
+                ('data_len', ctypes.c_ushort),
+                ('data', ctypes.POINTER(ctypes.c_ubyte))]
+
+
+class IpmiReq(ctypes.Structure):
+    _fields_ = [('addr', ctypes.c_void_p),
+                ('addr_len', ctypes.c_uint),
+                ('msgid', ctypes.c_long),
+                ('msg', IpmiMsg)]
+
+
+class IpmiRecv(ctypes.Structure):
+    _fields_ = [('recv_type', ctypes.c_int),
+                ('addr', ctypes.c_void_p),
+                ('addr_len', ctypes.c_uint),
+                ('msgid', ctypes.c_long),
+                ('msg', IpmiMsg)]
+
+
+def _ioc(direction, number, size):
+    return (direction << 30) | (size << 16) | (ord('i') << 8) | number
+
+
+# _IOWR('i', 11, struct ipmi_recv) and _IOR('i', 13, struct ipmi_req)
+IPMICTL_RECEIVE_MSG_TRUNC = _ioc(3, 11, ctypes.sizeof(IpmiRecv))
+IPMICTL_SEND_COMMAND = _ioc(2, 13, ctypes.sizeof(IpmiReq))
+
+
+class OpenIPMI(object):
+    """Transport sending commands to the local BMC through /dev/ipmiX."""
+
+    def __init__(self, device=None, timeout=5):
+        if device is None:
+            device = find_device()
+        if device is None:
+            raise IPMIError('no IPMI device found')
+        self.fd = os.open(device, os.O_RDWR)
+        self.timeout = timeout
+        self.msgid = 0
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def command(self, netfn, cmd, data=b'', lun=0):
+        """Send a command to the BMC and return the response data.
+
+        :returns: the response bytes after the completion code
+        :raises: IPMIError if the completion code is not zero
+        """
+        self.msgid += 1
+        addr = IpmiSystemInterfaceAddr(IPMI_SYSTEM_INTERFACE_ADDR_TYPE,
+                                       IPMI_BMC_CHANNEL, lun)
+        req_data = (ctypes.c_ubyte * max(len(data), 1)).from_buffer_copy(
+            bytes(data) or b'\0')
+        req = IpmiReq(ctypes.addressof(addr), ctypes.sizeof(addr),
+                      self.msgid, IpmiMsg(netfn, cmd, len(data), req_data))
+        fcntl.ioctl(self.fd, IPMICTL_SEND_COMMAND, req)
+
+        while True:
+            readable = select.select([self.fd], [], [], self.timeout)[0]
+            if not readable:
+                raise IPMIError('timeout on command 0x%02x/0x%02x' %
+                                (netfn, cmd))
+            recv_addr = ctypes.create_string_buffer(IPMI_MAX_ADDR_SIZE + 8)
+            recv_data = (ctypes.c_ubyte * IPMI_MAX_MSG_LENGTH)()
+            recv = IpmiRecv(0, ctypes.addressof(recv_addr),
+                            ctypes.sizeof(recv_addr), 0,
+                            IpmiMsg(0, 0, IPMI_MAX_MSG_LENGTH, recv_data))
+            fcntl.ioctl(self.fd, IPMICTL_RECEIVE_MSG_TRUNC, recv)
+            # events and late responses to timed out commands are dropped
+            if (recv.recv_type == IPMI_RESPONSE_RECV_TYPE
+                    and recv.msgid == self.msgid):
+                break
+
+        response = bytes(recv_data[:recv.msg.data_len])
+        if not response or response[0] != CC_OK:
+            completion_code = response[0] if response else None
+            raise IPMIError('command 0x%02x/0x%02x failed with code %s' %
+                            (netfn, cmd, completion_code), completion_code)
+        return response[1:]
+
+
+def check_length(data, length, what):
+    """Raise IPMIError if a response or a record is too short."""
+    if len(data) < length:
+        raise IPMIError('%s too short: %d bytes instead of %d' %
+                        (what, len(data), length))
+
+
+def find_device():
+    """Return the path of the OpenIPMI device, or None."""
+    for device in IPMI_DEVICES:
+        if os.path.exists(device):
+            return device
+    return None
+
+
+def get_channel_info(transport, channel):
+    """Return (channel medium type, session support) of a channel."""
+    response = transport.command(NETFN_APP, CMD_GET_CHANNEL_INFO,
+                                 bytes([channel]))
+    check_length(response, 4, 'channel info')
+    return response[1] & 0x7f, response[3] >> 6
+
+
+def find_lan_channel(transport):
+    """Return the number of the first LAN channel, or None."""
+    for channel in range(0, 16):
+        try:
+            medium, _ = get_channel_info(transport, channel)
+        except IPMIError:
+            continue
+        if medium == CHANNEL_MEDIUM_LAN:
+            return channel
+    return None
+
+
+def get_lan_config(transport, channel, parameter):
+    """Return the data of a LAN configuration parameter, or None."""
+    try:
+        response = transport.command(NETFN_TRANSPORT, CMD_GET_LAN_CONFIG,
+                                     bytes([channel, parameter, 0, 0]))
+    except IPMIError as exc:
+        if exc.completion_code == CC_PARAMETER_NOT_SUPPORTED:
+            return None
+        raise
+    # the first byte is the parameter revision
+    return response[1:]
+
+
+def _ip(data):
+    check_length(data, 4, 'IP address')
+    return '.'.join(str(byte) for byte in data[:4])
+
+
+def _mac(data):
+    check_length(data, 6, 'MAC address')
+    return ':'.join('%02x' % byte for byte in data[:6])
+
+
+def _vlan_id(data):
+    check_length(data, 2, 'VLAN ID')
+    if not data[1] & 0x80:
+        return 'Disabled'
+    return str(data[0] | (data[1] & 0x0f) << 8)
+
+
+# (parameter, ipmitool key, decoder) in the order of 'ipmitool lan print'
+LAN_PARAMETERS = [
+    (0, 'set-in-progress', lambda data: LAN_SET_IN_PROGRESS[data[0] & 3]),
+    (4, 'ip-address-source',
+     lambda data: LAN_IP_SOURCES.get(data[0] & 0x0f, 'Other')),
+    (3, 'ip-address', _ip),
+    (6, 'subnet-mask', _ip),
+    (5, 'mac-address', _mac),
+    (12, 'default-gateway-ip', _ip),
+    (13, 'default-gateway-mac', _mac),
+    (14, 'backup-gateway-ip', _ip),
+    (15, 'backup-gateway-mac', _mac),
+    (20, '802.1q-vlan-id', _vlan_id),
+    (21, '802.1q-vlan-priority', lambda data: str(data[0] & 0x07)),
+]
+
+
+def get_lan_info(transport, channel):
+    """Return the LAN settings of a channel like 'ipmitool lan print'.
+
+    :returns: a list of (key, value) with the keys of ipmi.parse_lan_info
+    """
+    info = []
+    for parameter, key, decode in LAN_PARAMETERS:
+        data = get_lan_config(transport, channel, parameter)
+        if data:
+            info.append((key, decode(data)))
+    return info
+
+
+def get_sdr_repository_info(transport):
+    """Return the state of the SDR repository.
+
+    :returns: a dict with the record count and the last addition and
+              erase timestamps, which change with the repository content
+    """
+    response = transport.command(NETFN_STORAGE, CMD_GET_SDR_REPOSITORY_INFO)
+    check_length(response, 13, 'SDR repository info')
+    count, _, addition, erase = struct.unpack_from('<HHII', response, 1)
+    return {'count': count, 'addition': addition, 'erase': erase}
+
+
+def reserve_sdr_repository(transport):
+    response = transport.command(NETFN_STORAGE, CMD_RESERVE_SDR_REPOSITORY)
+    check_length(response, 2, 'SDR reservation')
+    return struct.unpack_from('<H', response)[0]
+
+
+def _get_sdr_part(transport, reservation, record_id, offset, size):
+    response = transport.command(
+        NETFN_STORAGE, CMD_GET_SDR,
+        struct.pack('<HHBB', reservation, record_id, offset, size))
+    check_length(response, 2, 'SDR part')
+    return struct.unpack_from('<H', response)[0], response[2:]
+
+
+def get_sdr(transport, reservation, record_id):
+    """Read one SDR record in small parts.
+
+    :returns: (next record id, record bytes)
+    """
+    next_id, record = _get_sdr_part(transport, reservation, record_id, 0,
+                                    SDR_HEADER_SIZE)
+    check_length(record, SDR_HEADER_SIZE, 'SDR header')
+    length = SDR_HEADER_SIZE + record[4]
+    while len(record) < length:
+        size = min(SDR_CHUNK_SIZE, length - len(record))
+        _, part = _get_sdr_part(transport, reservation, record_id,
+                                len(record), size)
+        if not part:
+            raise IPMIError('empty SDR part for record %d' % record_id)
+        record += part
+    return next_id, record[:length]
+
+
+def read_sdr_repository(transport, retries=3):
+    """Download all the records of the SDR repository.
+
+    The reading restarts with a new reservation when the BMC cancels the
+    current one, which happens when the repository is modified.
+    """
+    for _ in range(retries):
+        reservation = reserve_sdr_repository(transport)
+        records = []
+        record_id = 0
+        try:
+            while record_id != SDR_LAST_RECORD:
+                record_id, record = get_sdr(transport, reservation,
+                                            record_id)
+                records.append(record)
+        except IPMIError as exc:
+            if exc.completion_code != CC_RESERVATION_CANCELLED:
+                raise
+            continue
+        return records
+    raise IPMIError('SDR reservation cancelled %d times' % retries)
+
+
+def _twos_complement(value, bits):
+    if value & (1 << (bits - 1)):
+        return value - (1 << bits)
+    return value
+
+
+def parse_sdr_record(record):
+    """Decode a full or compact sensor record.
+
+    :returns: a dict describing the sensor, or None for other records
+    :raises: IPMIError if the record is too short for its type
+    """
+    check_length(record, SDR_HEADER_SIZE, 'SDR record')
+    record_type = record[3]
+    if record_type not in (SDR_FULL_SENSOR, SDR_COMPACT_SENSOR):
+        return None
+    id_offset = 47 if record_type == SDR_FULL_SENSOR else 31
+    check_length(record, id_offset + 1, 'SDR sensor record')
+    id_length = record[id_offset] & 0x1f
+    name = record[id_offset + 1:id_offset + 1 + id_length]
+    sensor = {'name': name.decode('ascii', 'ignore').strip(' \0'),
+              'owner': record[5],
+              'lun': record[6] & 0x03,
+              'number': record[7],
+              'reading_type': record[13],
+              'analog': ANALOG_NONE,
+              'percentage': bool(record[20] & 0x01),
+              'unit': record[21]}
+    if (record_type == SDR_FULL_SENSOR
+            and sensor['reading_type'] == THRESHOLD_READING_TYPE):
+        sensor.update({
+            'analog': record[20] >> 6,
+            'm': _twos_complement(record[24] | (record[25] & 0xc0) << 2, 10),
+            'b': _twos_complement(record[26] | (record[27] & 0xc0) << 2, 10),
+            'r_exp': _twos_complement(record[29] >> 4, 4),
+            'b_exp': _twos_complement(record[29] & 0x0f, 4)})
+    return sensor
+
+
+def convert_reading(sensor, raw):
+    """Convert a raw analog reading with the sensor factors.
+
+    Only the linear conversion is applied.
+    """
+    if sensor['analog'] == 1:
+        raw = _twos_complement(raw, 8)
+        if raw < 0:
+            raw += 1
+    elif sensor['analog'] == 2:
+        raw = _twos_complement(raw, 8)
+    return ((sensor['m'] * raw + sensor['b'] * 10 ** sensor['b_exp'])
+            * 10 ** sensor['r_exp'])
+
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file) as cache:
+            return json.load(cache)
+    except (IOError, ValueError):
+        return None
+
+
+def _save_cache(cache_file, content):
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(cache_file, 'w') as cache:
+            json.dump(content, cache)
+    except (IOError, OSError) as exc:
+        sys.stderr.write('Info: cannot write the SDR cache %s: %s\n' %
+                         (cache_file, exc))
+
+
+def get_sensors(transport, cache_file=SDR_CACHE_FILE):
+    """Return the sensors of the SDR repository, cached between runs.
+
+    The cache is keyed by the record count and the timestamps of the
+    repository, so it is only downloaded again when it changes.
+
+    :param cache_file: the JSON cache, None to disable it
+    """
+    repository = get_sdr_repository_info(transport)
+    if cache_file:
+        cache = _load_cache(cache_file)
+        if cache and cache.get('repository') == repository:
+            return cache['sensors']
+
+    sensors = [sensor for sensor in
+               (parse_sdr_record(record)
+                for record in read_sdr_repository(transport))
+               if sensor]
+    if cache_file:
+        _save_cache(cache_file, {'repository': repository,
+                                 'sensors': sensors})
+    return sensors
+
+
+def _format_value(value):
+    # ipmitool prints the integral values without decimals
+    if value == int(value):
+        return '%d' % value
+    return '%.2f' % value
+
+
+def read_sensors(transport, sensors):
+    """Read the sensors like 'ipmitool sdr' and return the hw tuples.
+
+    Only the sensors owned by the BMC are read, the others would need
+    bridged requests.
+    """
+    hw_lst = []
+    for sensor in sensors:
+        if sensor['owner'] != BMC_SLAVE_ADDRESS:
+            continue
+        name = sensor['name']
+        try:
+            response = transport.command(NETFN_SENSOR,
+                                         CMD_GET_SENSOR_READING,
+                                         bytes([sensor['number']]),
+                                         lun=sensor['lun'])
+        except IPMIError:
+            hw_lst.append(('ipmi', name, 'value', 'Not Readable'))
+            continue
+        if len(response) < 2 or response[1] & READING_UNAVAILABLE:
+            hw_lst.append(('ipmi', name, 'value', 'Not Readable'))
+        elif not response[1] & SCANNING_ENABLED:
+            hw_lst.append(('ipmi', name, 'value', 'disabled'))
+        elif sensor['analog'] == ANALOG_NONE:
+            state = response[2] if len(response) > 2 else 0
+            hw_lst.append(('ipmi', name, 'value', '0x%02x' % state))
+        else:
+            hw_lst.append(('ipmi', name, 'value', _format_value(
+                convert_reading(sensor, response[0]))))
+            if sensor['percentage']:
+                unit = 'percent'
+            elif sensor['unit'] < len(UNITS):
+                unit = UNITS[sensor['unit']]
+            else:
+                unit = 'unknown'
+            hw_lst.append(('ipmi', name, 'unit', unit))
+    return hw_lst
@@ -0,0 +1,214 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Common entry point for the RAID controller backends.
+
+The vendor tools are only run when a matching storage controller is
+present on the PCI bus, and the backends are run in parallel. Next to
+the legacy entries of each backend, the physical and logical drives are
+reported with normalized names:
+
+('raid_pdisk', '<backend>:<id>', <field>, <value>)
+('raid_ldisk', '<backend>:<id>', <field>, <value>)
+"""
+
+from concurrent import futures
+import os
+import re
+import sys
+
+from hardware import areca
+from hardware import hpacucli
+from hardware import storcli
+
+
+SYS_PCI_DEVICES = '/sys/bus/pci/devices'
+PCI_CLASS_STORAGE = 0x01
+
+# (backend name, PCI vendor ids, module with a detect() function)
+BACKENDS = [('areca', (0x17d3,), areca),
+            ('hpa', (0x103c, 0x9005), hpacucli),
+            ('megaraid', (0x1000,), storcli)]
+
+# Legacy keys of each backend mapped to the normalized fields
+PDISK_FIELDS = {
+    'areca': {'DeviceType': 'interface',
+              'DeviceLocation': 'location',
+              'ModelName': 'model',
+              'SerialNumber': 'serial',
+              'FirmwareRev.': 'firmware',
+              'DiskCapacity': 'size',
+              'DeviceState': 'state',
+              'DeviceTemperature': 'temperature',
+              'MediaErrorCount': 'media_errors'},
+    'hpa': {'type': 'interface',
+            'model': 'model',
+            'serial_number': 'serial',
+            'firmware_revision': 'firmware',
+            'size': 'size',
+            'status': 'state',
+            'current_temperature_c': 'temperature',
+            'array': 'array'},
+    'megaraid': {'type': 'interface',
+                 'size': 'size',
+                 'InquiryData[0]': 'vendor',
+                 'InquiryData[1]': 'model',
+                 'DeviceFirmwareLevel': 'firmware',
+                 'FirmwareState': 'state',
+                 'MediaType': 'media',
+                 'DriveTemperature': 'temperature',
+                 'Wwn': 'wwn',
+                 'MediaErrorCount': 'media_errors',
+                 'PredictiveFailureCount': 'predictive_failures'},
+}
+LDISK_FIELDS = {
+    'megaraid': {'Name': 'name',
+                 'RaidLevel': 'raid_level',
+                 'Size': 'size',
+                 'State': 'state'},
+}
+
+ARECA_DISK_REGEXP = re.compile(r'^disk(\d+)$')
+MEGARAID_CTRL_REGEXP = re.compile(r'^Controller_(\d+)$')
+
+
+def pci_storage_vendors(sysfs_root=SYS_PCI_DEVICES):
+    """Return the PCI vendor ids of the mass storage controllers.
+
+    Returns None if the PCI devices cannot be listed.
+    """
+    try:
+        devices = os.listdir(sysfs_root)
+    except OSError:
+        return None
+    vendors = set()
+    for device in devices:
+        try:
+            with open(os.path.join(sysfs_root, device, 'class')) as pci:
+                pci_class = int(pci.read().strip(), 16)
+            with open(os.path.join(sysfs_root, device, 'vendor')) as pci:
+                vendor = int(pci.read().strip(), 16)
+        except (IOError, ValueError):
+            continue
+        if pci_class >> 16 == PCI_CLASS_STORAGE:
+            vendors.add(vendor)
+    return vendors
+
+
+def _areca_drives(hw_lst):
+    for hw_class, item, key, value in hw_lst:
+        res = ARECA_DISK_REGEXP.search(item)
+        if hw_class == 'areca' and res:
+            yield 'raid_pdisk', '0/%s' % res.group(1), '0', key, value
+
+
+def _hpa_drives(hw_lst):
+    slots = dict((item, value) for hw_class, item, key, value in hw_lst
+                 if hw_class == 'disk' and key == 'slot')
+    for hw_class, item, key, value in hw_lst:
+        if hw_class == 'disk' and item in slots:
+            yield ('raid_pdisk', '%s/%s' % (slots[item], item), slots[item],
+                   key, value)
+
+
+def _megaraid_pdisk(ctrl, entries):
+    ident = '%s/%s' % (ctrl, dict(entries).get('id'))
+    for key, value in entries:
+        yield 'raid_pdisk', ident, ctrl, key, value
+
+
+def _megaraid_drives(hw_lst):
+    ctrl = '0'
+    entries = []
+    for hw_class, item, key, value in hw_lst:
+        # the entries of a physical drive start with its 'ctrl' key
+        if entries and (hw_class != 'pdisk' or key == 'ctrl'):
+            for entry in _megaraid_pdisk(ctrl, entries):
+                yield entry
+            entries = []
+        if hw_class == 'megaraid':
+            res = MEGARAID_CTRL_REGEXP.search(item)
+            if res:
+                ctrl = res.group(1)
+        elif hw_class == 'pdisk' and item != 'all':
+            entries.append((key, value))
+        elif hw_class == 'ldisk':
+            yield ('raid_ldisk', '%s/%s' % (ctrl, item[len('disk'):]), ctrl,
+                   key, value)
+    for entry in _megaraid_pdisk(ctrl, entries):
+        yield entry
+
+
+DRIVES = {'areca': _areca_drives,
+          'hpa': _hpa_drives,
+          'megaraid': _megaraid_drives}
+
+
+def normalize(backend, hw_lst):
+    """Map the legacy entries of a backend onto the normalized fields."""
+    norm_lst = []
+    seen = set()
+    for hw_class, ident, ctrl, key, value in DRIVES[backend](hw_lst):
+        if hw_class == 'raid_pdisk':
+            fields = PDISK_FIELDS.get(backend, {})
+        else:
+            fields = LDISK_FIELDS.get(backend, {})
+        name = '%s:%s' % (backend, ident)
+        if (hw_class, name) not in seen:
+            seen.add((hw_class, name))
+            norm_lst.append((hw_class, name, 'controller', ctrl))
+        if key in fields:
+            value = str(value)
+            if fields[key] == 'interface':
+                # areca reports the SAS address like SATA(5001B4D4188DF017)
+                value = value.split('(')[0]
+            norm_lst.append((hw_class, name, fields[key], value))
+    return norm_lst
+
+
+def _detect_backend(backend):
+    name, _, module = backend
+    try:
+        return module.detect()
+    except Exception as exc:
+        sys.stderr.write('Info: %s detection failed: %s\n' % (name, exc))
+        return []
+
+
+def detect(sysfs_root=SYS_PCI_DEVICES):
+    """Detect the RAID controllers of every vendor present on the system.
+
+    The parallelism is per vendor, not per controller: storcli reads all
+    its controllers with a single /call query and hpacucli with a single
+    'ctrl all show config detail', so there is nothing left to run
+    concurrently. Several instances of a vendor tool must not run at
+    once either: storcli and ssacli serialize on a global lock and fail
+    or wait when another instance holds it, and cli64 keeps the selected
+    Areca controller as session state.
+
+    :param sysfs_root: where to look for the PCI devices, all the
+                       backends are run if it cannot be read
+    """
+    vendors = pci_storage_vendors(sysfs_root)
+    backends = [backend for backend in BACKENDS
+                if vendors is None or vendors.intersection(backend[1])]
+    if not backends:
+        return []
+
+    with futures.ThreadPoolExecutor(max_workers=len(backends)) as executor:
+        results = list(executor.map(_detect_backend, backends))
+
+    hw_lst = []
+    for (name, _, _), backend_lst in zip(backends, results):
+        hw_lst.extend(backend_lst)
+        hw_lst.extend(normalize(name, backend_lst))
+    return hw_lst
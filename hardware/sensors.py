@@ -12,63 +12,313 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-"""Functions to read data from hardware sensors."""
+"""Functions to read data from hardware sensors.
 
+All the hwmon devices of /sys/class/hwmon are read (coretemp, k10temp,
+nvme, PSU, NIC...). Each device directory is listed once and every
+attribute file is opened once, the sampler keeps them open and reads
+them again with pread.
+"""
+
+import collections
 import os
+import re
 import sys
+import threading
+
+
+SYS_CLASS_HWMON = '/sys/class/hwmon'
+
+# sensor type: (divider of the sysfs value, unit)
+HWMON_TYPES = {'temp': (1000.0, 'C'),
+               'fan': (1.0, 'RPM'),
+               'in': (1000.0, 'V'),
+               'power': (1000000.0, 'W'),
+               'curr': (1000.0, 'A')}
+HWMON_FIELDS = ('input', 'average', 'min', 'max', 'crit', 'alarm',
+                'crit_alarm')
+HWMON_REGEXP = re.compile(r'^(temp|fan|in|power|curr)(\d+)_([a-z_]+)$')
 
+# coretemp attributes reported by detect_temperatures
+CORETEMP_FIELDS = (('input', 'temperature'),
+                   ('max', 'max'),
+                   ('crit', 'critical'),
+                   ('crit_alarm', 'critical_alarm'))
 
-def read_hwmon(hwlst, entry, sensor, label_name, appendix, processor_num,
-               entry_name):
+
+def _read_sysfs(path):
     try:
-        hwmon = "%s_%s" % (sensor, appendix)
-        filename = "/sys/devices/platform/%s/%s" % (entry, hwmon)
-        if not os.path.isfile(filename):
-            if len(hwmon) > 16:
-                # Some kernels are shortening the filename to 17 chars
-                # Let's try to find if we are in this case
-                filename = "/sys/devices/platform/%s/%s" % (entry, hwmon[:16])
-                if not os.path.isfile(filename):
-                    sys.stderr.write("read_hwmon: No entry found for %s/%s\n" %
-                                     (label_name, entry_name))
-                    return
-            else:
-                sys.stderr.write("read_hwmon: No entry found for %s/%s\n" %
-                                 (label_name, entry_name))
-                return
-
-        value = open(filename, 'r').readline().strip()
-        hwlst.append(('cpu', 'physical_%d' % processor_num, "%s/%s" %
-                      (label_name, entry_name), value))
-    except Exception:
-        pass
+        with open(path, 'r') as sysfs:
+            return sysfs.readline().strip()
+    except IOError:
+        return None
+
+
+def _hwmon_files(path):
+    try:
+        return [name for name in os.listdir(path) if HWMON_REGEXP.match(name)]
+    except OSError:
+        return []
+
+
+def hwmon_devices(sysfs_root=SYS_CLASS_HWMON):
+    """List the hwmon devices.
+
+    :returns: a list of (name, device, directory of the attributes,
+              sensor attribute files) where device is the parent device
+              name (coretemp.0, nvme0, 0000:00:18.3...) or the hwmon
+              entry if there is none
+    """
+    try:
+        entries = sorted(os.listdir(sysfs_root))
+    except OSError:
+        return []
+    devices = []
+    for entry in entries:
+        path = os.path.join(sysfs_root, entry)
+        device_path = os.path.join(path, 'device')
+        device = entry
+        if os.path.exists(device_path):
+            device = os.path.basename(os.path.realpath(device_path))
+        files = _hwmon_files(path)
+        # old kernels have the attributes in the parent device directory
+        if not files and os.path.isdir(device_path):
+            path = device_path
+            files = _hwmon_files(path)
+        if not files:
+            continue
+        name = (_read_sysfs(os.path.join(path, 'name'))
+                or _read_sysfs(os.path.join(sysfs_root, entry, 'name'))
+                or entry)
+        devices.append((name, device, path, sorted(files)))
+    return devices
+
+
+def _channel_key(channel):
+    res = HWMON_REGEXP.match(channel + '_input')
+    return res.group(1), int(res.group(2))
+
+
+class HwmonReader(object):
+    """Batched reader of all the hwmon sensors.
+
+    The devices are scanned once when the reader is built, the attribute
+    files are opened on the first read and kept open until close().
+    """
+
+    def __init__(self, sysfs_root=SYS_CLASS_HWMON):
+        # (item, channel, field, path, divider)
+        self.attributes = []
+        self.labels = []
+        for name, device, path, files in hwmon_devices(sysfs_root):
+            item = '%s:%s' % (name, device)
+            labels = []
+            attributes = []
+            for filename in files:
+                sensor_type, number, field = HWMON_REGEXP.match(
+                    filename).groups()
+                channel = '%s%s' % (sensor_type, number)
+                if field == 'label':
+                    label = _read_sysfs(os.path.join(path, filename))
+                    if label:
+                        labels.append((item, channel, label))
+                elif field in HWMON_FIELDS:
+                    divider = HWMON_TYPES[sensor_type][0]
+                    if field.endswith('alarm'):
+                        divider = None
+                    attributes.append((item, channel, field,
+                                       os.path.join(path, filename),
+                                       divider))
+            # the devices stay in the hwmon order, their sensors are sorted
+            self.labels.extend(sorted(
+                labels, key=lambda label: _channel_key(label[1])))
+            self.attributes.extend(sorted(
+                attributes, key=lambda attr: (_channel_key(attr[1]),
+                                              HWMON_FIELDS.index(attr[2]))))
+        self.fds = None
+
+    def _open(self):
+        self.fds = []
+        for attribute in self.attributes:
+            try:
+                self.fds.append(os.open(attribute[3], os.O_RDONLY))
+            except OSError:
+                self.fds.append(None)
+
+    def close(self):
+        for fd in self.fds or []:
+            if fd is not None:
+                os.close(fd)
+        self.fds = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, fields=None):
+        """Read the current values.
+
+        :param fields: only read these fields, all of them by default
+        :returns: a list of (item, channel, field, value) where the
+                  values are converted in the unit of the sensor type
+        """
+        if self.fds is None:
+            self._open()
+        values = []
+        for (item, channel, field, _, divider), fd in zip(self.attributes,
+                                                          self.fds):
+            if fd is None or (fields and field not in fields):
+                continue
+            try:
+                # sysfs produces a new value on each read at offset 0
+                raw = int(os.pread(fd, 32, 0))
+            except (OSError, ValueError):
+                # a sensor without value returns an error like ENODATA
+                continue
+            values.append((item, channel, field,
+                           raw / divider if divider else raw))
+        return values
+
 
+def format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    return '%g' % round(value, 3)
 
-def detect_temperatures():
+
+def detect_hwmon(sysfs_root=SYS_CLASS_HWMON):
+    """Report all the hwmon sensors.
+
+    :returns: ('hwmon', '<name>:<device>', '<channel>/<field>', value)
+              tuples, with the values in C, RPM, V, W or A
+    """
     hwlst = []
-    for entry in os.listdir("/sys/devices/platform/"):
-        if entry.startswith("coretemp."):
-            processor_num = int(entry.split(".")[1])
-            for label in os.listdir("/sys/devices/platform/%s" % entry):
-                if label.startswith("temp") and label.endswith("_label"):
-                    sensor = label.split("_")[0]
-                    try:
-                        with open("/sys/devices/platform/%s/%s_label" %
-                                  (entry, sensor), 'r') as fsensor:
-                            label_name = fsensor.readline()
-                            label_name = label_name.strip().replace(" ", "_")
-                    except Exception:
-                        sys.stderr.write("detect_temperatures: "
-                                         "Cannot open label on %s/%s\n" %
-                                         (entry, sensor))
-                        continue
-
-                    read_hwmon(hwlst, entry, sensor, label_name, "input",
-                               processor_num, "temperature")
-                    read_hwmon(hwlst, entry, sensor, label_name, "max",
-                               processor_num, "max")
-                    read_hwmon(hwlst, entry, sensor, label_name, "crit",
-                               processor_num, "critical")
-                    read_hwmon(hwlst, entry, sensor, label_name, "crit_alarm",
-                               processor_num, "critical_alarm")
+    with HwmonReader(sysfs_root) as reader:
+        for item, channel, label in reader.labels:
+            hwlst.append(('hwmon', item, '%s/label' % channel, label))
+        units = set()
+        for item, channel, field, value in reader.read():
+            hwlst.append(('hwmon', item, '%s/%s' % (channel, field),
+                          format_value(value)))
+            if (item, channel) not in units:
+                units.add((item, channel))
+                hwlst.append(('hwmon', item, '%s/unit' % channel,
+                              HWMON_TYPES[_channel_key(channel)[0]][1]))
     return hwlst
+
+
+def detect_temperatures(sysfs_root=SYS_CLASS_HWMON):
+    """Report the labelled coretemp sensors as cpu physical_X entries."""
+    hwlst = []
+    for name, device, path, files in hwmon_devices(sysfs_root):
+        if name != 'coretemp' or not device.startswith('coretemp.'):
+            continue
+        processor_num = int(device.split('.')[1])
+        for filename in files:
+            if not (filename.startswith('temp')
+                    and filename.endswith('_label')):
+                continue
+            sensor = filename.split('_')[0]
+            label_name = _read_sysfs(os.path.join(path, filename))
+            if label_name is None:
+                sys.stderr.write("detect_temperatures: "
+                                 "Cannot open label on %s/%s\n" %
+                                 (device, sensor))
+                continue
+            label_name = label_name.replace(" ", "_")
+            for field, entry_name in CORETEMP_FIELDS:
+                value = _read_sysfs(os.path.join(path, '%s_%s' %
+                                                 (sensor, field)))
+                if value is None:
+                    sys.stderr.write("detect_temperatures: No entry found "
+                                     "for %s/%s\n" % (label_name, entry_name))
+                    continue
+                hwlst.append(('cpu', 'physical_%d' % processor_num,
+                              "%s/%s" % (label_name, entry_name), value))
+    return hwlst
+
+
+class Sampler(object):
+    """Sample sensors in a thread and keep the last values.
+
+    The subclasses read the sensors in read() and set the class of the
+    reported tuples in hw_class.
+
+    :param frequency: number of samples per second
+    :param size: number of samples kept in the ring buffer of each sensor
+    """
+
+    hw_class = None
+
+    def __init__(self, frequency=1.0, size=300):
+        self.interval = 1.0 / frequency
+        self.samples = collections.defaultdict(
+            lambda: collections.deque(maxlen=size))
+        self.count = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def read(self):
+        """Return a list of (item, key, numeric value)."""
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def sample(self):
+        """Read the sensors once."""
+        for item, key, value in self.read():
+            self.samples[(item, key)].append(value)
+        self.count += 1
+
+    def _run(self):
+        # at least one sample is taken, even for a very short run
+        self.sample()
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.close()
+
+    def report(self):
+        """Return the min/max/avg of the samples in the ring buffers."""
+        hwlst = [(self.hw_class, 'sampling', 'samples', str(self.count)),
+                 (self.hw_class, 'sampling', 'interval',
+                  format_value(self.interval))]
+        for (item, key), values in self.samples.items():
+            for stat, value in (('min', min(values)),
+                                ('max', max(values)),
+                                ('avg', float(sum(values)) / len(values))):
+                hwlst.append((self.hw_class, item, '%s_%s' % (key, stat),
+                              format_value(value)))
+        return hwlst
+
+
+class HwmonSampler(Sampler):
+    """Sample the input and average values of the hwmon sensors."""
+
+    hw_class = 'hwmon'
+
+    def __init__(self, frequency=1.0, size=300, sysfs_root=SYS_CLASS_HWMON):
+        super(HwmonSampler, self).__init__(frequency, size)
+        self.reader = HwmonReader(sysfs_root)
+
+    def read(self):
+        return [(item, '%s/%s' % (channel, field), value)
+                for item, channel, field, value
+                in self.reader.read(('input', 'average'))]
+
+    def close(self):
+        self.reader.close()
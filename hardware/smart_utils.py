@@ -10,13 +10,31 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from concurrent import futures
+import glob
+import json
 import os
+import re
 import subprocess
 import sys
 
+from hardware import detect_utils
+from hardware import nvme
 from hardware import smart_utils_info
 
 
+# Number of smartctl processes run at once on the disks of a RAID array
+PASSTHROUGH_WORKERS = 8
+PASSTHROUGH_REGEXP = re.compile(r'-d\s+(megaraid|cciss),(\d+)')
+# Slots probed by the legacy code when no disk can be discovered
+PASSTHROUGH_MAX_SLOTS = 24
+# SCSI host drivers of the controllers of each pass-through mode
+PASSTHROUGH_DRIVERS = {'megaraid': ('megaraid_sas',),
+                       'cciss': ('hpsa', 'cciss')}
+SCSI_HOST_REGEXP = re.compile(r'/host(\d+)/')
+SYSFS_ROOT = '/sys'
+
+
 def _parse_line(line):
     line = line.strip().decode(errors='ignore')
     return line
@@ -24,7 +42,8 @@ def _parse_line(line):
 
 def read_smart_field(hwlst, line, device_name, item, title):
     if item in line:
-        if "temperature" in title:
+        # '40 Celsius' is split into the value and its unit
+        if "temperature" in title or "temp_threshold" in title:
             try:
                 hwlst.append(("disk", device_name, "SMART/%s" % title,
                               line.split(item)[1].strip().split()[0]))
@@ -57,7 +76,158 @@ def read_smart_scsi_error_log(hwlst, line, device_name, error_log):
                       result[7].strip()))
 
 
-def read_smart_scsi(hwlst, device, optional_flag="", mode=""):
+def _passthrough_mode(vendor, product):
+    """Return the smartctl pass-through mode of a RAID logical device."""
+    if (vendor == "DELL") and ("PERC" in product):
+        return "megaraid"
+    if (vendor == "HP") and ("LOGICAL VOLUME" in product):
+        return "cciss"
+    return None
+
+
+def get_scsi_host(device, sysfs_root=SYSFS_ROOT):
+    """Return the SCSI host number of the controller of a device.
+
+    :param device: /dev/bus/N as listed by smartctl, or a /dev/sdX or
+                   /dev/sgN device
+    :returns: the host number or None if sysfs does not know the device
+    """
+    name = os.path.basename(device)
+    if device.startswith('/dev/bus/') and name.isdigit():
+        return int(name)
+    for path in ('block/%s/device', 'class/scsi_generic/%s/device'):
+        link = os.path.join(sysfs_root, path % name)
+        if os.path.exists(link):
+            res = SCSI_HOST_REGEXP.search(os.path.realpath(link))
+            if res:
+                return int(res.group(1))
+    return None
+
+
+def get_driver_hosts(mode, sysfs_root=SYSFS_ROOT):
+    """Return the sorted SCSI hosts of the controllers of a mode."""
+    hosts = []
+    for path in glob.glob(os.path.join(sysfs_root,
+                                       'class/scsi_host/host*/proc_name')):
+        with open(path) as proc_name:
+            if proc_name.read().strip() in PASSTHROUGH_DRIVERS[mode]:
+                hosts.append(int(path.split('/')[-2][len('host'):]))
+    return sorted(hosts)
+
+
+def scan_passthrough():
+    """List the RAID pass-through disks smartctl is able to open.
+
+    :returns: a dict mapping 'megaraid' and 'cciss' to a dict of the
+              sorted disk numbers found by 'smartctl --scan-open',
+              indexed by the SCSI host of their controller
+    """
+    disks = {'megaraid': {}, 'cciss': {}}
+    for line in detect_utils.output_lines('smartctl --scan-open'):
+        # '/dev/bus/0 -d megaraid,8 # /dev/bus/0 [megaraid_disk_08], ...'
+        fields = line.split('#')[0]
+        res = PASSTHROUGH_REGEXP.search(fields)
+        if res:
+            host = get_scsi_host(fields.split()[0])
+            disks[res.group(1)].setdefault(host, set()).add(
+                int(res.group(2)))
+    return dict((mode, dict((host, sorted(numbers))
+                            for host, numbers in controllers.items()))
+                for mode, controllers in disks.items())
+
+
+def _inventory_disks(hw_lst):
+    """Return the disks of the RAID inventories, per mode and controller.
+
+    megacli.detect() reports the adapter index and the DeviceId of each
+    physical drive, hpacucli.detect() the controller slot of each drive,
+    numbered from 0 on its controller.
+    """
+    ctrl = 0
+    disks = {'megaraid': {}, 'cciss': {}}
+    for (hw_cls, name, hw_key, value) in hw_lst:
+        # the entries of a physical drive start with its 'ctrl' key, the
+        # disk<slot> names are reused by the adapters
+        if hw_cls == 'pdisk' and hw_key == 'ctrl':
+            ctrl = int(value)
+        elif hw_cls == 'pdisk' and hw_key == 'DeviceId':
+            disks['megaraid'].setdefault(ctrl, []).append(int(value))
+        elif hw_cls == 'disk' and hw_key == 'slot' and value.isdigit():
+            numbers = disks['cciss'].setdefault(int(value), [])
+            numbers.append(len(numbers))
+    return disks
+
+
+def get_passthrough_disks(hw_lst=None):
+    """Discover the populated RAID slots to query through smartctl.
+
+    'smartctl --scan-open' is used first, then the controller
+    inventories of megacli.detect() and hpacucli.detect() if they are
+    part of hw_lst. The inventories number the controllers, they are
+    matched in order with the SCSI hosts of the controller driver.
+
+    :returns: a dict mapping 'megaraid' and 'cciss' to a dict of the
+              sorted disk numbers indexed by SCSI host
+    """
+    disks = scan_passthrough()
+    for mode, controllers in _inventory_disks(hw_lst or []).items():
+        if not controllers or (mode == 'cciss' and disks['cciss']):
+            continue
+        hosts = get_driver_hosts(mode)
+        if len(hosts) != len(controllers):
+            sys.stderr.write('get_passthrough_disks: %d %s controllers '
+                             'but %d SCSI hosts, ignoring the inventory\n'
+                             % (len(controllers), mode, len(hosts)))
+            continue
+        for host, ctrl in zip(hosts, sorted(controllers)):
+            disks[mode][host] = sorted(set(disks[mode].get(host, [])
+                                           + controllers[ctrl]))
+    return disks
+
+
+def controller_disks(passthrough, mode, device):
+    """Return the pass-through disks of the controller of a device.
+
+    The list is shared by the logical devices of the controller. A
+    controller without discovered disks is probed on all its slots.
+    """
+    host = get_scsi_host(device)
+    if host is None:
+        host = device
+    return passthrough[mode].setdefault(
+        host, list(range(0, PASSTHROUGH_MAX_SLOTS)))
+
+
+def read_smart_passthrough(hwlst, device, mode, disks, reader):
+    """Read the physical disks behind a RAID logical device in parallel.
+
+    :param hwlst: the hardware list to complete
+    :param device: the logical device used to reach the controller
+    :param mode: 'megaraid' or 'cciss'
+    :param disks: the disk numbers of the controller of the device, as
+                  returned by controller_disks(), emptied once queried
+                  so the disks of a controller are read once
+    :param reader: read_smart_scsi or read_smart_json
+    """
+    numbers = list(disks)
+    del disks[:]
+    if not numbers:
+        return hwlst
+
+    def _read_disk(number):
+        lst = []
+        reader(lst, device, "-d %s,%d" % (mode, number), mode)
+        return lst
+
+    workers = min(PASSTHROUGH_WORKERS, len(numbers))
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for lst in executor.map(_read_disk, numbers):
+            hwlst.extend(lst)
+    return hwlst
+
+
+def read_smart_scsi(hwlst, device, optional_flag="", mode="",
+                    passthrough=None):
     optional_string = ""
     if optional_flag:
         optional_string = " with %s" % optional_flag
@@ -101,15 +271,14 @@ def read_smart_scsi(hwlst, device, optional_flag="", mode=""):
             # Device is said no to support smart but on some RAID arrays
             # we can bypass it
             if optional_flag == "":
-                if (vendor == "DELL") and ("PERC" in product):
-                    for pdisk_number in range(0, 24):
-                        read_smart_scsi(hwlst, device,
-                                        "-d megaraid,%d" % pdisk_number,
-                                        "megaraid")
-                if (vendor == "HP") and ("LOGICAL VOLUME" in product):
-                    for pdisk_number in range(0, 24):
-                        read_smart_scsi(hwlst, device,
-                                        "-d cciss,%d" % pdisk_number, "cciss")
+                raid_mode = _passthrough_mode(vendor, product)
+                if raid_mode:
+                    if passthrough is None:
+                        passthrough = get_passthrough_disks()
+                    read_smart_passthrough(
+                        hwlst, device, raid_mode,
+                        controller_disks(passthrough, raid_mode, device),
+                        read_smart_scsi)
             return hwlst
 
         for smart_info, hwlst_value in smart_utils_info.SMART_FIELDS.items():
@@ -199,7 +368,7 @@ def read_smart_ata(hwlst, device, optional_flag="", mode=""):
             continue
 
 
-def read_smart(hwlst, device, optional_flag=""):
+def read_smart(hwlst, device, optional_flag="", passthrough=None):
     optional_string = ""
     if optional_flag:
         optional_string = " with %s" % optional_flag
@@ -220,14 +389,15 @@ def read_smart(hwlst, device, optional_flag=""):
                     or ("Unavailable - device lacks SMART capability" in line)
                     or line.startswith(
                         "Device supports SMART and is Enabled")):
-                return read_smart_scsi(hwlst, device, optional_flag)
+                return read_smart_scsi(hwlst, device, optional_flag,
+                                       passthrough=passthrough)
 
             if line.startswith("ID#"):
                 return read_smart_ata(hwlst, device, optional_flag)
 
         # If no ID# was found, let's retry with "-d ata"
         if optional_flag == "":
-            return read_smart(hwlst, device, "-d ata")
+            return read_smart(hwlst, device, "-d ata", passthrough)
 
     sys.stderr.write("read_smart: no device %s\n" % device)
     return
@@ -256,3 +426,196 @@ def read_smart_nvme(hwlst, device_name):
 
     sys.stderr.write("read_smart: no device %s\n" % device_name)
     return
+
+
+def _json_lookup(data, path):
+    """Return the value at a '/' separated path of a JSON document."""
+    for key in path.split('/'):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def run_smartctl_json(device, optional_flag=""):
+    """Run 'smartctl -j -x' once and return the decoded JSON document.
+
+    smartctl exit codes are a bitmask that is often non zero even when
+    the output is valid, so only the output is considered. Returns None
+    when smartctl does not support JSON output (version < 7.0).
+    """
+    sdparm_cmd = subprocess.Popen("smartctl -j -x %s %s" %
+                                  (device, optional_flag),
+                                  shell=True,
+                                  stdout=subprocess.PIPE)
+    output = sdparm_cmd.communicate()[0]
+    try:
+        return json.loads(output.decode(errors='ignore'))
+    except ValueError:
+        return None
+
+
+def _read_json_fields(hwlst, data, device_name, fields):
+    for path, title in fields.items():
+        value = _json_lookup(data, path)
+        if value is not None:
+            hwlst.append(("disk", device_name, "SMART/%s" % title, value))
+
+
+def _read_json_temperature(hwlst, data, device_name, key, title, unit):
+    value = _json_lookup(data, 'temperature/%s' % key)
+    if value is not None:
+        hwlst.append(("disk", device_name, "SMART/%s" % title, value))
+        hwlst.append(("disk", device_name, "SMART/%s_unit" % title, unit))
+
+
+def read_smart_json_ata(hwlst, data, device_name):
+    """Map the JSON output of smartctl for an ATA device."""
+    _read_json_fields(hwlst, data, device_name,
+                      smart_utils_info.ATA_JSON_FIELDS)
+    table = _json_lookup(data, 'ata_smart_attributes/table') or []
+    for attribute in table:
+        when_failed = attribute.get("when_failed") or "NEVER"
+        raw = attribute.get("raw", {}).get("value")
+        for title, value in (("value", attribute.get("value")),
+                             ("worst", attribute.get("worst")),
+                             ("thresh", attribute.get("thresh")),
+                             ("when_failed", when_failed),
+                             ("raw", raw)):
+            hwlst.append(("disk", device_name,
+                          "SMART/%s(%d)/%s" % (attribute["name"],
+                                               attribute["id"],
+                                               title),
+                          value))
+
+
+def read_smart_json_scsi(hwlst, data, device_name):
+    """Map the JSON output of smartctl for a SCSI device."""
+    _read_json_fields(hwlst, data, device_name,
+                      smart_utils_info.SCSI_JSON_FIELDS)
+    _read_json_temperature(hwlst, data, device_name, 'current',
+                           'current_drive_temperature', 'C')
+    _read_json_temperature(hwlst, data, device_name, 'drive_trip',
+                           'drive_trip_temperature', 'C')
+
+    counter = data.get('scsi_start_stop_cycle_counter', {})
+    if 'week_of_manufacture' in counter and 'year_of_manufacture' in counter:
+        hwlst.append(("disk", device_name, "SMART/manufacture_date",
+                      "week %d of year %d" %
+                      (int(counter['week_of_manufacture']),
+                       int(counter['year_of_manufacture']))))
+
+    hours = _json_lookup(data, 'power_on_time/hours')
+    if hours is not None:
+        minutes = _json_lookup(data, 'power_on_time/minutes') or 0
+        hwlst.append(("disk", device_name, "SMART/power_on_hours",
+                      round(hours + minutes / 60.0, 2)))
+
+    for error_log in ["read", "write", "verify"]:
+        log = _json_lookup(data, 'scsi_error_counter_log/%s' % error_log)
+        if not log:
+            continue
+        for title, key in (("total_corrected_errors",
+                            "total_errors_corrected"),
+                           ("gigabytes_processed", "gigabytes_processed"),
+                           ("total_uncorrected_errors",
+                            "total_uncorrected_errors")):
+            value = log.get(key)
+            # gigabytes_processed is a string to keep its precision
+            if isinstance(value, str):
+                value = float(value)
+            hwlst.append(("disk", device_name,
+                          "SMART/%s_%s" % (error_log, title), value))
+
+
+def read_smart_json_nvme(hwlst, data, device_name):
+    """Map the JSON output of smartctl for a NVMe device.
+
+    The values are formatted like the text output reports them, so the
+    keys of a NVMe device do not change type with the backend.
+    """
+    for path, title in smart_utils_info.NVME_JSON_FIELDS.items():
+        value = _json_lookup(data, path)
+        if value is not None:
+            hwlst.append(("disk", device_name, "SMART/%s" % title,
+                          str(value)))
+
+    capacity = data.get('nvme_total_capacity')
+    if capacity:
+        hwlst.append(("disk", device_name, "SMART/total_nvm_capacity",
+                      nvme.format_capacity(capacity)))
+    critical_warning = _json_lookup(
+        data, 'nvme_smart_health_information_log/critical_warning')
+    if critical_warning is not None:
+        hwlst.append(("disk", device_name, "SMART/critical_warning",
+                      "0x%02x" % critical_warning))
+    for path, title in smart_utils_info.NVME_JSON_TEMPERATURES.items():
+        value = _json_lookup(data, path)
+        if value is not None:
+            hwlst.append(("disk", device_name, "SMART/%s" % title,
+                          str(value)))
+            hwlst.append(("disk", device_name, "SMART/%s_unit" % title,
+                          "Celsius"))
+
+
+def read_smart_json(hwlst, device, optional_flag="", mode="",
+                    passthrough=None):
+    """Read S.M.A.R.T information with a single smartctl invocation.
+
+    The JSON document of 'smartctl -j -x' is mapped onto the same
+    ('disk', dev, 'SMART/...') keys as the text parsers, with numeric
+    values kept as numbers except for NVMe devices, which are formatted
+    like the text output.
+    Returns None if smartctl cannot produce JSON, so callers can fall
+    back to read_smart() or read_smart_nvme().
+    `passthrough` is the result of get_passthrough_disks(), shared between
+    the logical devices of a host.
+    """
+    if not os.path.exists(device):
+        sys.stderr.write("read_smart_json: no device %s\n" % device)
+        return hwlst
+
+    device_name = os.path.basename(device)
+    if mode:
+        device_name = "%s{%s}" % (device_name, optional_flag.split()[1])
+
+    data = run_smartctl_json(device, optional_flag)
+    if data is None or 'device' not in data:
+        return None
+
+    protocol = _json_lookup(data, 'device/protocol')
+    sys.stderr.write("read_smart_json: Reading S.M.A.R.T information on "
+                     "%s (%s)\n" % (device_name, protocol))
+
+    if not _json_lookup(data, 'smart_support/available'):
+        vendor = data.get('scsi_vendor', '')
+        product = data.get('scsi_product', '')
+        # Device is said no to support smart but on some RAID arrays
+        # we can bypass it
+        if optional_flag == "":
+            raid_mode = _passthrough_mode(vendor, product)
+            if raid_mode:
+                if passthrough is None:
+                    passthrough = get_passthrough_disks()
+                read_smart_passthrough(
+                    hwlst, device, raid_mode,
+                    controller_disks(passthrough, raid_mode, device),
+                    read_smart_json)
+        return hwlst
+
+    passed = _json_lookup(data, 'smart_status/passed')
+    if protocol == 'ATA':
+        read_smart_json_ata(hwlst, data, device_name)
+    elif protocol == 'SCSI':
+        read_smart_json_scsi(hwlst, data, device_name)
+    elif protocol == 'NVMe':
+        read_smart_json_nvme(hwlst, data, device_name)
+    else:
+        sys.stderr.write("read_smart_json: unsupported protocol %s on %s\n"
+                         % (protocol, device_name))
+        return hwlst
+
+    if passed is not None:
+        hwlst.append(("disk", device_name, "SMART/health",
+                      "OK" if passed else "FAILED"))
+    return hwlst
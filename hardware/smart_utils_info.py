@@ -45,3 +45,50 @@ SMART_FIELDS = {
     "Manufactured in ": "manufacture_date",
     "Rotation Rate": "rotation_rate",
 }
+
+# Mapping of 'smartctl -j -x' JSON paths onto the keys produced by the
+# text parsers above, per device protocol.
+ATA_JSON_FIELDS = {
+    'model_name': 'device_model',
+    'serial_number': 'serial_number',
+    'firmware_version': 'firmware_version',
+    'rotation_rate': 'rotation_rate',
+}
+
+SCSI_JSON_FIELDS = {
+    'scsi_vendor': 'vendor',
+    'scsi_product': 'product',
+    'serial_number': 'serial_number',
+    'scsi_start_stop_cycle_counter/'
+    'specified_cycle_count_over_device_lifetime':
+    'specified_start_stop_cycle_count_over_lifetime',
+    'scsi_start_stop_cycle_counter/'
+    'accumulated_start_stop_cycles': 'start_stop_cycle_count',
+    'scsi_start_stop_cycle_counter/'
+    'specified_load_unload_count_over_device_lifetime':
+    'specified_load_count_over_lifetime',
+    'scsi_start_stop_cycle_counter/'
+    'accumulated_load_unload_cycles': 'load_count',
+    'scsi_nonmedium_error_count': 'non_medium_errors_count',
+}
+
+NVME_JSON_FIELDS = {
+    'model_name': 'model_number',
+    'serial_number': 'serial_number',
+    'firmware_version': 'firmware_version',
+    'nvme_smart_health_information_log/power_cycles': 'power_cycles',
+    'nvme_smart_health_information_log/power_on_hours': 'power_on_hours',
+    'nvme_smart_health_information_log/unsafe_shutdowns': 'unsafe_shutdowns',
+    'nvme_smart_health_information_log/media_errors':
+    'media_data_integrity_errors',
+    'nvme_smart_health_information_log/num_err_log_entries':
+    'error_information_log_entries',
+}
+
+# Temperatures of the JSON output reported with a Celsius unit, like the
+# 'Temperature:' lines of the text output
+NVME_JSON_TEMPERATURES = {
+    'temperature/op_limit_max': 'warning_temp_threshold',
+    'temperature/critical_limit_max': 'critical_temp_threshold',
+    'temperature/current': 'temperature',
+}
@@ -0,0 +1,232 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Wrapper functions around the storcli/perccli JSON output.
+
+The inventory is mapped onto the megaraid/pdisk/ldisk entries produced
+by the megacli module, which is used as a fallback when no storcli
+binary is available.
+"""
+
+import functools
+import json
+import re
+from subprocess import PIPE
+from subprocess import Popen
+import sys
+
+from hardware import megacli
+
+
+STORCLI_NAMES = ["storcli64", "storcli", "perccli64", "perccli"]
+DRIVE_REGEXP = re.compile(r'^Drive /c(\d+)/e(\d+)/s(\d+)$')
+
+# storcli short states and media types, expanded as megacli prints them
+PD_STATES = {'Onln': 'Online, Spun Up',
+             'Offln': 'Offline',
+             'UGood': 'Unconfigured(good), Spun Up',
+             'UBad': 'Unconfigured(bad)',
+             'GHS': 'Hotspare, Spun Up',
+             'DHS': 'Hotspare, Spun Up',
+             'Rbld': 'Rebuild',
+             'JBOD': 'JBOD',
+             'Failed': 'Failed'}
+MEDIA_TYPES = {'HDD': 'Hard Disk Device',
+               'SSD': 'Solid State Device'}
+VD_STATES = {'Optl': 'Optimal',
+             'OfLn': 'Offline',
+             'Pdgd': 'Partially Degraded',
+             'Dgrd': 'Degraded',
+             'Rec': 'Recovery'}
+
+# (section, storcli key, megacli key) of the controller information
+CONTROLLER_KEYS = [('Basics', 'Model', 'ProductName'),
+                   ('Basics', 'Serial Number', 'SerialNo'),
+                   ('Version', 'Firmware Package Build', 'FwPackageBuild'),
+                   ('Version', 'Firmware Version', 'FwVersion'),
+                   ('Version', 'Bios Version', 'BiosVersion'),
+                   ('Version', 'Driver Name', 'DriverName'),
+                   ('Version', 'Driver Version', 'DriverVersion'),
+                   ('Status', 'Controller Status', 'ControllerStatus'),
+                   (None, 'Virtual Drives', 'VirtualDrives'),
+                   (None, 'Physical Drives', 'PhysicalDevices')]
+ENCLOSURE_KEYS = [('EID', 'DeviceId'),
+                  ('Slots', 'NumberOfSlots'),
+                  ('PS', 'NumberOfPowerSupplies'),
+                  ('State', 'Status')]
+PD_STATE_KEYS = [('Media Error Count', 'MediaErrorCount'),
+                 ('Other Error Count', 'OtherErrorCount'),
+                 ('Predictive Failure Count', 'PredictiveFailureCount'),
+                 ('Drive Temperature', 'DriveTemperature')]
+PD_ATTRIBUTE_KEYS = [('WWN', 'Wwn'),
+                     ('Firmware Revision', 'DeviceFirmwareLevel'),
+                     ('Raw size', 'RawSize'),
+                     ('Non Coerced size', 'NonCoercedSize'),
+                     ('Coerced size', 'CoercedSize'),
+                     ('Device Speed', 'DeviceSpeed'),
+                     ('Link Speed', 'LinkSpeed')]
+
+
+@functools.lru_cache(maxsize=None)
+def storcli_path():
+    """Return the path of the storcli binary, looked up only once."""
+    return megacli.search_exec(STORCLI_NAMES)
+
+
+def run_storcli(*args):
+    """Run the storcli command in a subprocess and return the output."""
+    prog_exec = storcli_path()
+    if prog_exec:
+        cmd = prog_exec + ' ' + ' '.join(args)
+        proc = Popen(cmd, shell=True, stdout=PIPE, universal_newlines=True)
+        return proc.communicate()[0]
+
+    return ""
+
+
+def run_and_parse(*args):
+    """Run a storcli JSON command and return the controller responses.
+
+    Returns a dict of 'Response Data' objects indexed by controller
+    number, or None if the output cannot be used.
+    """
+    try:
+        data = json.loads(run_storcli(*(args + ('J',))))
+    except ValueError:
+        return None
+    res = {}
+    for ctrl in data.get('Controllers', []):
+        status = ctrl.get('Command Status', {})
+        if status.get('Status') != 'Success':
+            sys.stderr.write('Info: storcli %s: %s\n' %
+                             (' '.join(args), status.get('Description')))
+            continue
+        res[int(status.get('Controller', len(res)))] = ctrl.get(
+            'Response Data', {})
+    return res
+
+
+def parse_controller(data):
+    """Map a '/cX show all' response onto the megacli adapter keys."""
+    info = {}
+    for section, key, name in CONTROLLER_KEYS:
+        values = data.get(section, {}) if section else data
+        if key in values:
+            info[name] = values[key]
+    return info
+
+
+def parse_enclosures(data):
+    """Map the enclosure list of a '/cX show all' response."""
+    encs = []
+    for idx, enclosure in enumerate(data.get('Enclosure LIST', [])):
+        enc = {'Enclosure': idx}
+        for key, name in ENCLOSURE_KEYS:
+            if key in enclosure:
+                enc[name] = enclosure[key]
+        encs.append(enc)
+    return encs
+
+
+def parse_drives(data):
+    """Map a '/cX/eall/sall show all' response onto megacli pdinfo keys.
+
+    Returns a list of dicts sorted by enclosure and slot.
+    """
+    drives = []
+    for title, value in data.items():
+        res = DRIVE_REGEXP.search(title)
+        if not res or not value:
+            continue
+        drive = value[0]
+        details = data.get('%s - Detailed Information' % title, {})
+        state = details.get('%s State' % title, {})
+        attributes = details.get('%s Device attributes' % title, {})
+
+        info = {'EnclosureDeviceId': int(res.group(2)),
+                'SlotNumber': int(res.group(3)),
+                'DeviceId': drive.get('DID'),
+                'PdType': drive.get('Intf'),
+                'FirmwareState': PD_STATES.get(drive.get('State'),
+                                               drive.get('State')),
+                'MediaType': MEDIA_TYPES.get(drive.get('Med'),
+                                             drive.get('Med')),
+                'CoercedSize': drive.get('Size')}
+        for key, name in PD_STATE_KEYS:
+            if key in state:
+                info[name] = state[key]
+        for key, name in PD_ATTRIBUTE_KEYS:
+            if key in attributes:
+                info[name] = attributes[key]
+        inquiry = [str(attributes[key]).strip()
+                   for key in ('Manufacturer Id', 'Model Number', 'SN')
+                   if key in attributes]
+        info['InquiryData'] = (' '.join(inquiry)
+                               or str(drive.get('Model', '')).strip())
+        drives.append(info)
+    return sorted(drives, key=lambda info: (info['EnclosureDeviceId'],
+                                            info['SlotNumber']))
+
+
+def parse_virtual_drives(data):
+    """Map the VD list of a '/cX show all' response onto megacli keys.
+
+    Returns a list of (logical drive number, info) tuples.
+    """
+    ldisks = []
+    for vdrive in data.get('VD LIST', []):
+        ld_num = int(vdrive['DG/VD'].split('/')[1])
+        ldisks.append((ld_num,
+                       {'Name': vdrive.get('Name', ''),
+                        'RaidLevel': vdrive.get('TYPE'),
+                        'State': VD_STATES.get(vdrive.get('State'),
+                                               vdrive.get('State')),
+                        'Size': vdrive.get('Size')}))
+    return ldisks
+
+
+def detect():
+    """Detect LSI/Broadcom controllers with storcli, or megacli."""
+    if not storcli_path():
+        return megacli.detect()
+
+    controllers = run_and_parse('/call', 'show', 'all')
+    drives = run_and_parse('/call/eall/sall', 'show', 'all')
+    if not controllers or drives is None:
+        sys.stderr.write('Info: storcli output unusable, using megacli\n')
+        return megacli.detect()
+
+    hw_lst = []
+    disk_count = 0
+    global_pdisk_size = 0
+
+    for ctrl in sorted(controllers):
+        data = controllers[ctrl]
+        megacli.add_controller(hw_lst, ctrl, parse_controller(data))
+        pdisks = parse_drives(drives.get(ctrl, {}))
+
+        for enc in parse_enclosures(data):
+            megacli.add_enclosure(hw_lst, ctrl, enc)
+            for info in pdisks:
+                if info['EnclosureDeviceId'] != enc.get('DeviceId'):
+                    continue
+                disk_count += 1
+                global_pdisk_size += megacli.add_pdisk(
+                    hw_lst, ctrl, info['SlotNumber'], info)
+            if global_pdisk_size > 0:
+                hw_lst.append(('pdisk', 'all', 'size',
+                               "%.2f" % global_pdisk_size))
+
+        for ld_num, info in parse_virtual_drives(data):
+            megacli.add_ldisk(hw_lst, ld_num, info)
+    hw_lst.append(('disk', 'megaraid', 'count', str(disk_count)))
+    return hw_lst
@@ -438,3 +438,81 @@ READ_SMART_NVME_RESULT = [
     ('disk', 'fake_nvme', 'SMART/media_data_integrity_errors', '0'),
     ('disk', 'fake_nvme', 'SMART/error_information_log_entries', '44')
 ]
+
+
+READ_SMART_JSON_ATA_RESULT = [
+    ('disk', 'fake', 'SMART/device_model', 'ST3000DM001-9YN166'),
+    ('disk', 'fake', 'SMART/serial_number', 'W1F09S26'),
+    ('disk', 'fake', 'SMART/firmware_version', 'CC4C'),
+    ('disk', 'fake', 'SMART/rotation_rate', 7200),
+    ('disk', 'fake', 'SMART/Raw_Read_Error_Rate(1)/value', 111),
+    ('disk', 'fake', 'SMART/Raw_Read_Error_Rate(1)/worst', 99),
+    ('disk', 'fake', 'SMART/Raw_Read_Error_Rate(1)/thresh', 6),
+    ('disk', 'fake', 'SMART/Raw_Read_Error_Rate(1)/when_failed', 'NEVER'),
+    ('disk', 'fake', 'SMART/Raw_Read_Error_Rate(1)/raw', 34053632),
+    ('disk', 'fake', 'SMART/Reallocated_Sector_Ct(5)/value', 100),
+    ('disk', 'fake', 'SMART/Reallocated_Sector_Ct(5)/worst', 100),
+    ('disk', 'fake', 'SMART/Reallocated_Sector_Ct(5)/thresh', 36),
+    ('disk', 'fake', 'SMART/Reallocated_Sector_Ct(5)/when_failed', 'NEVER'),
+    ('disk', 'fake', 'SMART/Reallocated_Sector_Ct(5)/raw', 0),
+    ('disk', 'fake', 'SMART/Power_On_Hours(9)/value', 97),
+    ('disk', 'fake', 'SMART/Power_On_Hours(9)/worst', 97),
+    ('disk', 'fake', 'SMART/Power_On_Hours(9)/thresh', 0),
+    ('disk', 'fake', 'SMART/Power_On_Hours(9)/when_failed', 'NEVER'),
+    ('disk', 'fake', 'SMART/Power_On_Hours(9)/raw', 2696),
+    ('disk', 'fake', 'SMART/Airflow_Temperature_Cel(190)/value', 64),
+    ('disk', 'fake', 'SMART/Airflow_Temperature_Cel(190)/worst', 61),
+    ('disk', 'fake', 'SMART/Airflow_Temperature_Cel(190)/thresh', 45),
+    ('disk', 'fake', 'SMART/Airflow_Temperature_Cel(190)/when_failed',
+     'past'),
+    ('disk', 'fake', 'SMART/Airflow_Temperature_Cel(190)/raw', 639107108),
+    ('disk', 'fake', 'SMART/health', 'OK'),
+]
+
+
+READ_SMART_JSON_SCSI_RESULT = [
+    ('disk', 'fake', 'SMART/vendor', 'SEAGATE'),
+    ('disk', 'fake', 'SMART/product', 'ST9300605SS'),
+    ('disk', 'fake', 'SMART/serial_number', '6XP2FK730000M233QACC'),
+    ('disk', 'fake',
+     'SMART/specified_start_stop_cycle_count_over_lifetime', 10000),
+    ('disk', 'fake', 'SMART/start_stop_cycle_count', 8),
+    ('disk', 'fake', 'SMART/specified_load_count_over_lifetime', 300000),
+    ('disk', 'fake', 'SMART/load_count', 8),
+    ('disk', 'fake', 'SMART/non_medium_errors_count', 6),
+    ('disk', 'fake', 'SMART/current_drive_temperature', 36),
+    ('disk', 'fake', 'SMART/current_drive_temperature_unit', 'C'),
+    ('disk', 'fake', 'SMART/drive_trip_temperature', 68),
+    ('disk', 'fake', 'SMART/drive_trip_temperature_unit', 'C'),
+    ('disk', 'fake', 'SMART/manufacture_date', 'week 10 of year 2012'),
+    ('disk', 'fake', 'SMART/power_on_hours', 14491.72),
+    ('disk', 'fake', 'SMART/read_total_corrected_errors', 1521076288),
+    ('disk', 'fake', 'SMART/read_gigabytes_processed', 25920.949),
+    ('disk', 'fake', 'SMART/read_total_uncorrected_errors', 0),
+    ('disk', 'fake', 'SMART/write_total_corrected_errors', 0),
+    ('disk', 'fake', 'SMART/write_gigabytes_processed', 1543.29),
+    ('disk', 'fake', 'SMART/write_total_uncorrected_errors', 0),
+    ('disk', 'fake', 'SMART/health', 'OK'),
+]
+
+
+READ_SMART_JSON_NVME_RESULT = [
+    ('disk', 'fake_nvme', 'SMART/model_number', 'Samsung SSD 950 PRO 256GB'),
+    ('disk', 'fake_nvme', 'SMART/serial_number', 'CYBERDYNE_T1000'),
+    ('disk', 'fake_nvme', 'SMART/firmware_version', '1B0QBXX7'),
+    ('disk', 'fake_nvme', 'SMART/power_cycles', '32'),
+    ('disk', 'fake_nvme', 'SMART/power_on_hours', '129'),
+    ('disk', 'fake_nvme', 'SMART/unsafe_shutdowns', '6'),
+    ('disk', 'fake_nvme', 'SMART/media_data_integrity_errors', '0'),
+    ('disk', 'fake_nvme', 'SMART/error_information_log_entries', '44'),
+    ('disk', 'fake_nvme', 'SMART/total_nvm_capacity',
+     '256,060,514,304 [256 GB]'),
+    ('disk', 'fake_nvme', 'SMART/critical_warning', '0x00'),
+    ('disk', 'fake_nvme', 'SMART/warning_temp_threshold', '70'),
+    ('disk', 'fake_nvme', 'SMART/warning_temp_threshold_unit', 'Celsius'),
+    ('disk', 'fake_nvme', 'SMART/critical_temp_threshold', '80'),
+    ('disk', 'fake_nvme', 'SMART/critical_temp_threshold_unit', 'Celsius'),
+    ('disk', 'fake_nvme', 'SMART/temperature', '40'),
+    ('disk', 'fake_nvme', 'SMART/temperature_unit', 'Celsius'),
+    ('disk', 'fake_nvme', 'SMART/health', 'OK'),
+]
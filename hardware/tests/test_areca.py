@@ -153,3 +153,27 @@ class TestMegacliTest(unittest.TestCase):
                           'SmartSpinupRetries': '100(60)',
                           'SmartSpinupTime': '122(24)',
                           'TimeoutCount': 0})
+
+    def test_populated_disks(self):
+        self.output = sample('areca_disk_summary')
+        self.assertEqual(areca._populated_disks(), [8, 9])
+
+    def test_populated_disks_old_cli(self):
+        self.output = 'GuiErrMsg<0x0A>: Invalid Parameter.'
+        self.assertEqual(areca._populated_disks(), [])
+
+    def test_disks_info(self):
+        calls = []
+
+        def my_run(*args):
+            calls.append(args[0])
+            if args[0] == 'disk info drv=9':
+                return sample('areca_disks_info').replace('Slot#8', 'Slot#9')
+            return sample('areca_disks_info')
+
+        areca._run_areca = my_run
+        disks = areca._disks_info([8, 9])
+        self.assertEqual([num for num, _ in disks], [8, 9])
+        self.assertEqual(disks[1][1]['DeviceLocation'], 'Enclosure#1 Slot#9')
+        self.assertEqual(sorted(calls),
+                         ['disk info drv=8', 'disk info drv=9'])
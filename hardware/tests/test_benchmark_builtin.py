@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import subprocess
+import unittest
+from unittest import mock
+
+from hardware.benchmark import builtin
+from hardware.benchmark import cpu
+from hardware.benchmark import mem
+from hardware.benchmark import topology
+
+
+class TestBuiltin(unittest.TestCase):
+
+    def setUp(self):
+        super(TestBuiltin, self).setUp()
+        patcher = mock.patch.object(topology, 'read_topology',
+                                    return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hw_data = [('cpu', 'logical', 'number', 2),
+                        ('cpu', 'physical', 'number', 2)]
+
+    def test_count_primes(self):
+        self.assertEqual(builtin.count_primes(30), 10)
+        self.assertEqual(builtin.count_primes(builtin.CPU_MAX_PRIME), 1754)
+
+    def test_select_engine(self):
+        with mock.patch('shutil.which', return_value=None):
+            self.assertEqual(builtin.select_engine('auto'), 'builtin')
+            self.assertEqual(builtin.select_engine('sysbench'), 'sysbench')
+        with mock.patch('shutil.which', return_value='/usr/bin/sysbench'), \
+                mock.patch.object(subprocess, 'check_output') as mock_run:
+            mock_run.return_value = b'sysbench 0.4.12\n'
+            self.assertEqual(builtin.select_engine('auto'), 'sysbench')
+            mock_run.assert_called_once_with(['sysbench', '--version'],
+                                             stderr=subprocess.STDOUT)
+            # sysbench 1.0 dropped the --test and --max-time options
+            mock_run.return_value = b'sysbench 1.0.20\n'
+            self.assertEqual(builtin.select_engine('auto'), 'builtin')
+            mock_run.side_effect = OSError
+            self.assertEqual(builtin.select_engine('auto'), 'builtin')
+
+    def test_copy_setup(self):
+        event, size = builtin.copy_setup(4096)
+        self.assertEqual(size, builtin.MIN_EVENT_BYTES)
+        event()
+        self.assertEqual(builtin.copy_setup(2 * builtin.MIN_EVENT_BYTES)[1],
+                         2 * builtin.MIN_EVENT_BYTES)
+
+    def test_run_processes(self):
+        rates = builtin.cpu_rates([None, None], 0.05)
+        self.assertEqual(len(rates), 2)
+        self.assertTrue(all(rate > 0 for rate in rates))
+        self.assertGreater(builtin.copy_bandwidths(4096, [None], 0.05,
+                                                   threaded=True)[0], 0)
+
+    def test_worker_error(self):
+        def setup():
+            raise ValueError('broken kernel')
+        self.assertRaises(ValueError, builtin.run_processes, setup, (),
+                          [None], 0.01)
+
+    @mock.patch.object(builtin, 'cpu_rates',
+                       side_effect=[[1000.4], [1000.4, 900.2]])
+    @mock.patch.object(cpu, 'search_cpuinfo', return_value=None)
+    def test_cpu_perf(self, mock_search_info, mock_rates):
+        cpu.cpu_perf(self.hw_data, engine='builtin')
+        self.assertEqual(self.hw_data[2:], [
+            ('cpu', 'logical_0', 'loops_per_sec', '1000'),
+            ('cpu', 'logical', 'loops_per_sec', '1900')])
+        mock_rates.assert_called_with([None, None], 10)
+
+    @mock.patch.object(builtin, 'stream_bandwidths',
+                       return_value={'copy': 8000.5, 'triad': 9000})
+    @mock.patch.object(builtin, 'copy_bandwidths', return_value=[382.9])
+    @mock.patch.object(mem, 'get_available_memory',
+                       return_value=6 * 1024 ** 3)
+    def test_mem_perf(self, mock_mem, mock_copy, mock_stream):
+        mem.mem_perf(self.hw_data, engine='builtin')
+        self.assertIn(('cpu', 'logical_0', 'bandwidth_4K', '382'),
+                      self.hw_data)
+        self.assertIn(('cpu', 'logical', 'threaded_bandwidth_1M', '382'),
+                      self.hw_data)
+        self.assertIn(('cpu', 'logical', 'forked_bandwidth_1M', '382'),
+                      self.hw_data)
+        # 2G blocks copied by 2 workers need 8GB
+        self.assertIn(('cpu', 'logical_0', 'bandwidth_2G', '382'),
+                      self.hw_data)
+        self.assertNotIn(('cpu', 'logical', 'forked_bandwidth_2G', '382'),
+                         self.hw_data)
+        self.assertEqual(self.hw_data[-2:], [
+            ('cpu', 'logical', 'stream_copy', '8000'),
+            ('cpu', 'logical', 'stream_triad', '9000')])
+        mock_copy.assert_any_call(4096, [0], 5, threaded=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
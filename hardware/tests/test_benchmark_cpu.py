@@ -20,6 +20,7 @@ import unittest
 from unittest import mock
 
 from hardware.benchmark import cpu
+from hardware.benchmark import topology
 from hardware.benchmark import utils
 
 
@@ -45,6 +46,10 @@ class TestBenchmarkCPU(unittest.TestCase):
 
     def setUp(self):
         super(TestBenchmarkCPU, self).setUp()
+        patcher = mock.patch.object(topology, 'read_topology',
+                                    return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
         self.hw_data = [('cpu', 'logical', 'number', 2),
                         ('cpu', 'physical', 'number', 2)]
 
@@ -68,6 +73,18 @@ class TestBenchmarkCPU(unittest.TestCase):
                     mock.call(1, "cache size")]
         mock_search_info.assert_has_calls(expected)
 
+    @mock.patch.object(utils, 'get_benchmark_cpus', return_value=[0, 8, 4])
+    @mock.patch.object(cpu, 'run_cpu')
+    @mock.patch('sys.stderr')
+    def test_cpu_perf_eta(self, mock_stderr, mock_run, mock_cpus,
+                          mock_popen, mock_cpu_socket, mock_search_info):
+        # 2 sockets and a CPU of the other core type
+        mock_search_info.return_value = None
+        cpu.cpu_perf(self.hw_data)
+        mock_stderr.write.assert_any_call(
+            'CPU Performance: 3 logical CPU to test (ETA: 40 seconds)\n')
+        self.assertEqual(mock_run.call_count, 4)
+
     def test_get_bogomips(self, mock_popen, mock_cpu_socket, mock_search_info):
         mock_search_info.return_value = 'fake-bogomips'
         hw_data = []
@@ -98,3 +115,118 @@ class TestBenchmarkCPU(unittest.TestCase):
                                            '--cpu-max-prime=15000 run',
                                            shell=True, stdout=subprocess.PIPE)
         self.assertEqual([('cpu', 'logical', 'loops_per_sec', '123')], hw_data)
+
+    def _sysbench(self, events):
+        output = SYSBENCH_OUTPUT.replace('1234', str(events))
+        return mock.Mock(stdout=output.encode().splitlines())
+
+    def test_cpu_perf_parallel(self, mock_popen, mock_cpu_socket,
+                               mock_search_info):
+        mock_cpu_socket.return_value = [0, 8]
+        mock_search_info.return_value = None
+        # calibration alone, calibration together (x2), runs (x2), all CPUs
+        mock_popen.side_effect = [self._sysbench(200), self._sysbench(196),
+                                  self._sysbench(200), self._sysbench(1000),
+                                  self._sysbench(990), self._sysbench(2000)]
+        cpu.cpu_perf(self.hw_data, parallel=True)
+        self.assertEqual(self.hw_data[2:], [
+            ('cpu', 'logical', 'socket_interference', '2.0'),
+            ('cpu', 'logical', 'socket_mode', 'parallel'),
+            ('cpu', 'logical_0', 'loops_per_sec', '100'),
+            ('cpu', 'logical_8', 'loops_per_sec', '99'),
+            ('cpu', 'logical', 'loops_per_sec', '200')])
+        self.assertEqual(mock_popen.call_args_list[3][0][0],
+                         'taskset 0x1 sysbench --max-time=10 '
+                         '--max-requests=10000000 --num-threads=1 '
+                         '--test=cpu --cpu-max-prime=15000 run')
+        self.assertEqual(mock_popen.call_args_list[4][0][0][:13],
+                         'taskset 0x100')
+
+    def test_cpu_perf_interference(self, mock_popen, mock_cpu_socket,
+                                   mock_search_info):
+        mock_cpu_socket.return_value = [0, 8]
+        mock_search_info.return_value = None
+        mock_popen.side_effect = [self._sysbench(200), self._sysbench(150),
+                                  self._sysbench(200), self._sysbench(1000),
+                                  self._sysbench(990), self._sysbench(2000)]
+        cpu.cpu_perf(self.hw_data, parallel=True)
+        self.assertEqual(self.hw_data[2:], [
+            ('cpu', 'logical', 'socket_interference', '25.0'),
+            ('cpu', 'logical', 'socket_mode', 'serial'),
+            ('cpu', 'logical_0', 'loops_per_sec', '100'),
+            ('cpu', 'logical_8', 'loops_per_sec', '99'),
+            ('cpu', 'logical', 'loops_per_sec', '200')])
+
+    def test_cpu_sweep(self, mock_popen, mock_cpu_socket, mock_search_info):
+        topo = [topology.Cpu(0, 0, 0, 0, None, 0),
+                topology.Cpu(1, 0, 1, 0, None, 0),
+                topology.Cpu(2, 0, 0, 0, None, 1),
+                topology.Cpu(3, 0, 1, 0, None, 1),
+                topology.Cpu(4, 1, 0, 1, None, 0),
+                topology.Cpu(5, 1, 1, 1, None, 0)]
+        self.hw_data[0] = ('cpu', 'logical', 'number', 6)
+        # the siblings 2 and 3 run in a second wave
+        mock_popen.side_effect = [self._sysbench(events)
+                                  for events in (500, 495, 500, 500,
+                                                 505, 350)]
+        with mock.patch.object(topology, 'read_topology', return_value=topo):
+            cpu.cpu_sweep(self.hw_data, 10)
+        self.assertEqual(
+            [call[0][0].split()[1] for call in mock_popen.call_args_list],
+            ['0x1', '0x2', '0x10', '0x20', '0x4', '0x8'])
+        self.assertIn('--max-time=5 ', mock_popen.call_args[0][0])
+        self.assertEqual(self.hw_data[2:], [
+            ('cpu', 'logical_0', 'loops_per_sec', '100'),
+            ('cpu', 'logical_1', 'loops_per_sec', '99'),
+            ('cpu', 'logical_2', 'loops_per_sec', '101'),
+            ('cpu', 'logical_3', 'loops_per_sec', '70'),
+            ('cpu', 'logical_4', 'loops_per_sec', '100'),
+            ('cpu', 'logical_5', 'loops_per_sec', '100'),
+            ('cpu', 'physical_0', 'sweep_min', '70'),
+            ('cpu', 'physical_0', 'sweep_max', '101'),
+            ('cpu', 'physical_0', 'sweep_median', '99'),
+            ('cpu', 'physical_0', 'sweep_spread', '31.2'),
+            ('cpu', 'physical_0', 'sweep_outliers', '3'),
+            ('cpu', 'physical_1', 'sweep_min', '100'),
+            ('cpu', 'physical_1', 'sweep_max', '100'),
+            ('cpu', 'physical_1', 'sweep_median', '100'),
+            ('cpu', 'physical_1', 'sweep_spread', '0.0'),
+            ('cpu', 'physical_1', 'sweep_outliers', '')])
+
+    def test_plan_sweep_waves(self, mock_popen, mock_cpu_socket,
+                              mock_search_info):
+        self.assertEqual(cpu.plan_sweep_waves([], 3), [[0], [1], [2]])
+        # without topology, 256 CPUs fit a 60 seconds budget
+        waves = cpu.plan_sweep_waves([], 256, 60)
+        self.assertEqual(len(waves), 60)
+        self.assertEqual(waves[0], [0, 1, 2, 3, 4])
+        self.assertEqual(sorted(sum(waves, [])), list(range(256)))
+
+    @mock.patch.object(cpu, 'run_cpu_parallel')
+    def test_cpu_sweep_budget(self, mock_run, mock_popen, mock_cpu_socket,
+                              mock_search_info):
+        mock_run.side_effect = lambda max_time, cpus, engine: dict(
+            (processor_num, 100) for processor_num in cpus)
+        self.hw_data[0] = ('cpu', 'logical', 'number', 256)
+        cpu.cpu_sweep(self.hw_data, 60)
+        self.assertEqual(mock_run.call_count, 60)
+        self.assertEqual(sum(call[0][0] for call in mock_run.call_args_list),
+                         60)
+
+    def test_summarize_sweep_hybrid(self, mock_popen, mock_cpu_socket,
+                                    mock_search_info):
+        topo = [topology.Cpu(0, 0, 0, 0, topology.PERFORMANCE, 0),
+                topology.Cpu(1, 0, 1, 0, topology.PERFORMANCE, 0),
+                topology.Cpu(2, 0, 8, 0, topology.EFFICIENCY, 0),
+                topology.Cpu(3, 0, 9, 0, topology.EFFICIENCY, 0),
+                topology.Cpu(4, 0, 10, 0, topology.EFFICIENCY, 0)]
+        hw_lst = []
+        # the E-cores are slower but none of them is an outlier
+        cpu.summarize_sweep(hw_lst, {0: 100, 1: 101, 2: 60, 3: 61, 4: 60},
+                            topo)
+        self.assertIn(('cpu', 'physical_0', 'sweep_performance_outliers',
+                       ''), hw_lst)
+        self.assertIn(('cpu', 'physical_0', 'sweep_efficiency_median',
+                       '60'), hw_lst)
+        self.assertIn(('cpu', 'physical_0', 'sweep_efficiency_outliers',
+                       ''), hw_lst)
@@ -15,7 +15,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import json
+import os
+import re
+import shutil
 import subprocess
+import tempfile
 import unittest
 from unittest import mock
 
@@ -50,20 +55,12 @@ FIO_OUTPUT_READ = """{
 
 DISK_PERF_EXPECTED = [
     ('disk', 'fake-disk', 'size', '10'),
-    ('disk', 'fake-disk2', 'size', '15'),
-    ('disk', 'fake-disk', 'standalone_read_1M_KBps', '123456'),
-    ('disk', 'fake-disk', 'standalone_read_1M_IOps', '123'),
-    ('disk', 'fake-disk', 'standalone_randread_4k_KBps', '123456'),
-    ('disk', 'fake-disk', 'standalone_randread_4k_IOps', '123'),
-    ('disk', 'fake-disk', 'standalone_read_1M_KBps', '123456'),
-    ('disk', 'fake-disk', 'standalone_read_1M_IOps', '123'),
-    ('disk', 'fake-disk', 'standalone_randread_4k_KBps', '123456'),
-    ('disk', 'fake-disk', 'standalone_randread_4k_IOps', '123'),
-    ('disk', 'fake-disk', 'simultaneous_read_1M_KBps', '123456'),
-    ('disk', 'fake-disk', 'simultaneous_read_1M_IOps', '123'),
-    ('disk', 'fake-disk', 'simultaneous_randread_4k_KBps', '123456'),
-    ('disk', 'fake-disk', 'simultaneous_randread_4k_IOps', '123'),
-]
+    ('disk', 'fake-disk2', 'size', '15')] + [
+    ('disk', disk_name, '%s_%s' % (test, unit), value)
+    for disk_name in ('fake-disk', 'fake-disk2')
+    for test in ('standalone_read_1M', 'standalone_randread_4k',
+                 'simultaneous_read_1M', 'simultaneous_randread_4k')
+    for unit, value in (('KBps', '123456'), ('IOps', '123'))]
 
 
 @mock.patch.object(subprocess, 'check_output')
@@ -73,22 +70,147 @@ class TestBenchmarkDisk(unittest.TestCase):
         super(TestBenchmarkDisk, self).setUp()
         self.hw_data = [('disk', 'fake-disk', 'size', '10'),
                         ('disk', 'fake-disk2', 'size', '15')]
+        self.job_file = None
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def fake_fio(self, cmd, shell=False):
+        """Report FIO_OUTPUT_READ for each job of the job file."""
+        with open(cmd.split()[-1]) as job_file:
+            self.job_file = job_file.read()
+        job = json.loads(FIO_OUTPUT_READ)['jobs'][0]
+        jobs = []
+        for name in re.findall(r'^\[(.*)\]$', self.job_file, re.M):
+            if name != 'global':
+                jobs.append(dict(job, jobname=name))
+        return json.dumps({'jobs': jobs}).encode('utf-8')
+
+    def _add_disk(self, name, device):
+        path = os.path.join(self.root, 'devices', device)
+        os.makedirs(path)
+        os.makedirs(os.path.join(self.root, 'block', name))
+        os.symlink(path, os.path.join(self.root, 'block', name, 'device'))
 
     def test_disk_perf_bytes(self, mock_check_output):
-        mock_check_output.return_value = FIO_OUTPUT_READ.encode('utf-8')
+        mock_check_output.side_effect = self.fake_fio
         disk.disk_perf(self.hw_data)
         self.assertEqual(sorted(DISK_PERF_EXPECTED), sorted(self.hw_data))
+        # a single fio run and the job file is removed
+        self.assertEqual(mock_check_output.call_count, 1)
+        self.assertFalse(os.path.exists(
+            mock_check_output.call_args[0][0].split()[-1]))
+        # unknown controllers: one disk per standalone group
+        self.assertEqual(self.job_file.count('stonewall'), 6)
 
     def test_get_disks_name(self, mock_check_output):
         result = disk.get_disks_name(self.hw_data)
         self.assertEqual(sorted(['fake-disk', 'fake-disk2']), sorted(result))
 
     def test_run_fio(self, mock_check_output):
-        mock_check_output.return_value = FIO_OUTPUT_READ.encode('utf-8')
+        mock_check_output.side_effect = self.fake_fio
         hw_data = []
         disks_list = ['fake-disk', 'fake-disk2']
         disk.run_fio(hw_data, disks_list, "read", 123, 10, 5)
         self.assertEqual(sorted(
             [('disk', 'fake-disk', 'simultaneous_read_123_KBps', '123456'),
-             ('disk', 'fake-disk', 'simultaneous_read_123_IOps', '123')]),
+             ('disk', 'fake-disk', 'simultaneous_read_123_IOps', '123'),
+             ('disk', 'fake-disk2', 'simultaneous_read_123_KBps', '123456'),
+             ('disk', 'fake-disk2', 'simultaneous_read_123_IOps', '123')]),
             sorted(hw_data))
+
+    @mock.patch.object(disk, 'get_disk_cpus', return_value='0-3,8-11')
+    def test_run_fio_numa(self, mock_disk_cpus, mock_check_output):
+        mock_check_output.side_effect = self.fake_fio
+        disk.run_fio([], ['fake-disk'], "read", "1M", 10, 5)
+        self.assertIn("[standalone_read_1M@fake-disk]\nstonewall\n"
+                      "new_group\nfilename=/dev/fake-disk\nbs=1M\n"
+                      "rw=read\ncpus_allowed=0-3,8-11\n", self.job_file)
+        self.assertIn("ramp_time=5\n", self.job_file)
+        self.assertIn("runtime=10\n", self.job_file)
+
+    def test_controller_waves(self, mock_check_output):
+        self._add_disk('sda', 'pci0000:00/0000:00:17.0/ata1/host0/'
+                       'target0:0:0/0:0:0:0')
+        self._add_disk('sdb', 'pci0000:00/0000:00:17.0/ata2/host1/'
+                       'target1:0:0/1:0:0:0')
+        self._add_disk('nvme0n1', 'pci0000:00/0000:00:1d.0/0000:3d:00.0/'
+                       'nvme/nvme0')
+        self._add_disk('nvme1n1', 'pci0000:00/0000:00:1d.1/0000:3e:00.0/'
+                       'nvme/nvme1')
+        self.assertEqual(disk.get_disk_controller('nvme0n1', self.root),
+                         '0000:3d:00.0')
+        self.assertIsNone(disk.get_disk_controller('vda', self.root))
+        controllers = dict((name, disk.get_disk_controller(name, self.root))
+                           for name in ('sda', 'sdb', 'nvme0n1', 'nvme1n1',
+                                        'vda', 'vdb'))
+        with mock.patch.object(disk, 'get_disk_controller',
+                               side_effect=controllers.get):
+            self.assertEqual(
+                disk.controller_waves(['sda', 'sdb', 'nvme0n1', 'nvme1n1',
+                                       'vda', 'vdb']),
+                [['sda', 'nvme0n1', 'nvme1n1', 'vda'], ['sdb', 'vdb']])
+
+    def fake_fio_sweep(self, cmd, shell=False):
+        """Saturate the disk at 20000 IOPS, the latency follows."""
+        with open(cmd.split()[-1]) as job_file:
+            self.job_file = job_file.read()
+        jobs = []
+        for section in self.job_file.split('\n\n')[1:]:
+            name = section.split('\n')[0].strip('[]')
+            iodepth = re.search(r'^iodepth=(\d+)$', section, re.M).group(1)
+            iops = min(int(iodepth) * 1000, 20000)
+            clat = int(iodepth) * 1e9 / iops
+            job = json.loads(FIO_OUTPUT_READ)['jobs'][0]
+            job['jobname'] = name
+            job['read'].update(
+                iops=float(iops), bw=iops * 4,
+                clat_ns={'mean': clat,
+                         'percentile': {'50.000000': clat,
+                                        '99.000000': clat * 3,
+                                        '99.900000': clat * 5}})
+            jobs.append(job)
+        return json.dumps({'jobs': jobs}).encode('utf-8')
+
+    def test_disk_sweep(self, mock_check_output):
+        mock_check_output.side_effect = self.fake_fio_sweep
+        report = os.path.join(self.root, 'sweep.json')
+        hw_data = [('disk', 'fake-disk', 'size', '10')]
+        disk.disk_sweep(hw_data, block_sizes=('4k',), report_file=report)
+        self.assertIn('group_reporting\n', self.job_file)
+        self.assertIn('percentile_list=50:99:99.9\n', self.job_file)
+        self.assertIn('[sweep_randread_4k_j1_qd256@fake-disk]\nstonewall\n',
+                      self.job_file)
+        self.assertEqual(hw_data[1:6], [
+            ('disk', 'fake-disk', 'sweep_randread_4k_j1_qd1_KBps', '4000'),
+            ('disk', 'fake-disk', 'sweep_randread_4k_j1_qd1_IOps', '1000'),
+            ('disk', 'fake-disk', 'sweep_randread_4k_j1_qd1_clat_p50_usec',
+             '1000.0'),
+            ('disk', 'fake-disk', 'sweep_randread_4k_j1_qd1_clat_p99_usec',
+             '3000.0'),
+            ('disk', 'fake-disk', 'sweep_randread_4k_j1_qd1_clat_p99.9_usec',
+             '5000.0')])
+        self.assertEqual(len(hw_data), 1 + 5 * 5 + 2)
+        # 16 is the last depth adding IOPS without only adding latency
+        self.assertEqual(hw_data[-2:], [
+            ('disk', 'fake-disk', 'sweep_randread_4k_j1_knee_iodepth', '16'),
+            ('disk', 'fake-disk', 'sweep_randread_4k_j1_knee_IOps',
+             '16000')])
+        with open(report) as report_file:
+            self.assertEqual(len(json.load(report_file)['jobs']), 5)
+
+    def test_disk_sweep_runs(self, mock_check_output):
+        mock_check_output.side_effect = self.fake_fio_sweep
+        report = os.path.join(self.root, 'sweep.json')
+        runs = []
+        for _ in range(2):
+            disk.disk_sweep([('disk', 'fake-disk', 'size', '10')],
+                            block_sizes=('4k',), report_file=report,
+                            runs=runs)
+        with open(report) as report_file:
+            jobs = json.load(report_file)['jobs']
+        self.assertEqual([job['run'] for job in jobs], [1] * 5 + [2] * 5)
+
+    def test_find_knee(self, mock_check_output):
+        self.assertEqual(disk.find_knee([(1, 100, 10), (2, 200, 10),
+                                         (4, 210, 19)]), (2, 200, 10))
+        self.assertIsNone(disk.find_knee([(1, 0, 0)]))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+from unittest import mock
+
+from hardware.benchmark import builtin
+from hardware.benchmark import latency
+from hardware.benchmark import mem
+from hardware.benchmark import topology
+
+
+K = 1024
+M = 1024 * 1024
+
+# 32K L1, 1M L2, 16M L3 and memory, with a gradual rise after the L2
+RANDOM = {4 * K: 31, 8 * K: 30, 16 * K: 31, 32 * K: 30, 64 * K: 40,
+          128 * K: 41, 256 * K: 40, 512 * K: 42, 1 * M: 41, 2 * M: 52,
+          4 * M: 66, 8 * M: 65, 16 * M: 66, 32 * M: 150, 64 * M: 160,
+          128 * M: 158}
+# 48K L1 and 2M L2, 3ns apart, behind an overhead of 30ns
+SMALL_STEPS = {4 * K: 30.5, 8 * K: 30.5, 16 * K: 30.5, 32 * K: 30.5,
+               64 * K: 33.5, 128 * K: 33.5, 256 * K: 33.5, 512 * K: 33.5,
+               1 * M: 33.5, 2 * M: 33.5, 4 * M: 45, 8 * M: 45, 16 * M: 45,
+               32 * M: 45, 64 * M: 120, 128 * M: 120}
+
+
+class TestLatency(unittest.TestCase):
+
+    def test_parse_cache_size(self):
+        self.assertEqual(latency.parse_cache_size('512K'), 512 * K)
+        self.assertEqual(latency.parse_cache_size('32 KiB'), 32 * K)
+        self.assertEqual(latency.parse_cache_size('8 MiB (16 instances)'),
+                         512 * K)
+        self.assertEqual(latency.parse_cache_size('1.5 MiB (1 instance)'),
+                         1536 * K)
+        self.assertIsNone(latency.parse_cache_size('unknown size'))
+
+    def test_format_size(self):
+        self.assertEqual(latency.format_size(4 * K), '4K')
+        self.assertEqual(latency.format_size(256 * M), '256M')
+        self.assertEqual(latency.format_size(1024 * M), '1G')
+        self.assertEqual(latency.ladder_sizes(32 * K),
+                         [4 * K, 8 * K, 16 * K, 32 * K])
+
+    def test_detect_levels(self):
+        sizes = sorted(RANDOM)
+        levels = latency.detect_levels(sizes, [RANDOM[size]
+                                               for size in sizes])
+        # the 2M step of the rise to the L3 is not a level
+        self.assertEqual(levels, [(32 * K, 30.5), (1 * M, 41),
+                                  (16 * M, 66), (128 * M, 158)])
+        self.assertEqual(latency.check_caches(levels, [('L1', 48 * K),
+                                                       ('L2', 1 * M),
+                                                       ('L3', 64 * M)]),
+                         [('L1', 1), ('L2', 2), ('L3', None)])
+
+    def test_resolved(self):
+        sizes = sorted(RANDOM)
+        values = [RANDOM[size] for size in sizes]
+        self.assertTrue(latency.resolved(sizes, values, 32 * K))
+        self.assertTrue(latency.resolved(sizes, values, 48 * K))
+        # no step in the L2 plateau, nothing measured above the ladder
+        self.assertFalse(latency.resolved(sizes, values, 128 * K))
+        self.assertFalse(latency.resolved(sizes, values, 512 * M))
+
+    def _ladder(self, random, overhead, caches):
+        latencies = dict((('random', size), value)
+                         for size, value in random.items())
+        latencies.update((('sequential', size), 31) for size in random)
+        hw_lst = [('cpu', 'physical_0', key, value)
+                  for key, value in zip(('l1d cache', 'l2 cache'), caches)]
+        latency.report_ladder(hw_lst, 0, sorted(random), overhead, latencies)
+        return dict((entry[2], entry[3]) for entry in hw_lst)
+
+    def test_small_steps(self):
+        # 1.1 times the latency with the overhead, 7 times without it
+        result = self._ladder(SMALL_STEPS, 30, ('48 KiB', '2 MiB'))
+        self.assertEqual(result['cache_level_1_size'], '32K')
+        self.assertEqual(result['cache_level_1_latency'], '0.5')
+        self.assertEqual(result['cache_level_2_size'], '2M')
+        self.assertEqual(result['cache_L1_check'], 'ok')
+        self.assertEqual(result['cache_L2_check'], 'ok')
+
+    def test_unresolved(self):
+        steps = dict(SMALL_STEPS)
+        steps.update((size, 31.5) for size in (64 * K, 128 * K, 256 * K,
+                                               512 * K, 1 * M, 2 * M))
+        result = self._ladder(steps, 30, ('48 KiB', '2 MiB'))
+        self.assertEqual(result['cache_level_1_size'], '2M')
+        self.assertEqual(result['cache_L1_check'], 'unresolved')
+        self.assertEqual(result['cache_L2_check'], 'ok')
+        # a step too small for a level, but above the resolution
+        steps = dict(SMALL_STEPS)
+        steps.update(((64 * M, 47), (128 * M, 47)))
+        result = self._ladder(steps, 30, ('48 KiB', '32 MiB'))
+        self.assertEqual(result['cache_L2_check'], 'not_detected')
+
+    def test_measure(self):
+        self.assertGreater(latency.measure(8 * K, 'random', hugepages=True,
+                                           loads=64), 0)
+        # 2 lines, the warm-up run is shorter than the unrolled loop
+        self.assertGreater(latency.measure(128, 'sequential', loads=64), 0)
+
+    @mock.patch.object(topology, 'read_topology', return_value=[])
+    @mock.patch.object(mem, 'get_available_memory', return_value=4 * M * K)
+    @mock.patch.object(builtin, 'run_pinned')
+    def test_latency_perf(self, mock_run, mock_mem, mock_topo):
+        latencies = dict((('random', size), value)
+                         for size, value in RANDOM.items())
+        latencies.update((('sequential', size), 31) for size in RANDOM)
+        mock_run.return_value = (30, latencies)
+        hw_lst = [('cpu', 'physical_0', 'l1d cache', '32K'),
+                  ('cpu', 'physical_0', 'l2 cache', '1 MiB (1 instance)'),
+                  ('cpu', 'physical_0', 'l3 cache', '16 MiB (1 instance)'),
+                  ('cpu', 'logical', 'number', 1)]
+        latency.latency_perf(hw_lst, max_size=128 * M)
+        self.assertEqual(mock_run.call_args[0][1], (sorted(RANDOM), False))
+        self.assertEqual(mock_run.call_args[0][2], 0)
+        self.assertIn(('cpu', 'logical_0', 'latency_random_32M', '150.0'),
+                      hw_lst)
+        self.assertEqual(hw_lst[-11:], [
+            ('cpu', 'logical_0', 'cache_level_1_size', '32K'),
+            ('cpu', 'logical_0', 'cache_level_1_latency', '0.5'),
+            ('cpu', 'logical_0', 'cache_level_2_size', '1M'),
+            ('cpu', 'logical_0', 'cache_level_2_latency', '11.0'),
+            ('cpu', 'logical_0', 'cache_level_3_size', '16M'),
+            ('cpu', 'logical_0', 'cache_level_3_latency', '36.0'),
+            ('cpu', 'logical_0', 'memory_latency', '128.0'),
+            ('cpu', 'logical_0', 'cache_L1_check', 'ok'),
+            ('cpu', 'logical_0', 'cache_L2_check', 'ok'),
+            ('cpu', 'logical_0', 'cache_L3_check', 'ok'),
+            ('cpu', 'logical_0', 'prefetch_ratio', '5.1')])
+
+    @mock.patch.object(topology, 'read_topology', return_value=[])
+    @mock.patch.object(mem, 'get_available_memory', return_value=100 * M)
+    @mock.patch.object(builtin, 'run_pinned')
+    def test_latency_perf_small_memory(self, mock_run, mock_mem, mock_topo):
+        mock_run.return_value = (30, dict(
+            ((pattern, size), 31) for pattern in latency.PATTERNS
+            for size in latency.ladder_sizes(32 * M)))
+        hw_lst = [('cpu', 'logical', 'number', 1)]
+        latency.latency_perf(hw_lst)
+        self.assertEqual(mock_run.call_args[0][1][0][-1], 32 * M)
+        self.assertIn(('cpu', 'logical_0', 'memory_latency', '1.0'), hw_lst)
+
+
+if __name__ == "__main__":
+    unittest.main()
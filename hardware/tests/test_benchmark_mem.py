@@ -20,6 +20,7 @@ import unittest
 from unittest import mock
 
 from hardware.benchmark import mem
+from hardware.benchmark import topology
 from hardware.benchmark import utils
 
 
@@ -66,14 +67,12 @@ EXPECTED_RESULT = [
     ('cpu', 'logical', 'threaded_bandwidth_128M', '382'),
     ('cpu', 'logical', 'threaded_bandwidth_1G', '382'),
     ('cpu', 'logical', 'threaded_bandwidth_2G', '382'),
-    ('cpu', 'logical', 'forked_bandwidth_1K', '382'),
-    ('cpu', 'logical', 'forked_bandwidth_4K', '382'),
-    ('cpu', 'logical', 'forked_bandwidth_1M', '382'),
-    ('cpu', 'logical', 'forked_bandwidth_16M', '382'),
-    ('cpu', 'logical', 'forked_bandwidth_128M', '382'),
-    ('cpu', 'logical', 'forked_bandwidth_1G', '382'),
-    ('cpu', 'logical', 'forked_bandwidth_2G', '382')
-]
+] + [('cpu', tag, key % block_size, value)
+     for block_size in ('1K', '4K', '1M', '16M', '128M', '1G', '2G')
+     for tag, key, value in (('logical', 'forked_bandwidth_%s', '764'),
+                             ('logical', 'forked_min_bandwidth_%s', '382'),
+                             ('logical_0', 'forked_bandwidth_%s', '382'),
+                             ('logical_1', 'forked_bandwidth_%s', '382'))]
 
 
 @mock.patch.object(mem, 'get_available_memory')
@@ -83,6 +82,10 @@ class TestBenchmarkMem(unittest.TestCase):
 
     def setUp(self):
         super(TestBenchmarkMem, self).setUp()
+        patcher = mock.patch.object(topology, 'read_topology',
+                                    return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
         self.hw_data = [('cpu', 'logical', 'number', 2),
                         ('cpu', 'physical', 'number', 2)]
 
@@ -119,8 +122,38 @@ class TestBenchmarkMem(unittest.TestCase):
 
         hw_data = []
         mem.run_sysbench_memory_forked(hw_data, 10, '1K', 2)
-        self.assertEqual([('cpu', 'logical', 'forked_bandwidth_1K', '382')],
+        self.assertEqual([('cpu', 'logical', 'forked_bandwidth_1K', '764'),
+                          ('cpu', 'logical', 'forked_min_bandwidth_1K', '382'),
+                          ('cpu', 'logical_0', 'forked_bandwidth_1K', '382'),
+                          ('cpu', 'logical_1', 'forked_bandwidth_1K', '382')],
                          hw_data)
+        # one pinned single-threaded sysbench per CPU, no shell pipeline
+        cmds = sorted(call[0][0] for call in mock_popen.call_args_list)
+        self.assertEqual(len(cmds), 2)
+        self.assertTrue(cmds[0].startswith('taskset -c 0 sysbench '))
+        self.assertTrue(cmds[1].startswith('taskset -c 1 sysbench '))
+        self.assertNotIn('&', cmds[0])
+
+    def test_run_sysbench_memory_forked_slow_worker(self, mock_popen,
+                                                    mock_cpu_socket,
+                                                    mock_get_memory):
+        mock_get_memory.return_value = 123456789012
+        slow = SYSBENCH_OUTPUT.replace('382.24', '120.50')
+
+        def popen(cmd, **kwargs):
+            output = slow if cmd.startswith('taskset -c 1 ') else ''
+            return mock.Mock(stdout=(output or SYSBENCH_OUTPUT).encode()
+                             .splitlines())
+        mock_popen.side_effect = popen
+
+        hw_data = []
+        mem.run_sysbench_memory_forked(hw_data, 10, '1K', 3)
+        self.assertEqual(hw_data[:2],
+                         [('cpu', 'logical', 'forked_bandwidth_1K', '884'),
+                          ('cpu', 'logical', 'forked_min_bandwidth_1K',
+                           '120')])
+        self.assertIn(('cpu', 'logical_1', 'forked_bandwidth_1K', '120'),
+                      hw_data)
 
     def test_run_sysbench_memory_threaded_bytes(self, mock_popen,
                                                 mock_cpu_socket,
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from hardware.benchmark import builtin
+from hardware.benchmark import numa
+
+
+class TestNuma(unittest.TestCase):
+
+    def setUp(self):
+        super(TestNuma, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        # 2 nodes of 2 CPUs and a CPU-less memory node
+        self._write('devices/system/cpu/online', '0-3')
+        self._write('devices/system/node/node0/cpulist', '0-1')
+        self._write('devices/system/node/node1/cpulist', '2-3')
+        self._write('devices/system/node/node2/cpulist', '')
+        self._write('devices/system/node/has_memory', '0-2')
+
+    def test_syscalls(self):
+        self.assertEqual(numa.SET_MEMPOLICY_SYSCALLS,
+                         {'x86_64': 238, 'aarch64': 237, 'ppc64': 261,
+                          'ppc64le': 261, 's390x': 270})
+        # check against the kernel headers when they are installed
+        for machine, header in (
+                ('aarch64', '/usr/include/asm-generic/unistd.h'),
+                ('x86_64', '/usr/include/x86_64-linux-gnu/asm/unistd_64.h'),
+                ('x86_64', '/usr/include/asm/unistd_64.h')):
+            if not os.path.exists(header):
+                continue
+            with open(header) as unistd:
+                res = re.search(r'#define __NR_set_mempolicy (\d+)$',
+                                unistd.read(), re.M)
+            self.assertEqual(numa.SET_MEMPOLICY_SYSCALLS[machine],
+                             int(res.group(1)))
+
+    def _write(self, path, value):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as sysfs:
+            sysfs.write('%s\n' % value)
+
+    def test_node_mask(self):
+        mask, maxnode = numa.node_mask([1])
+        self.assertEqual(mask[0], 2)
+        self.assertEqual(maxnode, len(mask) * 64 + 1)
+        mask, maxnode = numa.node_mask([65])
+        self.assertEqual(list(mask), [0, 2])
+        self.assertEqual(maxnode, 129)
+
+    def test_memory_nodes(self):
+        self.assertEqual(numa.memory_nodes(self.root), [0, 1, 2])
+        self.assertEqual(numa.memory_nodes(os.path.join(self.root, 'no')),
+                         [])
+
+    @mock.patch.object(builtin, 'run_processes')
+    def test_numa_perf(self, mock_run):
+        def run_processes(setup, args, cpus, duration):
+            node, kernel = args[:2]
+            if kernel == builtin.copy_setup:
+                # 1000 MB/s locally, 600 MB/s remotely
+                local = cpus[0] // 2 == node
+                return [(1000 if local else 600) * builtin.MEGABYTE]
+            return [1e7]
+        mock_run.side_effect = run_processes
+        hw_lst = []
+        numa.numa_perf(hw_lst, 1, self.root)
+        self.assertEqual(len(hw_lst), 12)
+        self.assertEqual(hw_lst[:4], [
+            ('numa', 'node_0', 'bandwidth_to_node_0', '1000'),
+            ('numa', 'node_0', 'latency_to_node_0', '100.0'),
+            ('numa', 'node_0', 'bandwidth_to_node_1', '600'),
+            ('numa', 'node_0', 'latency_to_node_1', '100.0')])
+        self.assertIn(('numa', 'node_1', 'bandwidth_to_node_2', '600'),
+                      hw_lst)
+        # the worker of node 1 runs on its first CPU
+        self.assertEqual(mock_run.call_args[0][2], [2])
+
+    @mock.patch.object(builtin, 'run_processes',
+                       side_effect=OSError(errno.EPERM, 'denied'))
+    def test_numa_perf_no_binding(self, mock_run):
+        hw_lst = []
+        numa.numa_perf(hw_lst, 1, self.root)
+        self.assertEqual(hw_lst, [])
+        # every pair is still tried
+        self.assertEqual(mock_run.call_count, 6)
+
+    @mock.patch.object(builtin, 'run_processes')
+    def test_numa_perf_partial_binding(self, mock_run):
+        def run_processes(setup, args, cpus, duration):
+            if args[0] == 1:
+                raise OSError(errno.EINVAL, 'invalid node')
+            return [1000 * builtin.MEGABYTE]
+        mock_run.side_effect = run_processes
+        hw_lst = []
+        numa.numa_perf(hw_lst, 1, self.root)
+        self.assertEqual(len(hw_lst), 8)
+        self.assertIn(('numa', 'node_1', 'bandwidth_to_node_2', '1000'),
+                      hw_lst)
+        self.assertNotIn('bandwidth_to_node_1', [key for _, _, key, _ in
+                                                 hw_lst])
+
+    def test_chase_setup(self):
+        event, loads = builtin.chase_setup(64 * 64, steps=64)
+        self.assertEqual(loads, 64)
+        # the cycle goes through every line and comes back to the first
+        self.assertEqual(event(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from hardware.benchmark import stats
+
+
+class FakeBenchmark(object):
+    """Report the next values of a list on each run."""
+
+    def __init__(self, loops, latencies=None):
+        self.loops = list(loops)
+        self.latencies = list(latencies or [])
+        self.inventories = []
+        self.__name__ = 'fake_perf'
+
+    def __call__(self, hw_lst, burn_test=False):
+        self.inventories.append(list(hw_lst))
+        hw_lst.append(('cpu', 'logical', 'loops_per_sec',
+                       str(self.loops.pop(0))))
+        if self.latencies:
+            hw_lst.append(('cpu', 'logical_0', 'latency_overhead',
+                           self.latencies.pop(0)))
+        hw_lst.append(('cpu', 'logical', 'socket_mode', 'serial'))
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        super(TestStats, self).setUp()
+        self.hw_data = [('cpu', 'logical', 'number', 2)]
+
+    def test_summarize(self):
+        summary = stats.summarize([10, 12, 11, 13, 9])
+        self.assertEqual(summary['median'], 11)
+        self.assertEqual(summary['samples'], 5)
+        self.assertAlmostEqual(summary['stddev'], 1.5811, places=4)
+        # 11 +/- 2.776 * 1.5811 / sqrt(5)
+        self.assertAlmostEqual(summary['ci_low'], 9.037, places=3)
+        self.assertAlmostEqual(summary['ci_high'], 12.963, places=3)
+        self.assertAlmostEqual(summary['error'], 17.84, places=2)
+        self.assertIsNone(stats.summarize([10])['error'])
+        self.assertEqual(stats.t_value(100), stats.T_INFINITY)
+
+    def test_run_once(self):
+        benchmark = FakeBenchmark([1000])
+        self.assertEqual(stats.run_repeated(self.hw_data, benchmark), [])
+        self.assertEqual(self.hw_data[1:], [
+            ('cpu', 'logical', 'loops_per_sec', '1000'),
+            ('cpu', 'logical', 'socket_mode', 'serial')])
+
+    def test_run_repeated(self):
+        benchmark = FakeBenchmark([500, 1000, 1010, 990, 1000],
+                                  ['9.0', '30.1', '30.3', '29.9', '30.1'])
+        self.assertEqual(stats.run_repeated(self.hw_data, benchmark,
+                                            {'burn_test': True},
+                                            repetitions=4, warmup=1), [])
+        # the measurements of a run are not seen by the next ones
+        self.assertEqual(benchmark.inventories, [self.hw_data[:1]] * 5)
+        self.assertEqual(self.hw_data[1:10], [
+            ('cpu', 'logical', 'loops_per_sec', '1000'),
+            ('cpu', 'logical', 'loops_per_sec_median', '1000'),
+            ('cpu', 'logical', 'loops_per_sec_samples', '4'),
+            ('cpu', 'logical', 'loops_per_sec_stddev', '8'),
+            ('cpu', 'logical', 'loops_per_sec_ci95_low', '987'),
+            ('cpu', 'logical', 'loops_per_sec_ci95_high', '1013'),
+            ('cpu', 'logical', 'loops_per_sec_error', '1.3'),
+            ('cpu', 'logical', 'loops_per_sec_stability', 'stable'),
+            ('cpu', 'logical_0', 'latency_overhead', '30.1')])
+        self.assertEqual(self.hw_data[-1],
+                         ('cpu', 'logical', 'socket_mode', 'serial'))
+
+    def test_unstable(self):
+        benchmark = FakeBenchmark([1000, 600, 1400])
+        self.assertEqual(stats.run_repeated(self.hw_data, benchmark,
+                                            repetitions=3),
+                         [('cpu', 'logical', 'loops_per_sec')])
+        self.assertIn(('cpu', 'logical', 'loops_per_sec_stability',
+                       'unstable'), self.hw_data)
+
+    def test_mean(self):
+        # the confidence interval is the one of the reported value
+        benchmark = FakeBenchmark([100, 100, 130])
+        stats.run_repeated(self.hw_data, benchmark, repetitions=3)
+        self.assertEqual(self.hw_data[1:7], [
+            ('cpu', 'logical', 'loops_per_sec', '110'),
+            ('cpu', 'logical', 'loops_per_sec_median', '100'),
+            ('cpu', 'logical', 'loops_per_sec_samples', '3'),
+            ('cpu', 'logical', 'loops_per_sec_stddev', '17'),
+            ('cpu', 'logical', 'loops_per_sec_ci95_low', '67'),
+            ('cpu', 'logical', 'loops_per_sec_ci95_high', '153')])
+
+    def test_target_error(self):
+        # noisy first runs, then the error shrinks below 5%
+        benchmark = FakeBenchmark([1000, 900, 1100] + [1000] * 9)
+        stats.run_repeated(self.hw_data, benchmark, repetitions=3,
+                           target_error=5.0)
+        samples = int(dict((entry[2], entry[3])
+                           for entry in self.hw_data)['loops_per_sec_samples'])
+        self.assertEqual(samples, 8)
+        self.assertEqual(len(benchmark.loops), 12 - samples)
+        self.assertIn(('cpu', 'logical', 'loops_per_sec_stability',
+                       'stable'), self.hw_data)
+
+    def test_target_error_not_reached(self):
+        benchmark = FakeBenchmark([1000, 500] * 10)
+        self.assertEqual(stats.run_repeated(self.hw_data, benchmark,
+                                            repetitions=2, target_error=1.0,
+                                            max_repetitions=6),
+                         [('cpu', 'logical', 'loops_per_sec')])
+        self.assertEqual(len(benchmark.loops), 14)
+
+    def test_max_repetitions(self):
+        # the repetitions do not raise the limit of a target error
+        benchmark = FakeBenchmark([1000, 500] * 10)
+        stats.run_repeated(self.hw_data, benchmark, repetitions=10,
+                           target_error=1.0, max_repetitions=6)
+        self.assertEqual(len(benchmark.loops), 14)
+        # without a target error, all the repetitions are run
+        benchmark = FakeBenchmark([1000, 500] * 10)
+        stats.run_repeated([], benchmark, repetitions=10, max_repetitions=6)
+        self.assertEqual(len(benchmark.loops), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
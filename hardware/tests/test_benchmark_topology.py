@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from hardware.benchmark import topology
+from hardware.benchmark import utils
+
+
+class TestTopology(unittest.TestCase):
+
+    def setUp(self):
+        super(TestTopology, self).setUp()
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestTopology, self).tearDown()
+        shutil.rmtree(self.root)
+
+    def _write(self, path, value):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as sysfs:
+            sysfs.write('%s\n' % value)
+
+    def _add_cpu(self, cpu, package, core, siblings):
+        topo = 'devices/system/cpu/cpu%d/topology/' % cpu
+        self._write(topo + 'physical_package_id', package)
+        self._write(topo + 'core_id', core)
+        self._write(topo + 'thread_siblings_list', siblings)
+
+    def _two_sockets(self):
+        # 2 sockets of 2 cores with 2 threads, the siblings numbered last
+        self._write('devices/system/cpu/online', '0-7')
+        for cpu in range(8):
+            package = (cpu % 4) // 2
+            core = cpu % 2
+            first = cpu % 4
+            self._add_cpu(cpu, package, core, '%d,%d' % (first, first + 4))
+        self._write('devices/system/node/node0/cpulist', '0-1,4-5')
+        self._write('devices/system/node/node1/cpulist', '2-3,6-7')
+        return topology.read_topology(self.root)
+
+    def test_cpu_list(self):
+        self.assertEqual(topology.parse_cpu_list('0-2,8,10-11\n'),
+                         [0, 1, 2, 8, 10, 11])
+        self.assertEqual(topology.parse_cpu_list(''), [])
+        self.assertEqual(topology.format_cpu_list([11, 0, 1, 2, 8, 10]),
+                         '0-2,8,10-11')
+
+    def test_two_sockets(self):
+        topo = self._two_sockets()
+        self.assertEqual(topo[6], topology.Cpu(cpu=6, package=1, core=0,
+                                               node=1, core_type=None,
+                                               thread=1))
+        self.assertEqual(topology.per_socket(topo), {0: 0, 1: 2})
+        self.assertEqual(topology.per_node(topo), {0: 0, 1: 2})
+        self.assertEqual(topology.per_core_type(topo), {})
+        self.assertEqual(topology.smt_siblings(topo),
+                         [[0, 4], [1, 5], [2, 6], [3, 7]])
+        self.assertEqual(topology.node_cpus(topo, 1), [2, 3, 6, 7])
+        self.assertEqual(topology.spread(topo, 5), [0, 1, 2, 3, 4])
+
+    def test_hybrid(self):
+        self._write('devices/system/cpu/online', '0-5')
+        self._add_cpu(0, 0, 0, '0-1')
+        self._add_cpu(1, 0, 0, '0-1')
+        for cpu in range(2, 6):
+            self._add_cpu(cpu, 0, cpu * 4, cpu)
+        self._write('devices/cpu_core/cpus', '0-1')
+        self._write('devices/cpu_atom/cpus', '2-5')
+        topo = topology.read_topology(self.root)
+        self.assertEqual(topology.per_core_type(topo),
+                         {'efficiency': 2, 'performance': 0})
+        self.assertEqual(topology.per_socket(topo), {0: 0})
+
+    def test_big_little(self):
+        self._write('devices/system/cpu/online', '0-3')
+        for cpu in range(4):
+            self._add_cpu(cpu, 0, cpu, cpu)
+            self._write('devices/system/cpu/cpu%d/cpu_capacity' % cpu,
+                        1024 if cpu >= 2 else 446)
+        topo = topology.read_topology(self.root)
+        self.assertEqual(topology.per_core_type(topo),
+                         {'efficiency': 0, 'performance': 2})
+        # the big cores are preferred to represent the socket
+        self.assertEqual(topology.per_socket(topo), {0: 2})
+
+    def test_device_node(self):
+        self._write('devices/pci0000:80/0000:80:01.0/numa_node', 1)
+        self._write('devices/pci0000:00/0000:00:17.0/numa_node', -1)
+        self.assertEqual(topology.device_node(os.path.join(
+            self.root, 'devices/pci0000:80/0000:80:01.0')), 1)
+        self.assertIsNone(topology.device_node(os.path.join(
+            self.root, 'devices/pci0000:00/0000:00:17.0')))
+        self.assertIsNone(topology.device_node(os.path.join(
+            self.root, 'missing')))
+
+    def test_no_sysfs(self):
+        self.assertEqual(topology.read_topology(self.root), [])
+
+    def test_benchmark_cpus(self):
+        topo = self._two_sockets()
+        with mock.patch.object(topology, 'read_topology',
+                               return_value=topo) as mock_read:
+            # CPU numbers, not package ids
+            self.assertEqual(utils.get_one_cpu_per_socket([]), [0, 2])
+            mock_read.reset_mock()
+            self.assertEqual(utils.get_benchmark_cpus([], per_node=True),
+                             [0, 2])
+            mock_read.assert_called_once_with()
+        with mock.patch.object(topology, 'read_topology', return_value=[]):
+            self.assertEqual(utils.get_one_cpu_per_socket(
+                [('cpu', 'logical', 'number', '2')]), [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
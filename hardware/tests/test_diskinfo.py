@@ -12,7 +12,10 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+import shutil
 import sys
+import tempfile
 import unittest
 from unittest import mock
 
@@ -30,40 +33,134 @@ class TestDiskinfo(unittest.TestCase):
     def test_sizeingb(self):
         return self.assertEqual(diskinfo.sizeingb(977105060), 500)
 
-    def test_parse_hdparm_output(self):
-        return self.assertEqual(
-            diskinfo.parse_hdparm_output(
-                '\n/dev/sda:\n Timing buffered disk reads: 1436 MB '
-                'in  3.00 seconds = 478.22 MB/sec'),
-            478.22)
-
-    def test_parse_hdparm_output2(self):
-        return self.assertEqual(
-            diskinfo.parse_hdparm_output(
-                '\n/dev/sdc:\n Timing buffered disk reads:  30 MB '
-                'in  3.01 seconds =   9.97 MB/sec\n'),
-            9.97)
-
-    @mock.patch('{}.open'.format(builtin_module_name), create=True)
-    @mock.patch('os.path.exists', return_value=True)
-    def test_get_disk_info(self, mock_os_path_exists, mock_open):
-        fake_disk_values = ['Cyberdyne Systems', 'T1000', '0x00', '0',
-                            '512', '0', '1023', '[none]']
-        mock_open.side_effect = [
-            mock.mock_open(read_data=fake_value).return_value
-            for fake_value in fake_disk_values]
+    def test_percentile(self):
+        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+        self.assertEqual(diskinfo.percentile(values, 50), 5)
+        self.assertEqual(diskinfo.percentile(values, 99), 10)
+        self.assertEqual(diskinfo.percentile([], 50), 0.0)
+
+    def test_probe_throughput_file(self):
+        with tempfile.NamedTemporaryFile() as probe_file:
+            probe_file.write(os.urandom(1024 * 1024))
+            probe_file.flush()
+            result = diskinfo.probe_throughput(probe_file.name,
+                                               duration=0.05,
+                                               block_size=64 * 1024)
+        self.assertGreater(result['reads'], 0)
+        self.assertGreater(result['MBps'], 0)
+        self.assertEqual(result['block_size'], 64 * 1024)
+        self.assertLessEqual(result['latency_p50_ms'],
+                             result['latency_p99_ms'])
+        self.assertLessEqual(result['latency_p99_ms'],
+                             result['latency_max_ms'])
+
+    def test_probe_throughput_bad_block_size(self):
+        self.assertRaises(ValueError, diskinfo.probe_throughput,
+                          '/dev/null', 1, 1000)
+
+    @mock.patch.object(diskinfo, 'probe_throughput')
+    def test_diskperfs(self, mock_probe):
+        mock_probe.side_effect = [
+            {'MBps': 478.22, 'latency_p50_ms': 2.0, 'latency_p90_ms': 2.5,
+             'latency_p99_ms': 3.25, 'latency_max_ms': 4.0},
+            OSError(2, 'No device')]
+        hw = []
+        diskinfo.diskperfs(['sda', '/tmp/missing'], hw)
+        self.assertEqual(hw, [('disk', 'sda', 'read_MBps', '478.2'),
+                              ('disk', 'sda', 'read_latency_p50_ms', '2.000'),
+                              ('disk', 'sda', 'read_latency_p90_ms', '2.500'),
+                              ('disk', 'sda', 'read_latency_p99_ms', '3.250'),
+                              ('disk', 'sda', 'read_latency_max_ms', '4.000')])
+        mock_probe.assert_has_calls([
+            mock.call('/dev/sda', diskinfo.PROBE_DURATION,
+                      diskinfo.PROBE_BLOCK_SIZE),
+            mock.call('/tmp/missing', diskinfo.PROBE_DURATION,
+                      diskinfo.PROBE_BLOCK_SIZE)])
+
+    @mock.patch.object(diskinfo, 'probe_throughput')
+    def test_probe_disks_parallel(self, mock_probe):
+        mock_probe.return_value = {'MBps': 100.0}
+        self.assertEqual(diskinfo.probe_disks(['sda', 'sdb'], parallel=True),
+                         {'sda': {'MBps': 100.0}, 'sdb': {'MBps': 100.0}})
+        self.assertEqual(mock_probe.call_count, 2)
+
+
+class TestBlockInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.block = os.path.join(self.root, 'block')
+        self._write('block/sda/size', '977105060')
+        self._write('block/sda/queue/read_ahead_kb', '128')
+        self._write('block/sda/queue/rotational', '1')
+        self._write('block/sda/queue/scheduler', 'none [mq-deadline]')
+        self._write('block/sda/queue/write_cache', 'write back')
+        self._write('devices/host0/sda/vendor', 'ATA     ')
+        self._write('devices/host0/sda/model', 'ST3000DM001')
+        self._write('devices/host0/sda/rev', 'CC4C')
+        os.symlink(os.path.join(self.root, 'devices/host0/sda'),
+                   os.path.join(self.block, 'sda/device'))
+        for hctx in ('0', '1'):
+            os.makedirs(os.path.join(self.block, 'sda/mq', hctx))
+        self._write('block/sda/sda1/partition', '1')
+        self._write('block/sda/sda2/partition', '2')
+        self._write('block/sda/holders/dm-0', '')
+        os.makedirs(os.path.join(self.block, 'sda/slaves'))
+        self._write('block/dm-0/size', '1000')
+        self._write('block/dm-0/dm/name', 'mpatha')
+        self._write('block/dm-0/dm/uuid', 'mpath-3600508b1001c')
+        self._write('block/dm-0/slaves/sda', '')
+        self._write('block/nvme0n1/size', '500118192')
+        self._write('devices/nvme0/model', 'Samsung SSD 950 PRO')
+        os.symlink(os.path.join(self.root, 'devices/nvme0'),
+                   os.path.join(self.block, 'nvme0n1/device'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, path, value):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as sysfs_file:
+            sysfs_file.write(value + '\n')
+
+    def test_walk_block_devices(self):
+        tree = diskinfo.walk_block_devices(self.block)
+        self.assertEqual(sorted(tree), ['dm-0', 'nvme0n1', 'sda'])
+        self.assertEqual(tree['sda']['size'], 977105060)
+        self.assertEqual(tree['sda']['partitions'], ['sda1', 'sda2'])
+        self.assertEqual(tree['sda']['holders'], ['dm-0'])
+        self.assertEqual(tree['sda']['nr_hw_queues'], 2)
+        self.assertEqual(tree['dm-0']['slaves'], ['sda'])
+        self.assertEqual(tree['nvme0n1']['controller'], 'nvme0')
+        self.assertEqual(tree['nvme0n1']['device'],
+                         {'model': 'Samsung SSD 950 PRO'})
+        self.assertEqual(diskinfo.block_device_type('dm-0', tree['dm-0']),
+                         'multipath')
+
+    def test_get_block_info(self):
+        tree = diskinfo.walk_block_devices(self.block)
+        hw = []
+        diskinfo.get_block_info('sda', tree['sda'], hw)
+        self.assertEqual(hw, [('disk', 'sda', 'vendor', 'ATA'),
+                              ('disk', 'sda', 'model', 'ST3000DM001'),
+                              ('disk', 'sda', 'rev', 'CC4C'),
+                              ('disk', 'sda', 'read_ahead_kb', '128'),
+                              ('disk', 'sda', 'rotational', '1'),
+                              ('disk', 'sda', 'scheduler', 'mq-deadline'),
+                              ('disk', 'sda', 'write_cache', 'write back'),
+                              ('disk', 'sda', 'nr_hw_queues', '2'),
+                              ('disk', 'sda', 'partitions', 'sda1 sda2'),
+                              ('disk', 'sda', 'holders', 'dm-0')])
+
+    def test_get_block_devices_info(self):
+        tree = diskinfo.walk_block_devices(self.block)
         hw = []
-        sizes = {'fake': 100}
-        diskinfo.get_disk_info('fake', sizes, hw)
-        self.assertEqual(hw, [('disk', 'fake', 'size', '100'),
-                              ('disk', 'fake', 'vendor', 'Cyberdyne Systems'),
-                              ('disk', 'fake', 'model', 'T1000'),
-                              ('disk', 'fake', 'rev', '0x00'),
-                              ('disk', 'fake', 'optimal_io_size', '0'),
-                              ('disk', 'fake', 'physical_block_size', '512'),
-                              ('disk', 'fake', 'rotational', '0'),
-                              ('disk', 'fake', 'nr_requests', '1023'),
-                              ('disk', 'fake', 'scheduler', 'none')])
+        diskinfo.get_block_devices_info(tree, hw)
+        self.assertEqual(hw, [('block', 'dm-0', 'type', 'multipath'),
+                              ('block', 'dm-0', 'dm_name', 'mpatha'),
+                              ('block', 'dm-0', 'slaves', 'sda')])
 
 
 if __name__ == "__main__":
@@ -128,6 +128,75 @@ Error: Syntax error at "force"
             CTRL_LD_SHOW_RESULT2
         )
 
+    def test_parse_ctrl_all_show_config_detail(self):
+        controllers = hpacucli.parse_ctrl_all_show_config_detail(
+            sample('hpacucli_config_detail'))
+        self.assertEqual(len(controllers), 1)
+        ctrl = controllers[0]
+        self.assertEqual(ctrl['slot'], 2)
+        self.assertEqual(ctrl['name'], 'Smart Array P420')
+        self.assertEqual(ctrl['info']['serial_number'], 'PDKRH0ARH4F1R6')
+        self.assertEqual(ctrl['info']['location'], 'ASIC')
+        self.assertEqual(ctrl['info']['current_value_c'], '60')
+        self.assertNotIn('slot', ctrl['info'])
+        self.assertNotIn('port_id', ctrl['info'])
+        self.assertNotIn('drive_bays', ctrl['info'])
+        self.assertEqual([disk for disk, _ in ctrl['physical_drives']],
+                         ['2I:1:7', '2I:1:8', '1I:1:1'])
+        self.assertEqual(ctrl['physical_drives'][0][1], CTRL_PD_SHOW_RESULT)
+        self.assertNotIn('array', ctrl['physical_drives'][2][1])
+        self.assertEqual(len(ctrl['logical_drives']), 1)
+        ldrive, info = ctrl['logical_drives'][0]
+        self.assertEqual(ldrive, '1')
+        self.assertEqual(info['array'], 'A')
+        self.assertEqual(info['size'], '93.1 GB')
+        self.assertEqual(info['disk_name'], '/dev/sda')
+
+
+@mock.patch('os.system')
+@mock.patch.object(hpacucli, '_cli_path', return_value='/usr/sbin/ssacli')
+class TestDetect(unittest.TestCase):
+
+    @mock.patch.object(hpacucli.detect_utils, 'cmd',
+                       return_value=(0, sample('hpacucli_config_detail')))
+    def test_detect_config_detail(self, mock_cmd, mock_path, mock_system):
+        hwlist = hpacucli.detect()
+        mock_cmd.assert_called_once_with(
+            '/usr/sbin/ssacli ctrl all show config detail')
+        self.assertEqual(hwlist[0], ('hpa', 'slots', 'count', '1'))
+        self.assertIn(('hpa', 'slot_2', 'firmware_version', '8.32'), hwlist)
+        self.assertIn(('disk', '2I:1:7', 'type', 'Solid State SATA'),
+                      hwlist)
+        self.assertIn(('disk', '2I:1:7', 'slot', '2'), hwlist)
+        self.assertIn(('disk', '2I:1:7', 'array', 'A'), hwlist)
+        self.assertIn(('disk', '1I:1:1', 'size', '1000'), hwlist)
+        self.assertEqual(hwlist[-2:], [('disk', 'hpa', 'size', '1200.00'),
+                                       ('disk', 'hpa', 'count', '3')])
+
+    @mock.patch.object(hpacucli.detect_utils, 'cmd')
+    def test_detect_config_detail_type(self, mock_cmd, mock_path,
+                                       mock_system):
+        # the type is the one of 'pd all show', not the interface type
+        mock_cmd.return_value = (0, sample('hpacucli_config_detail').replace(
+            'bay 7, Solid State SATA,', 'bay 7, SATA SSD,'))
+        hwlist = hpacucli.detect()
+        self.assertIn(('disk', '2I:1:7', 'type', 'SATA SSD'), hwlist)
+        self.assertIn(('disk', '2I:1:7', 'interface_type',
+                       'Solid State SATA'), hwlist)
+
+    @mock.patch.object(hpacucli.detect_utils, 'cmd',
+                       return_value=(1, 'Error: No controllers detected.'))
+    def test_detect_config_detail_error(self, mock_cmd, mock_path,
+                                        mock_system):
+        self.assertEqual(hpacucli.detect(), [])
+
+    @mock.patch.object(hpacucli, 'detect_interactive', return_value=['cli'])
+    @mock.patch.object(hpacucli.detect_utils, 'cmd',
+                       return_value=(2, 'Invalid command.'))
+    def test_detect_fallback(self, mock_cmd, mock_interactive, mock_path,
+                             mock_system):
+        self.assertEqual(hpacucli.detect(), ['cli'])
+
 
 class TestController(unittest.TestCase):
 
@@ -12,6 +12,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+import shutil
+import tempfile
 import unittest
 from unittest import mock
 
@@ -47,6 +50,75 @@ class TestInfiniband(unittest.TestCase):
                           'state': 'Down'})
 
 
+class TestInfinibandSysfs(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for path, value in SYSFS_MLX4.items():
+            self._write('mlx4_0/' + path, value)
+        # a RoCE card is not an Infiniband card
+        self._write('mlx5_0/fw_ver', '16.27.2008')
+        self._write('mlx5_0/ports/1/link_layer', 'Ethernet')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, path, value):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as sysfs_file:
+            sysfs_file.write(value + '\n')
+
+    def test_sysfs_global_info(self):
+        self.assertEqual(hardware.infiniband.ib_sysfs_global_info(
+            os.path.join(self.root, 'mlx4_0')),
+            {'node_guid': '0x0002c9030056b9e6',
+             'sys_guid': '0x0002c9030056b9e9',
+             'fw_ver': '2.9.1000',
+             'device_type': 'MT26428',
+             'hw_ver': 'b0',
+             'nb_ports': '2'})
+
+    def test_sysfs_port_info(self):
+        self.assertEqual(hardware.infiniband.ib_sysfs_port_info(
+            os.path.join(self.root, 'mlx4_0', 'ports', '2')),
+            {'base_lid': '0',
+             'lmc': '0',
+             'physical_state': 'Polling',
+             'port_guid': '0x0002c903005a7b7e',
+             'rate': '10',
+             'sm_lid': '0',
+             'state': 'Down'})
+
+    @mock.patch.object(hardware.infiniband, 'cmd')
+    def test_detect(self, cmd_mock):
+        hw_lst = hardware.infiniband.detect(self.root)
+        cmd_mock.assert_not_called()
+        self.assertEqual(hw_lst[:7], [
+            ('infiniband', 'card0', 'card_type', 'mlx4_0'),
+            ('infiniband', 'card0', 'device_type', 'MT26428'),
+            ('infiniband', 'card0', 'fw_version', '2.9.1000'),
+            ('infiniband', 'card0', 'hw_version', 'b0'),
+            ('infiniband', 'card0', 'nb_ports', '2'),
+            ('infiniband', 'card0', 'sys_guid', '0x0002c9030056b9e9'),
+            ('infiniband', 'card0', 'node_guid', '0x0002c9030056b9e6')])
+        self.assertIn(('infiniband', 'card0_port1', 'state', 'Active'),
+                      hw_lst)
+        self.assertIn(('infiniband', 'card0_port1', 'rate', '40'), hw_lst)
+        self.assertIn(('infiniband', 'card0_port1', 'base_lid', '26'),
+                      hw_lst)
+        self.assertIn(('infiniband', 'card0_port1',
+                       'counter/port_xmit_data', 123456789), hw_lst)
+        self.assertIn(('infiniband', 'card0_port2', 'state', 'Down'),
+                      hw_lst)
+        self.assertNotIn('mlx5_0', [entry[3] for entry in hw_lst])
+
+    def test_detect_no_card(self):
+        self.assertEqual(hardware.infiniband.detect(
+            os.path.join(self.root, 'missing')), [])
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -72,4 +144,30 @@ Capability mask: 0x02510868
 Port GUID: 0x0002c903005a7b7e
 '''
 
+SYSFS_MLX4 = {
+    'hca_type': 'MT26428',
+    'fw_ver': '2.9.1000',
+    'hw_rev': 'b0',
+    'node_guid': '0002:c903:0056:b9e6',
+    'sys_image_guid': '0002:c903:0056:b9e9',
+    'ports/1/state': '4: ACTIVE',
+    'ports/1/phys_state': '5: LinkUp',
+    'ports/1/rate': '40 Gb/sec (4X QDR)',
+    'ports/1/lid': '0x1a',
+    'ports/1/lid_mask_count': '0',
+    'ports/1/sm_lid': '0x1',
+    'ports/1/link_layer': 'InfiniBand',
+    'ports/1/gids/0': 'fe80:0000:0000:0000:0002:c903:005a:7b7d',
+    'ports/1/counters/port_xmit_data': '123456789',
+    'ports/1/counters/port_rcv_data': '987654321',
+    'ports/2/state': '1: DOWN',
+    'ports/2/phys_state': '2: Polling',
+    'ports/2/rate': '10 Gb/sec (4X)',
+    'ports/2/lid': '0x0',
+    'ports/2/lid_mask_count': '0',
+    'ports/2/sm_lid': '0x0',
+    'ports/2/link_layer': 'InfiniBand',
+    'ports/2/gids/0': 'fe80:0000:0000:0000:0002:c903:005a:7b7e',
+}
+
 # test_infiniband.py ends here
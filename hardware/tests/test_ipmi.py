@@ -12,9 +12,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
+from hardware import detect_utils
 from hardware import ipmi
+from hardware import openipmi
 from hardware.tests.results import ipmi_results
 from hardware.tests.utils import sample
 
@@ -28,3 +34,126 @@ class TestIpmi(unittest.TestCase):
         res = []
         ipmi.parse_lan_info(sample('ipmi_lan_info'), res)
         self.assertEqual(len(res), 19)
+
+
+class FakeIpmitool(object):
+    """Answer the ipmitool commands used by the SDR cache."""
+
+    def __init__(self):
+        self.addition = '07/23/2021 10:12:03'
+        self.commands = []
+
+    def cmd(self, cmdline):
+        self.commands.append(cmdline)
+        if cmdline == 'ipmitool mc info':
+            return 0, MC_INFO
+        if cmdline == 'ipmitool sdr info':
+            return 0, SDR_INFO % self.addition
+        if cmdline.startswith('ipmitool sdr dump '):
+            with open(cmdline.split(' ', 3)[3], 'w') as dump:
+                dump.write('SDR')
+            return 0, 'Dumping Sensor Data Repository to \'file\'\n'
+        if ' sensor reading ' in cmdline:
+            return 1, SENSOR_READING
+        raise AssertionError(cmdline)
+
+    def output_lines(self, cmdline):
+        self.commands.append(cmdline)
+        return sample('parse_ipmi_sdr').split('\n')
+
+
+class TestIpmiSdrCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dump_file = os.path.join(self.tmpdir, 'cache', 'sdr.dump')
+        self.ipmitool = FakeIpmitool()
+        patcher = mock.patch.multiple(
+            detect_utils, cmd=self.ipmitool.cmd,
+            output_lines=self.ipmitool.output_lines)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _dumps(self):
+        return [command for command in self.ipmitool.commands
+                if command.startswith('ipmitool sdr dump')]
+
+    def test_get_sdr_stamp(self):
+        self.assertEqual(ipmi.get_sdr_stamp(),
+                         {'firmware': '1.61',
+                          'count': '92',
+                          'addition': '07/23/2021 10:12:03',
+                          'erase': 'Not Available'})
+
+    def test_cached_sdr(self):
+        hw = ipmi.get_ipmi_sdr_cached(self.dump_file)
+        self.assertEqual(hw, ipmi_results.IPMI_SDR_RESULT)
+        self.assertEqual(len(self._dumps()), 1)
+        self.assertIn('ipmitool -S %s sdr' % self.dump_file,
+                      self.ipmitool.commands)
+        # same stamp, the dump is reused
+        self.assertEqual(ipmi.get_ipmi_sdr_cached(self.dump_file), hw)
+        self.assertEqual(len(self._dumps()), 1)
+        # a new SDR record changes the stamp
+        self.ipmitool.addition = '08/01/2021 08:00:00'
+        ipmi.get_ipmi_sdr_cached(self.dump_file)
+        self.assertEqual(len(self._dumps()), 2)
+
+    def test_refresh(self):
+        self.assertIsNone(ipmi.refresh_ipmi_sdr(self.dump_file))
+        ipmi.get_ipmi_sdr_cached(self.dump_file)
+        self.ipmitool.commands = []
+        hw = ipmi.refresh_ipmi_sdr(self.dump_file)
+        self.assertEqual(len(self.ipmitool.commands), 1)
+        self.assertIn("sensor reading 'UID Light' 'Sys. Health LED'",
+                      self.ipmitool.commands[0])
+        self.assertEqual(hw[:5],
+                         [('ipmi', 'UID Light', 'value', '0x0'),
+                          ('ipmi', 'Sys. Health LED', 'value', '0x0'),
+                          ('ipmi', 'Power Supply 1', 'value', '95'),
+                          ('ipmi', 'Power Supply 1', 'unit', 'Watts'),
+                          ('ipmi', 'Power Supply 2', 'value',
+                           'Not Readable')])
+
+    @mock.patch.object(openipmi, 'find_device', return_value=None)
+    def test_sampler(self, mock_device):
+        sampler = ipmi.IpmiSampler(frequency=2, dump_file=self.dump_file)
+        sampler.sample()
+        self.assertEqual(sampler.report()[2:], [])
+        ipmi.get_ipmi_sdr_cached(self.dump_file)
+        self.ipmitool.commands = []
+        sampler.sample()
+        sampler.sample()
+        sampler.stop()
+        # only the readings are polled, the SDR is not read again
+        self.assertEqual(len(self.ipmitool.commands), 2)
+        self.assertEqual(sampler.report(), [
+            ('ipmi', 'sampling', 'samples', '3'),
+            ('ipmi', 'sampling', 'interval', '0.5'),
+            ('ipmi', 'Power Supply 1', 'value_min', '95'),
+            ('ipmi', 'Power Supply 1', 'value_max', '95'),
+            ('ipmi', 'Power Supply 1', 'value_avg', '95')])
+
+
+MC_INFO = """Device ID                 : 17
+Device Revision           : 1
+Firmware Revision         : 1.61
+IPMI Version              : 2.0
+Aux Firmware Rev Info     :
+    0x00
+"""
+
+SDR_INFO = """SDR Version                         : 0x51
+Record Count                        : 92
+Free Space                          : 10364 bytes
+Most recent Addition                : %s
+Most recent Erase                   : Not Available
+"""
+
+SENSOR_READING = """UID Light        | 0x0
+Sys. Health LED  | 0x0
+Power Supply 1   | 95
+"""
@@ -0,0 +1,95 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import re
+import unittest
+
+from hardware import kvparser
+
+
+class TestKVParser(unittest.TestCase):
+
+    def test_title_key(self):
+        self.assertEqual(kvparser.title_key('serial no'), 'SerialNo')
+
+    def test_default(self):
+        parser = kvparser.KVParser()
+        self.assertEqual(parser.parse('Name : disk\n'
+                                      'Time : 10:20\n'
+                                      'no separator\n'),
+                         {'Name': 'disk'})
+
+    def test_first(self):
+        parser = kvparser.KVParser(first=True)
+        self.assertEqual(parser.items('Time : 10:20'), [('Time', '10:20')])
+
+    def test_literal(self):
+        parser = kvparser.KVParser(sep=': ', strip=False)
+        self.assertEqual(parser.items('  Model: X: Y\n  Status: OK '),
+                         [('  Status', 'OK ')])
+
+    def test_values(self):
+        parser = kvparser.KVParser(key=kvparser.title_key, int_values=True,
+                                   strip_dot=True, units=('GB', ' C'))
+        self.assertEqual(parser.items('raid level : 5\n'
+                                      'size : 100 GB\n'
+                                      'temperature : 27 C\n'
+                                      'version : 1.2.\n'
+                                      'count : -1\n'
+                                      'state : 0x10'),
+                         [('RaidLevel', 5),
+                          ('Size', 100),
+                          ('Size/unit', 'GB'),
+                          ('Temperature', 27),
+                          ('Temperature/unit', 'C'),
+                          ('Version', '1.2'),
+                          ('Count', -1),
+                          ('State', '0x10')])
+
+    def test_sections(self):
+        parser = kvparser.KVParser(
+            skip='Noise',
+            section=(re.compile(r'Enclosure#(\d+)'),
+                     lambda match: 'enc%s/' % match.group(1)))
+        self.assertEqual(parser.items('Name : ctrl\n'
+                                      'Noise : x\n'
+                                      'Enclosure#1 : \n'
+                                      'Name : enc'),
+                         [('Name', 'ctrl'), ('enc1/Name', 'enc')])
+        self.assertEqual(parser.parse('A : 1\nA : 2', reverse=True),
+                         {'A': '1'})
+
+    def test_filters(self):
+        parser = kvparser.KVParser(
+            key=lambda key: key.lower() if key != 'Skip' else None,
+            value=lambda value: value or None,
+            keymap={'state': ('state', 'physical_state'), 'rate': 'speed'})
+        self.assertEqual(parser.items('Skip : 1\n'
+                                      'Empty :\n'
+                                      'Other : 1\n'
+                                      'Rate : 40\n'
+                                      'State : Active'),
+                         [('speed', '40'),
+                          ('state', 'Active'),
+                          ('physical_state', 'Active')])
+        self.assertEqual(parser.keys['Skip'], None)
+
+    def test_parse_res(self):
+        parser = kvparser.KVParser()
+        self.assertEqual(parser.parse('B : 2', res={'A': 1}),
+                         {'A': 1, 'B': '2'})
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# test_kvparser.py ends here
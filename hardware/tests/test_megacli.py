@@ -152,6 +152,113 @@ PD Type: SAS'''
                           'State': 'Optimal',
                           'StripSize': '64 KB'})
 
+    def test_split_sections(self):
+        self.assertEqual(megacli.split_sections(r'^Adapter #(\d+)',
+                                                'header\nAdapter #0\na: 1\n'
+                                                'Adapter #1\nb: 2'),
+                         [('0', 'Adapter #0\na: 1'),
+                          ('1', 'Adapter #1\nb: 2')])
+
+    def test_adp_all_info_all(self):
+        self.output = sample('megacli_adp_all_info')
+        self.assertEqual(megacli.adp_all_info_all(),
+                         {0: megacli.adp_all_info(0)})
+
+    def test_enc_info_all(self):
+        self.output = sample('megacli_encinfo_all')
+        info = megacli.enc_info_all()
+        self.assertEqual(sorted(info.keys()), [0, 1])
+        self.assertEqual(info[0][0]['DeviceId'], 32)
+        self.assertEqual(info[1][0]['Enclosure'], 0)
+        self.assertEqual(info[1][0]['NumberOfSlots'], 4)
+
+    def test_pd_list(self):
+        self.output = sample('megacli_pdlist')
+        pdisks = megacli.pd_list()
+        self.assertEqual(list(pdisks.keys()), [0])
+        self.assertEqual([(pd['EnclosureDeviceId'], pd['SlotNumber'])
+                          for pd in pdisks[0]], [(32, 0), (32, 1)])
+        self.assertEqual(pdisks[0][1]['OtherErrorCount'], 3)
+        self.assertEqual(pdisks[0][0]['CoercedSize'],
+                         '278.875 GB [0x22dc0000 Sectors]')
+
+    def test_ld_info_all(self):
+        self.output = sample('megacli_ldinfo_all')
+        ldisks = megacli.ld_info_all()
+        self.assertEqual([num for num, _ in ldisks[0]], [0, 1])
+        self.assertEqual(ldisks[0][1][1],
+                         {'Adapter0--VirtualDriveInformation': '',
+                          'Name': 'scratch',
+                          'RaidLevel': 'Primary-0, Secondary-0, RAID Level '
+                          'Qualifier-0',
+                          'Size': '1.089 TB',
+                          'State': 'Optimal',
+                          'StripSize': '64 KB',
+                          'NumberOfDrives': 4})
+
+    def test_detect_batched_same_as_per_device(self):
+        pdlist = megacli.split_sections(megacli.PD_SEP,
+                                        sample('megacli_pdlist'))
+        ldinfo = sample('megacli_ldinfo_all').replace('Exit Code: 0x00', '')
+        header = 'Adapter 0 -- Virtual Drive Information:\n'
+        lds = megacli.split_sections(megacli.LD_SEP, ldinfo)
+        outputs = {
+            'adpallinfo -aALL': sample('megacli_adp_all_info'),
+            'EncInfo -aALL': sample('megacli_encinfo_all'),
+            'PDList -aALL': sample('megacli_pdlist'),
+            'LDInfo -Lall -aALL': sample('megacli_ldinfo_all'),
+            'adpCount': sample('megacli_adpcount'),
+            'adpallinfo -a0': sample('megacli_adp_all_info'),
+            'EncInfo -a0': megacli.split_sections(
+                megacli.ENC_ADAPTER_SEP,
+                sample('megacli_encinfo_all'))[0][1],
+            'pdinfo -PhysDrv[32:0] -a0': pdlist[0][1],
+            'pdinfo -PhysDrv[32:1] -a0': pdlist[1][1],
+            'LDGetNum -a0':
+            ' Number of Virtual Drives Configured on Adapter 0: 2',
+            'LDInfo -L0 -a0': header + lds[0][1],
+            'LDInfo -L1 -a0': header + lds[1][1],
+        }
+        calls = []
+
+        def run(*args):
+            calls.append(args[0])
+            return outputs.get(args[0], '')
+
+        megacli.run_megacli = run
+        hw_lst = megacli.detect()
+        self.assertEqual(len(calls), 4)
+        self.assertIn(('pdisk', 'disk1', 'id', '32:1'), hw_lst)
+        self.assertIn(('pdisk', 'all', 'size', '557.75'), hw_lst)
+        self.assertIn(('ldisk', 'disk1', 'Size', '1089'), hw_lst)
+        self.assertIn(('disk', 'megaraid', 'count', '2'), hw_lst)
+        self.assertEqual(megacli.detect(batched=False), hw_lst)
+        self.assertGreater(len(calls), 4 + 8)
+
+    def test_detect_two_adapters(self):
+        # the second adapter has the same slots behind enclosure 252
+        pdlist = sample('megacli_pdlist')
+        pdlist += (pdlist.replace('Adapter #0', 'Adapter #1')
+                   .replace('Enclosure Device ID: 32',
+                            'Enclosure Device ID: 252')
+                   .replace('Device Id: 0', 'Device Id: 8')
+                   .replace('Device Id: 1', 'Device Id: 9'))
+        adapters = sample('megacli_adp_all_info')
+        outputs = {
+            'adpallinfo -aALL': adapters + adapters.replace('Adapter #0',
+                                                            'Adapter #1'),
+            'EncInfo -aALL': sample('megacli_encinfo_all'),
+            'PDList -aALL': pdlist,
+        }
+        megacli.run_megacli = lambda *args: outputs.get(args[0], '')
+        hw_lst = megacli.detect()
+        # the index of the adapter, not the number of adapters
+        self.assertEqual([(name, value) for (hw_cls, name, key, value)
+                          in hw_lst if hw_cls == 'pdisk' and key == 'ctrl'],
+                         [('disk0', '0'), ('disk1', '0'),
+                          ('disk0', '1'), ('disk1', '1')])
+        self.assertIn(('disk', 'megaraid', 'count', '4'), hw_lst)
+
 
 ENC_OUTPUT = sample('megacli_enc')
 
@@ -0,0 +1,114 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from hardware import nvme
+from hardware.tests.utils import sample
+
+
+class TestNvme(unittest.TestCase):
+
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        ctrl_dir = os.path.join(self.sysfs, 'nvme0')
+        os.mkdir(ctrl_dir)
+        for attr, value in (('model', 'Samsung SSD 950 PRO 256GB  \n'),
+                            ('serial', 'CYBERDYNE_T1000     \n'),
+                            ('firmware_rev', '1B0QBXX7\n')):
+            with open(os.path.join(ctrl_dir, attr), 'w') as sysfs_file:
+                sysfs_file.write(value)
+
+    def tearDown(self):
+        shutil.rmtree(self.sysfs)
+
+    def test_ioctl_number(self):
+        self.assertEqual(nvme.NVME_IOCTL_ADMIN_CMD, 0xc0484e41)
+
+    def test_parse_smart_log(self):
+        log = nvme.parse_smart_log(sample('nvme_smart_log.bin', mode='rb'))
+        self.assertEqual(log['critical_warning'], 0)
+        self.assertEqual(log['temperature'], 40)
+        self.assertEqual(log['available_spare'], 100)
+        self.assertEqual(log['available_spare_threshold'], 10)
+        self.assertEqual(log['data_units_read'], 1769281)
+        self.assertEqual(log['host_writes'], 19105374)
+        self.assertEqual(log['power_on_hours'], 129)
+        self.assertEqual(log['num_err_log_entries'], 44)
+
+    def test_parse_identify_ctrl(self):
+        ident = nvme.parse_identify_ctrl(
+            sample('nvme_identify_ctrl.bin', mode='rb'))
+        self.assertEqual(ident,
+                         {'serial_number': 'CYBERDYNE_T1000',
+                          'model_number': 'Samsung SSD 950 PRO 256GB',
+                          'firmware_version': '1B0QBXX7',
+                          'warning_temp_threshold': 70,
+                          'critical_temp_threshold': 80,
+                          'total_nvm_capacity': 256060514304})
+
+    def test_format_capacity(self):
+        self.assertEqual(nvme.format_capacity(256060514304),
+                         '256,060,514,304 [256 GB]')
+        self.assertEqual(nvme.format_capacity(1920383410176),
+                         '1,920,383,410,176 [1.92 TB]')
+
+    @mock.patch.object(nvme, 'admin_command')
+    @mock.patch('os.close')
+    @mock.patch('os.open', return_value=42)
+    def test_read_nvme_smart(self, mock_open, mock_close, mock_admin):
+        def fake_admin(fd, opcode, nsid, cdw10, size):
+            if opcode == nvme.NVME_ADMIN_IDENTIFY:
+                return sample('nvme_identify_ctrl.bin', mode='rb')
+            return sample('nvme_smart_log.bin', mode='rb')
+
+        mock_admin.side_effect = fake_admin
+        hwlst = []
+        nvme.read_nvme_smart(hwlst, 'nvme0', sysfs_root=self.sysfs)
+        mock_open.assert_called_once_with('/dev/nvme0', os.O_RDONLY)
+        mock_close.assert_called_once_with(42)
+        self.assertEqual(hwlst, [
+            ('disk', 'nvme0', 'SMART/model_number',
+             'Samsung SSD 950 PRO 256GB'),
+            ('disk', 'nvme0', 'SMART/serial_number', 'CYBERDYNE_T1000'),
+            ('disk', 'nvme0', 'SMART/firmware_version', '1B0QBXX7'),
+            ('disk', 'nvme0', 'SMART/total_nvm_capacity',
+             '256,060,514,304 [256 GB]'),
+            ('disk', 'nvme0', 'SMART/warning_temp_threshold', '70'),
+            ('disk', 'nvme0', 'SMART/warning_temp_threshold_unit',
+             'Celsius'),
+            ('disk', 'nvme0', 'SMART/critical_temp_threshold', '80'),
+            ('disk', 'nvme0', 'SMART/critical_temp_threshold_unit',
+             'Celsius'),
+            ('disk', 'nvme0', 'SMART/critical_warning', '0x00'),
+            ('disk', 'nvme0', 'SMART/temperature', '40'),
+            ('disk', 'nvme0', 'SMART/temperature_unit', 'Celsius'),
+            ('disk', 'nvme0', 'SMART/power_cycles', '32'),
+            ('disk', 'nvme0', 'SMART/power_on_hours', '129'),
+            ('disk', 'nvme0', 'SMART/unsafe_shutdowns', '6'),
+            ('disk', 'nvme0', 'SMART/media_data_integrity_errors', '0'),
+            ('disk', 'nvme0', 'SMART/error_information_log_entries', '44')])
+
+    @mock.patch('os.open', side_effect=OSError(13, 'Permission denied'))
+    def test_read_nvme_smart_no_access(self, mock_open):
+        hwlst = []
+        self.assertIsNone(nvme.read_nvme_smart(hwlst, 'nvme0',
+                                               sysfs_root=self.sysfs))
+        self.assertEqual(hwlst, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
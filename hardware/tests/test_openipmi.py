@@ -0,0 +1,236 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import ctypes
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from hardware import ipmi
+from hardware import openipmi
+
+
+def full_sensor(record_id, number, name, unit, m=1, r_exp=0, percent=False,
+                owner=0x20):
+    record = bytearray(48 + len(name))
+    struct.pack_into('<HBBB', record, 0, record_id, 0x51, 0x01,
+                     len(record) - 5)
+    record[5:8] = bytes([owner, 0, number])
+    record[13] = openipmi.THRESHOLD_READING_TYPE
+    record[20] = 0x01 if percent else 0x00
+    record[21] = unit
+    record[24] = m & 0xff
+    record[25] = (m >> 2) & 0xc0
+    record[29] = (r_exp & 0x0f) << 4
+    record[47] = 0xc0 | len(name)
+    record[48:] = name.encode()
+    return bytes(record)
+
+
+def compact_sensor(record_id, number, name):
+    record = bytearray(32 + len(name))
+    struct.pack_into('<HBBB', record, 0, record_id, 0x51, 0x02,
+                     len(record) - 5)
+    record[5:8] = bytes([0x20, 0, number])
+    record[13] = 0x6f
+    record[31] = 0xc0 | len(name)
+    record[32:] = name.encode()
+    return bytes(record)
+
+
+class FakeBMC(object):
+    """Simulated BMC answering the commands used by openipmi."""
+
+    def __init__(self):
+        self.records = [full_sensor(1, 1, 'Temp 1', 1),
+                        full_sensor(2, 2, '12V', 4, m=6, r_exp=-2),
+                        full_sensor(3, 3, 'Fan 1', 0, m=49, r_exp=-2,
+                                    percent=True),
+                        compact_sensor(4, 4, 'Memory'),
+                        full_sensor(5, 5, 'Temp 18', 1),
+                        full_sensor(6, 6, 'ME Temp', 1, owner=0x2c),
+                        # an entity association record is not a sensor
+                        struct.pack('<HBBB', 7, 0x51, 0x08, 3) + b'\0' * 3]
+        self.readings = {1: b'\x1b\xc0\x00', 2: b'\xc9\xc0\x00',
+                         3: b'\x44\xc0\x00', 4: b'\x00\xc0\x01',
+                         5: b'\x00\x00\x00'}
+        self.addition = 1000
+        self.reservation = 0
+        self.cancel_reservations = 0
+        self.calls = []
+
+    def command(self, netfn, cmd, data=b'', lun=0):
+        self.calls.append((netfn, cmd))
+        if (netfn, cmd) == (openipmi.NETFN_APP,
+                            openipmi.CMD_GET_CHANNEL_INFO):
+            medium = openipmi.CHANNEL_MEDIUM_LAN if data[0] == 1 else 0x01
+            return bytes([data[0], medium, 0x01, 0x80, 0xf2, 0x1b, 0, 0, 0])
+        if (netfn, cmd) == (openipmi.NETFN_TRANSPORT,
+                            openipmi.CMD_GET_LAN_CONFIG):
+            return b'\x11' + LAN_CONFIG[data[1]]
+        if (netfn, cmd) == (openipmi.NETFN_STORAGE,
+                            openipmi.CMD_GET_SDR_REPOSITORY_INFO):
+            return struct.pack('<BHHIIB', 0x51, len(self.records), 0,
+                               self.addition, 0, 0)
+        if (netfn, cmd) == (openipmi.NETFN_STORAGE,
+                            openipmi.CMD_RESERVE_SDR_REPOSITORY):
+            self.reservation += 1
+            return struct.pack('<H', self.reservation)
+        if (netfn, cmd) == (openipmi.NETFN_STORAGE, openipmi.CMD_GET_SDR):
+            reservation, record_id, offset, size = struct.unpack('<HHBB',
+                                                                 data)
+            if self.cancel_reservations:
+                self.cancel_reservations -= 1
+                raise openipmi.IPMIError('cancelled', 0xc5)
+            assert reservation == self.reservation
+            assert size <= openipmi.SDR_CHUNK_SIZE
+            record = self.records[record_id - 1 if record_id else 0]
+            index = self.records.index(record)
+            next_id = (index + 2 if index + 1 < len(self.records)
+                       else openipmi.SDR_LAST_RECORD)
+            return (struct.pack('<H', next_id)
+                    + record[offset:offset + size])
+        if (netfn, cmd) == (openipmi.NETFN_SENSOR,
+                            openipmi.CMD_GET_SENSOR_READING):
+            assert lun == 0
+            return self.readings[data[0]]
+        raise openipmi.IPMIError('invalid command', 0xc1)
+
+
+LAN_CONFIG = {0: b'\x00',
+              3: bytes([10, 151, 68, 13]),
+              4: b'\x01',
+              5: bytes([0x00, 0x30, 0x48, 0xf4, 0x4d, 0x83]),
+              6: bytes([255, 255, 255, 0]),
+              12: bytes([10, 151, 68, 3]),
+              13: bytes(6),
+              14: bytes(4),
+              15: bytes(6),
+              20: b'\x00\x00',
+              21: b'\x00'}
+
+
+class TestOpenIPMI(unittest.TestCase):
+
+    def setUp(self):
+        self.bmc = FakeBMC()
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmpdir, 'cache', 'sdr.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @unittest.skipUnless(ctypes.sizeof(ctypes.c_void_p) == 8, '64 bits only')
+    def test_ioctl_numbers(self):
+        self.assertEqual(openipmi.IPMICTL_SEND_COMMAND, 0x8028690d)
+        self.assertEqual(openipmi.IPMICTL_RECEIVE_MSG_TRUNC, 0xc030690b)
+
+    def test_lan(self):
+        self.assertEqual(openipmi.find_lan_channel(self.bmc), 1)
+        self.assertEqual(openipmi.get_lan_info(self.bmc, 1),
+                         [('set-in-progress', 'Set Complete'),
+                          ('ip-address-source', 'Static Address'),
+                          ('ip-address', '10.151.68.13'),
+                          ('subnet-mask', '255.255.255.0'),
+                          ('mac-address', '00:30:48:f4:4d:83'),
+                          ('default-gateway-ip', '10.151.68.3'),
+                          ('default-gateway-mac', '00:00:00:00:00:00'),
+                          ('backup-gateway-ip', '0.0.0.0'),
+                          ('backup-gateway-mac', '00:00:00:00:00:00'),
+                          ('802.1q-vlan-id', 'Disabled'),
+                          ('802.1q-vlan-priority', '0')])
+
+    def test_read_sensors(self):
+        sensors = openipmi.get_sensors(self.bmc, None)
+        self.assertEqual(len(sensors), 6)
+        self.assertEqual(openipmi.read_sensors(self.bmc, sensors),
+                         [('ipmi', 'Temp 1', 'value', '27'),
+                          ('ipmi', 'Temp 1', 'unit', 'degrees C'),
+                          ('ipmi', '12V', 'value', '12.06'),
+                          ('ipmi', '12V', 'unit', 'Volts'),
+                          ('ipmi', 'Fan 1', 'value', '33.32'),
+                          ('ipmi', 'Fan 1', 'unit', 'percent'),
+                          ('ipmi', 'Memory', 'value', '0x01'),
+                          ('ipmi', 'Temp 18', 'value', 'disabled')])
+
+    def test_reservation_cancelled(self):
+        self.bmc.cancel_reservations = 2
+        self.assertEqual(len(openipmi.read_sdr_repository(self.bmc)), 7)
+        self.assertEqual(self.bmc.reservation, 3)
+        self.bmc.cancel_reservations = 3
+        self.assertRaises(openipmi.IPMIError, openipmi.read_sdr_repository,
+                          self.bmc)
+
+    def test_sdr_cache(self):
+        sensors = openipmi.get_sensors(self.bmc, self.cache_file)
+        self.assertTrue(os.path.exists(self.cache_file))
+        self.bmc.calls = []
+        self.assertEqual(openipmi.get_sensors(self.bmc, self.cache_file),
+                         sensors)
+        self.assertEqual(self.bmc.calls,
+                         [(openipmi.NETFN_STORAGE,
+                           openipmi.CMD_GET_SDR_REPOSITORY_INFO)])
+        # a new record changes the addition timestamp
+        self.bmc.records[0] = full_sensor(1, 1, 'Inlet Temp', 1)
+        self.bmc.addition += 1
+        sensors = openipmi.get_sensors(self.bmc, self.cache_file)
+        self.assertEqual(sensors[0]['name'], 'Inlet Temp')
+        self.assertIn((openipmi.NETFN_STORAGE, openipmi.CMD_GET_SDR),
+                      self.bmc.calls)
+
+    def test_truncated_responses(self):
+        command = self.bmc.command
+
+        def truncated(netfn, cmd, data=b'', lun=0):
+            return command(netfn, cmd, data, lun)[:3]
+
+        self.bmc.command = truncated
+        self.assertRaises(openipmi.IPMIError, openipmi.get_channel_info,
+                          self.bmc, 1)
+        self.assertRaises(openipmi.IPMIError,
+                          openipmi.get_sdr_repository_info, self.bmc)
+        self.assertRaises(openipmi.IPMIError, openipmi.get_sdr, self.bmc,
+                          0, 1)
+        self.assertRaises(openipmi.IPMIError, openipmi.get_lan_info,
+                          self.bmc, 1)
+        # a compact record cut before the length of its name
+        self.assertRaises(openipmi.IPMIError, openipmi.parse_sdr_record,
+                          compact_sensor(4, 4, 'Memory')[:20])
+
+    @mock.patch.object(openipmi, 'OpenIPMI')
+    def test_ipmi_native_truncated(self, mock_openipmi):
+        # a compact record of 20 bytes, its header has the right length
+        self.bmc.records[3] = self.bmc.records[3][:4] + b'\x0f' + bytes(15)
+        mock_openipmi.return_value.__enter__.return_value = self.bmc
+        # a buggy BMC makes the caller fall back to ipmitool
+        self.assertIsNone(ipmi.get_ipmi_sdr_native(self.cache_file))
+
+    @mock.patch.object(openipmi, 'OpenIPMI')
+    def test_ipmi_native(self, mock_openipmi):
+        mock_openipmi.return_value.__enter__.return_value = self.bmc
+        self.assertEqual(ipmi.detect_native()[:2],
+                         [('system', 'ipmi', 'channel', '1'),
+                          ('ipmi', 'lan', 'set-in-progress', 'Set Complete')])
+        self.assertEqual(ipmi.get_ipmi_sdr_native(self.cache_file)[0],
+                         ('ipmi', 'Temp 1', 'value', '27'))
+        mock_openipmi.side_effect = OSError('no /dev/ipmi0')
+        self.assertIsNone(ipmi.detect_native())
+        self.assertIsNone(ipmi.get_ipmi_sdr_native(self.cache_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# test_openipmi.py ends here
@@ -0,0 +1,147 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from hardware import areca
+from hardware import hpacucli
+from hardware import raid
+from hardware import storcli
+
+
+MEGARAID_LST = [
+    ('megaraid', 'Controller_1', 'ProductName', 'PERC H730P Mini'),
+    ('megaraid', 'Controller_1/Enclosure_0', 'DeviceId', '32'),
+    ('pdisk', 'disk0', 'ctrl', '2'),
+    ('pdisk', 'disk0', 'type', 'SAS'),
+    ('pdisk', 'disk0', 'id', '32:0'),
+    ('pdisk', 'disk0', 'size', '278.875'),
+    ('pdisk', 'disk0', 'InquiryData[1]', 'ST9300605SS'),
+    ('pdisk', 'disk0', 'FirmwareState', 'Online, Spun Up'),
+    ('pdisk', 'all', 'size', '278.88'),
+    ('ldisk', 'disk0', 'RaidLevel', 'RAID1'),
+    ('ldisk', 'disk0', 'Size', '278.875'),
+    ('disk', 'megaraid', 'count', '1'),
+]
+
+HPA_LST = [
+    ('hpa', 'slots', 'count', '1'),
+    ('hpa', 'slot_2', 'serial_number', 'PDKRH0ARH4F1R6'),
+    ('disk', '2I:1:7', 'type', 'Solid State SATA'),
+    ('disk', '2I:1:7', 'slot', '2'),
+    ('disk', '2I:1:7', 'serial_number', 'BTTV305001NZ100FGN'),
+    ('disk', '2I:1:7', 'size', '100'),
+    ('disk', '2I:1:7', 'array', 'A'),
+    ('disk', 'hpa', 'size', '100.00'),
+    ('disk', 'hpa', 'count', '1'),
+]
+
+ARECA_LST = [
+    ('areca', 'system', 'ControllerName', 'ARC-1222'),
+    ('areca', 'disk8', 'DeviceType', 'SATA(5001B4D4188DF017)'),
+    ('areca', 'disk8', 'ModelName', 'Hitachi HDS721010CLA330'),
+    ('areca', 'disk8', 'DeviceTemperature', 27),
+    ('areca', 'disk8', 'DeviceTemperature/unit', 'C'),
+]
+
+
+class TestRaid(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _add_pci_device(self, address, vendor, pci_class):
+        path = os.path.join(self.root, address)
+        os.makedirs(path)
+        with open(os.path.join(path, 'vendor'), 'w') as pci:
+            pci.write('%s\n' % vendor)
+        with open(os.path.join(path, 'class'), 'w') as pci:
+            pci.write('%s\n' % pci_class)
+
+    def test_pci_storage_vendors(self):
+        self._add_pci_device('0000:02:00.0', '0x1000', '0x010400')
+        # an HP iLO is not a storage controller
+        self._add_pci_device('0000:01:00.2', '0x103c', '0x088000')
+        self.assertEqual(raid.pci_storage_vendors(self.root), set([0x1000]))
+        self.assertIsNone(raid.pci_storage_vendors(
+            os.path.join(self.root, 'missing')))
+
+    def test_normalize_megaraid(self):
+        self.assertEqual(
+            raid.normalize('megaraid', MEGARAID_LST),
+            [('raid_pdisk', 'megaraid:1/32:0', 'controller', '1'),
+             ('raid_pdisk', 'megaraid:1/32:0', 'interface', 'SAS'),
+             ('raid_pdisk', 'megaraid:1/32:0', 'size', '278.875'),
+             ('raid_pdisk', 'megaraid:1/32:0', 'model', 'ST9300605SS'),
+             ('raid_pdisk', 'megaraid:1/32:0', 'state', 'Online, Spun Up'),
+             ('raid_ldisk', 'megaraid:1/0', 'controller', '1'),
+             ('raid_ldisk', 'megaraid:1/0', 'raid_level', 'RAID1'),
+             ('raid_ldisk', 'megaraid:1/0', 'size', '278.875')])
+
+    def test_normalize_hpa(self):
+        self.assertEqual(
+            raid.normalize('hpa', HPA_LST),
+            [('raid_pdisk', 'hpa:2/2I:1:7', 'controller', '2'),
+             ('raid_pdisk', 'hpa:2/2I:1:7', 'interface', 'Solid State SATA'),
+             ('raid_pdisk', 'hpa:2/2I:1:7', 'serial', 'BTTV305001NZ100FGN'),
+             ('raid_pdisk', 'hpa:2/2I:1:7', 'size', '100'),
+             ('raid_pdisk', 'hpa:2/2I:1:7', 'array', 'A')])
+
+    def test_normalize_areca(self):
+        self.assertEqual(
+            raid.normalize('areca', ARECA_LST),
+            [('raid_pdisk', 'areca:0/8', 'controller', '0'),
+             ('raid_pdisk', 'areca:0/8', 'interface', 'SATA'),
+             ('raid_pdisk', 'areca:0/8', 'model', 'Hitachi HDS721010CLA330'),
+             ('raid_pdisk', 'areca:0/8', 'temperature', '27')])
+
+    @mock.patch.object(areca, 'detect')
+    @mock.patch.object(hpacucli, 'detect', return_value=HPA_LST)
+    @mock.patch.object(storcli, 'detect', return_value=MEGARAID_LST)
+    def test_detect_present_vendors(self, mock_storcli, mock_hpa,
+                                    mock_areca):
+        self._add_pci_device('0000:02:00.0', '0x1000', '0x010400')
+        self._add_pci_device('0000:05:00.0', '0x9005', '0x010700')
+        hw_lst = raid.detect(self.root)
+        mock_areca.assert_not_called()
+        self.assertEqual(hw_lst[:len(HPA_LST)], HPA_LST)
+        self.assertIn(('raid_pdisk', 'megaraid:1/32:0', 'interface', 'SAS'),
+                      hw_lst)
+        self.assertIn(('raid_pdisk', 'hpa:2/2I:1:7', 'array', 'A'), hw_lst)
+
+    @mock.patch.object(areca, 'detect', side_effect=OSError('no cli64'))
+    @mock.patch.object(hpacucli, 'detect', return_value=[])
+    @mock.patch.object(storcli, 'detect', return_value=[])
+    def test_detect_without_sysfs(self, mock_storcli, mock_hpa, mock_areca):
+        self.assertEqual(raid.detect(os.path.join(self.root, 'missing')), [])
+        mock_areca.assert_called_once_with()
+        mock_hpa.assert_called_once_with()
+        mock_storcli.assert_called_once_with()
+
+    @mock.patch.object(storcli, 'detect')
+    def test_detect_no_controller(self, mock_storcli):
+        self._add_pci_device('0000:00:17.0', '0x8086', '0x010601')
+        self.assertEqual(raid.detect(self.root), [])
+        mock_storcli.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# test_raid.py ends here
@@ -0,0 +1,137 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hardware import sensors
+
+
+HWMON = {
+    'hwmon0': ('devices/platform/coretemp.0',
+               {'name': 'coretemp',
+                'temp1_label': 'Package id 0',
+                'temp1_input': '45000',
+                'temp1_max': '80000',
+                'temp1_crit': '100000',
+                'temp1_crit_alarm': '0',
+                'temp2_label': 'Core 0',
+                'temp2_input': '43000'}),
+    'hwmon1': ('devices/pci0000:00/0000:00:18.3',
+               {'name': 'k10temp',
+                'temp1_label': 'Tctl',
+                'temp1_input': '52125',
+                'in0_input': '1200',
+                'power1_average': '15000000',
+                'curr1_input': '2500'}),
+    'hwmon2': (None,
+               {'name': 'acpitz',
+                'temp1_input': '27800'}),
+}
+
+
+class TestSensors(unittest.TestCase):
+
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        self.root = os.path.join(self.sysfs, 'class', 'hwmon')
+        os.makedirs(self.root)
+        for entry, (device, attributes) in HWMON.items():
+            path = os.path.join(self.root, entry)
+            os.makedirs(path)
+            if device:
+                os.makedirs(os.path.join(self.sysfs, device))
+                os.symlink(os.path.join(self.sysfs, device),
+                           os.path.join(path, 'device'))
+            for attribute, value in attributes.items():
+                self._write(entry, attribute, value)
+        # old kernels put the attributes in the device directory
+        path = os.path.join(self.sysfs, 'devices', 'platform', 'it87.656')
+        os.makedirs(path)
+        os.makedirs(os.path.join(self.root, 'hwmon3'))
+        os.symlink(path, os.path.join(self.root, 'hwmon3', 'device'))
+        self._write('hwmon3/device', 'name', 'it8728')
+        self._write('hwmon3/device', 'fan1_input', '1200')
+
+    def tearDown(self):
+        shutil.rmtree(self.sysfs)
+
+    def _write(self, entry, attribute, value):
+        with open(os.path.join(self.root, entry, attribute), 'w') as sysfs:
+            sysfs.write(value + '\n')
+
+    def test_detect_hwmon(self):
+        self.assertEqual(sensors.detect_hwmon(self.root), [
+            ('hwmon', 'coretemp:coretemp.0', 'temp1/label', 'Package id 0'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp2/label', 'Core 0'),
+            ('hwmon', 'k10temp:0000:00:18.3', 'temp1/label', 'Tctl'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp1/input', '45'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp1/unit', 'C'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp1/max', '80'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp1/crit', '100'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp1/crit_alarm', '0'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp2/input', '43'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp2/unit', 'C'),
+            ('hwmon', 'k10temp:0000:00:18.3', 'curr1/input', '2.5'),
+            ('hwmon', 'k10temp:0000:00:18.3', 'curr1/unit', 'A'),
+            ('hwmon', 'k10temp:0000:00:18.3', 'in0/input', '1.2'),
+            ('hwmon', 'k10temp:0000:00:18.3', 'in0/unit', 'V'),
+            ('hwmon', 'k10temp:0000:00:18.3', 'power1/average', '15'),
+            ('hwmon', 'k10temp:0000:00:18.3', 'power1/unit', 'W'),
+            ('hwmon', 'k10temp:0000:00:18.3', 'temp1/input', '52.125'),
+            ('hwmon', 'k10temp:0000:00:18.3', 'temp1/unit', 'C'),
+            ('hwmon', 'acpitz:hwmon2', 'temp1/input', '27.8'),
+            ('hwmon', 'acpitz:hwmon2', 'temp1/unit', 'C'),
+            ('hwmon', 'it8728:it87.656', 'fan1/input', '1200'),
+            ('hwmon', 'it8728:it87.656', 'fan1/unit', 'RPM')])
+
+    def test_detect_temperatures(self):
+        self.assertEqual(sensors.detect_temperatures(self.root), [
+            ('cpu', 'physical_0', 'Package_id_0/temperature', '45000'),
+            ('cpu', 'physical_0', 'Package_id_0/max', '80000'),
+            ('cpu', 'physical_0', 'Package_id_0/critical', '100000'),
+            ('cpu', 'physical_0', 'Package_id_0/critical_alarm', '0'),
+            ('cpu', 'physical_0', 'Core_0/temperature', '43000')])
+
+    def test_sampler(self):
+        sampler = sensors.HwmonSampler(frequency=10, size=2,
+                                       sysfs_root=self.root)
+        for value in ('40000', '50000', '48000'):
+            self._write('hwmon0', 'temp1_input', value)
+            sampler.sample()
+        sampler.stop()
+        hwlst = sampler.report()
+        self.assertEqual(hwlst[:2], [('hwmon', 'sampling', 'samples', '3'),
+                                     ('hwmon', 'sampling', 'interval',
+                                      '0.1')])
+        # only the last 2 samples are kept
+        self.assertEqual(hwlst[2:5], [
+            ('hwmon', 'coretemp:coretemp.0', 'temp1/input_min', '48'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp1/input_max', '50'),
+            ('hwmon', 'coretemp:coretemp.0', 'temp1/input_avg', '49')])
+        self.assertIn(('hwmon', 'k10temp:0000:00:18.3',
+                       'power1/average_avg', '15'), hwlst)
+
+    def test_sampler_thread(self):
+        sampler = sensors.HwmonSampler(frequency=1000, sysfs_root=self.root)
+        sampler.start()
+        sampler.stop()
+        self.assertGreaterEqual(sampler.count, 1)
+        self.assertIsNone(sampler.reader.fds)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# test_sensors.py ends here
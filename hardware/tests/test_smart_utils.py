@@ -10,10 +10,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+import shutil
 import subprocess
+import tempfile
 import unittest
 from unittest import mock
 
+from hardware import detect_utils
+from hardware import nvme
 from hardware import smart_utils
 from hardware.tests.results import smart_utils_results
 from hardware.tests.utils import sample
@@ -148,3 +153,215 @@ class TestSmartUtils(unittest.TestCase):
         smart_utils.read_smart_nvme(hwlst, 'fake_nvme')
 
         self.assertEqual(hwlst, smart_utils_results.READ_SMART_NVME_RESULT)
+
+    @mock.patch('os.path.exists', return_value=True)
+    @mock.patch.object(subprocess, 'Popen')
+    def test_read_smart_json_ata(self, mock_popen, mock_os_path_exists):
+        hwlst = []
+        mock_popen.return_value.communicate.return_value = (
+            sample('smartctl_ata.json', mode='rb'), None)
+        smart_utils.read_smart_json(hwlst, '/dev/fake')
+
+        mock_popen.assert_called_once_with('smartctl -j -x /dev/fake ',
+                                           shell=True,
+                                           stdout=subprocess.PIPE)
+        self.assertEqual(hwlst, smart_utils_results.READ_SMART_JSON_ATA_RESULT)
+
+    @mock.patch('os.path.exists', return_value=True)
+    @mock.patch.object(subprocess, 'Popen')
+    def test_read_smart_json_scsi(self, mock_popen, mock_os_path_exists):
+        hwlst = []
+        mock_popen.return_value.communicate.return_value = (
+            sample('smartctl_scsi.json', mode='rb'), None)
+        smart_utils.read_smart_json(hwlst, '/dev/fake')
+
+        self.assertEqual(hwlst,
+                         smart_utils_results.READ_SMART_JSON_SCSI_RESULT)
+
+    @mock.patch('os.path.exists', return_value=True)
+    @mock.patch.object(subprocess, 'Popen')
+    def test_read_smart_json_nvme(self, mock_popen, mock_os_path_exists):
+        hwlst = []
+        mock_popen.return_value.communicate.return_value = (
+            sample('smartctl_nvme.json', mode='rb'), None)
+        smart_utils.read_smart_json(hwlst, '/dev/fake_nvme')
+
+        self.assertEqual(hwlst,
+                         smart_utils_results.READ_SMART_JSON_NVME_RESULT)
+
+    @mock.patch.object(nvme, 'admin_command')
+    @mock.patch('os.close')
+    @mock.patch('os.open', return_value=42)
+    @mock.patch('os.path.exists', return_value=True)
+    @mock.patch.object(subprocess, 'Popen')
+    def test_nvme_backends(self, mock_popen, mock_os_path_exists,
+                           mock_open, mock_close, mock_admin):
+        # the same disk read by smartctl 7 text and JSON, and natively
+        text = []
+        mock_popen.return_value = mock.Mock(
+            stdout=sample('smartctl_nvme_7', mode='rb').splitlines())
+        smart_utils.read_smart_nvme(text, 'nvme0')
+
+        json_lst = []
+        mock_popen.return_value.communicate.return_value = (
+            sample('smartctl_nvme.json', mode='rb'), None)
+        smart_utils.read_smart_json(json_lst, '/dev/nvme0')
+
+        native = []
+        mock_admin.side_effect = lambda fd, opcode, nsid, cdw10, size: (
+            sample('nvme_identify_ctrl.bin', mode='rb')
+            if opcode == nvme.NVME_ADMIN_IDENTIFY
+            else sample('nvme_smart_log.bin', mode='rb'))
+        nvme.read_nvme_smart(native, 'nvme0', sysfs_root='/nonexistent')
+
+        self.assertIn(('disk', 'nvme0', 'SMART/warning_temp_threshold_unit',
+                       'Celsius'), text)
+        self.assertEqual(sorted(text), sorted(native))
+        self.assertEqual(sorted(text), sorted(
+            entry for entry in json_lst if entry[2] != 'SMART/health'))
+
+    @mock.patch('os.path.exists', return_value=True)
+    @mock.patch.object(subprocess, 'Popen')
+    def test_read_smart_json_unsupported(self, mock_popen,
+                                         mock_os_path_exists):
+        hwlst = []
+        mock_popen.return_value.communicate.return_value = (
+            b'smartctl 6.5: unrecognized option -j', None)
+        self.assertIsNone(smart_utils.read_smart_json(hwlst, '/dev/fake'))
+        self.assertEqual(hwlst, [])
+
+    @mock.patch.object(smart_utils, 'get_scsi_host',
+                       side_effect=lambda device: int(device[-1]))
+    @mock.patch.object(detect_utils, 'output_lines')
+    def test_scan_passthrough(self, mock_output_lines, mock_host):
+        mock_output_lines.return_value = SCAN_OPEN_OUTPUT.splitlines()
+        self.assertEqual(smart_utils.scan_passthrough(),
+                         {'megaraid': {0: [0, 1, 8], 1: [0, 4]},
+                          'cciss': {}})
+        mock_output_lines.assert_called_once_with('smartctl --scan-open')
+
+    def test_get_scsi_host(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        for name, device in (('block/sda', 'host0/target0:2:0/0:2:0:0'),
+                             ('class/scsi_generic/sg3',
+                              'host2/target2:0:0/2:0:0:0')):
+            path = os.path.join(root, 'devices/pci0000:00', device)
+            os.makedirs(path)
+            os.makedirs(os.path.join(root, name))
+            os.symlink(path, os.path.join(root, name, 'device'))
+        self.assertEqual(smart_utils.get_scsi_host('/dev/bus/1', root), 1)
+        self.assertEqual(smart_utils.get_scsi_host('/dev/sda', root), 0)
+        self.assertEqual(smart_utils.get_scsi_host('/dev/sg3', root), 2)
+        self.assertIsNone(smart_utils.get_scsi_host('/dev/sdb', root))
+
+    def test_get_driver_hosts(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        for host, driver in ((0, 'ahci'), (10, 'megaraid_sas'),
+                             (2, 'megaraid_sas'), (3, 'hpsa')):
+            path = os.path.join(root, 'class/scsi_host/host%d' % host)
+            os.makedirs(path)
+            with open(os.path.join(path, 'proc_name'), 'w') as proc_name:
+                proc_name.write('%s\n' % driver)
+        self.assertEqual(smart_utils.get_driver_hosts('megaraid', root),
+                         [2, 10])
+        self.assertEqual(smart_utils.get_driver_hosts('cciss', root), [3])
+
+    @mock.patch.object(smart_utils, 'get_driver_hosts',
+                       side_effect=lambda mode: {'megaraid': [2, 5],
+                                                 'cciss': [3, 4]}[mode])
+    @mock.patch.object(smart_utils, 'scan_passthrough',
+                       return_value={'megaraid': {}, 'cciss': {}})
+    def test_get_passthrough_disks_inventory(self, mock_scan, mock_hosts):
+        hw_lst = [('pdisk', 'disk5', 'ctrl', '0'),
+                  ('pdisk', 'disk5', 'DeviceId', 5),
+                  ('pdisk', 'disk2', 'ctrl', '0'),
+                  ('pdisk', 'disk2', 'DeviceId', 2),
+                  ('pdisk', 'disk9', 'ctrl', '1'),
+                  ('pdisk', 'disk9', 'DeviceId', 2),
+                  ('disk', '1I:1:1', 'slot', '0'),
+                  ('disk', '1I:1:2', 'slot', '0'),
+                  ('disk', '2I:1:1', 'slot', '3')]
+        # the controllers are matched in order with the SCSI hosts
+        self.assertEqual(smart_utils.get_passthrough_disks(hw_lst),
+                         {'megaraid': {2: [2, 5], 5: [2]},
+                          'cciss': {3: [0, 1], 4: [0]}})
+
+    @mock.patch.object(smart_utils, 'get_driver_hosts', return_value=[0, 6])
+    @mock.patch.object(smart_utils, 'scan_passthrough',
+                       return_value={'megaraid': {}, 'cciss': {}})
+    def test_get_passthrough_disks_two_adapters(self, mock_scan, mock_hosts):
+        # the same slots on both adapters give the same pdisk names
+        hw_lst = []
+        for ctrl, device_ids in ((0, (0, 1)), (1, (8, 9))):
+            for slot, device_id in enumerate(device_ids):
+                hw_lst.extend([('pdisk', 'disk%d' % slot, 'ctrl', str(ctrl)),
+                               ('pdisk', 'disk%d' % slot, 'DeviceId',
+                                device_id)])
+        self.assertEqual(smart_utils.get_passthrough_disks(hw_lst),
+                         {'megaraid': {0: [0, 1], 6: [8, 9]}, 'cciss': {}})
+
+    @mock.patch.object(smart_utils, 'get_driver_hosts', return_value=[0])
+    @mock.patch.object(smart_utils, 'scan_passthrough',
+                       return_value={'megaraid': {}, 'cciss': {}})
+    def test_get_passthrough_disks_unmatched(self, mock_scan, mock_hosts):
+        hw_lst = [('pdisk', 'disk5', 'ctrl', '0'),
+                  ('pdisk', 'disk5', 'DeviceId', 5),
+                  ('pdisk', 'disk9', 'ctrl', '1'),
+                  ('pdisk', 'disk9', 'DeviceId', 2)]
+        self.assertEqual(smart_utils.get_passthrough_disks(hw_lst),
+                         {'megaraid': {}, 'cciss': {}})
+
+    @mock.patch.object(smart_utils, 'get_scsi_host',
+                       side_effect=lambda device: {'/dev/sda': 0,
+                                                   '/dev/sdb': 0,
+                                                   '/dev/sdc': 1}.get(device))
+    def test_controller_disks(self, mock_host):
+        passthrough = {'megaraid': {0: [0, 8]}, 'cciss': {}}
+        self.assertIs(smart_utils.controller_disks(passthrough, 'megaraid',
+                                                   '/dev/sda'),
+                      passthrough['megaraid'][0])
+        # no disk discovered on the second controller: legacy probe
+        self.assertEqual(smart_utils.controller_disks(passthrough,
+                                                      'megaraid', '/dev/sdc'),
+                         list(range(24)))
+        self.assertEqual(smart_utils.controller_disks(passthrough, 'cciss',
+                                                      '/dev/sdd'),
+                         list(range(24)))
+        self.assertIn('/dev/sdd', passthrough['cciss'])
+
+    @mock.patch.object(smart_utils, 'get_scsi_host',
+                       side_effect=lambda device: {'/dev/sda': 0,
+                                                   '/dev/sdb': 0,
+                                                   '/dev/sdc': 1}[device])
+    def test_read_smart_passthrough(self, mock_host):
+        def fake_reader(hwlst, device, optional_flag, mode):
+            hwlst.append(('disk', device, optional_flag, mode))
+
+        hwlst = []
+        passthrough = {'megaraid': {0: [0, 8], 1: [0, 4]}, 'cciss': {}}
+        for device in ('/dev/sda', '/dev/sdb', '/dev/sdc'):
+            smart_utils.read_smart_passthrough(
+                hwlst, device, 'megaraid',
+                smart_utils.controller_disks(passthrough, 'megaraid',
+                                             device),
+                fake_reader)
+        # sdb is a second logical volume of the controller of sda, the
+        # disks of the second controller are read through sdc
+        self.assertEqual(hwlst,
+                         [('disk', '/dev/sda', '-d megaraid,0', 'megaraid'),
+                          ('disk', '/dev/sda', '-d megaraid,8', 'megaraid'),
+                          ('disk', '/dev/sdc', '-d megaraid,0', 'megaraid'),
+                          ('disk', '/dev/sdc', '-d megaraid,4', 'megaraid')])
+        self.assertEqual(passthrough['megaraid'], {0: [], 1: []})
+
+
+SCAN_OPEN_OUTPUT = """/dev/sda -d scsi # /dev/sda, SCSI device
+/dev/bus/0 -d megaraid,0 # /dev/bus/0 [megaraid_disk_00], SCSI device
+/dev/bus/0 -d megaraid,1 # /dev/bus/0 [megaraid_disk_01], SCSI device
+/dev/bus/0 -d megaraid,8 # /dev/bus/0 [megaraid_disk_08], SCSI device
+/dev/bus/1 -d megaraid,4 # /dev/bus/1 [megaraid_disk_04], SCSI device
+/dev/bus/1 -d megaraid,0 # /dev/bus/1 [megaraid_disk_00], SCSI device
+/dev/nvme0 -d nvme # /dev/nvme0, NVMe device
+"""
@@ -0,0 +1,132 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import unittest
+from unittest import mock
+
+from hardware import megacli
+from hardware import storcli
+from hardware.tests.utils import sample
+
+
+OUTPUTS = {'/call show all J': sample('storcli_call_show_all.json'),
+           '/call/eall/sall show all J':
+           sample('storcli_drives_show_all.json')}
+
+
+def run_storcli(*args):
+    return OUTPUTS[' '.join(args)]
+
+
+@mock.patch.object(storcli, 'storcli_path', return_value='/sbin/storcli64')
+@mock.patch.object(storcli, 'run_storcli', side_effect=run_storcli)
+class TestStorcli(unittest.TestCase):
+
+    def test_run_and_parse(self, mock_run, mock_path):
+        res = storcli.run_and_parse('/call', 'show', 'all')
+        self.assertEqual(list(res.keys()), [0])
+        self.assertEqual(res[0]['Basics']['Model'], 'PERC H730P Mini')
+        mock_run.assert_called_once_with('/call', 'show', 'all', 'J')
+
+    def test_run_and_parse_failure(self, mock_run, mock_path):
+        mock_run.side_effect = None
+        mock_run.return_value = json.dumps(
+            {'Controllers': [{'Command Status': {
+                'Controller': 0, 'Status': 'Failure',
+                'Description': 'Un-supported command'}}]})
+        self.assertEqual(storcli.run_and_parse('/call', 'show', 'all'), {})
+        mock_run.return_value = 'storcli: not a JSON output'
+        self.assertIsNone(storcli.run_and_parse('/call', 'show', 'all'))
+
+    def test_parse_controller(self, mock_run, mock_path):
+        data = storcli.run_and_parse('/call', 'show', 'all')[0]
+        self.assertEqual(storcli.parse_controller(data),
+                         {'ProductName': 'PERC H730P Mini',
+                          'SerialNo': '5A6004Q',
+                          'FwPackageBuild': '25.5.5.0005',
+                          'FwVersion': '4.300.00-8352',
+                          'BiosVersion': '6.33.01.0_4.19.08.00_0x06120304',
+                          'DriverName': 'megaraid_sas',
+                          'DriverVersion': '07.705.02.00-rh1',
+                          'ControllerStatus': 'Optimal',
+                          'VirtualDrives': 1,
+                          'PhysicalDevices': 2})
+        self.assertEqual(storcli.parse_enclosures(data),
+                         [{'Enclosure': 0,
+                           'DeviceId': 32,
+                           'NumberOfSlots': 8,
+                           'NumberOfPowerSupplies': 0,
+                           'Status': 'OK'}])
+        self.assertEqual(storcli.parse_virtual_drives(data),
+                         [(0, {'Name': 'system',
+                               'RaidLevel': 'RAID1',
+                               'State': 'Optimal',
+                               'Size': '278.875 GB'})])
+
+    def test_parse_drives(self, mock_run, mock_path):
+        data = storcli.run_and_parse('/call/eall/sall', 'show', 'all')[0]
+        drives = storcli.parse_drives(data)
+        self.assertEqual(len(drives), 2)
+        self.assertEqual(drives[1],
+                         {'EnclosureDeviceId': 32,
+                          'SlotNumber': 1,
+                          'DeviceId': 1,
+                          'PdType': 'SAS',
+                          'FirmwareState': 'Online, Spun Up',
+                          'MediaType': 'Hard Disk Device',
+                          'CoercedSize': '278.875 GB [0x22dc0000 Sectors]',
+                          'MediaErrorCount': 0,
+                          'OtherErrorCount': 3,
+                          'PredictiveFailureCount': 0,
+                          'DriveTemperature': ' 35C (95.00 F)',
+                          'Wwn': '5000C50054C08E12',
+                          'DeviceFirmwareLevel': 'LS08',
+                          'RawSize': '279.396 GB [0x22ecb25c Sectors]',
+                          'NonCoercedSize': '278.896 GB [0x22dcb25c Sectors]',
+                          'DeviceSpeed': '6.0Gb/s',
+                          'LinkSpeed': '6.0Gb/s',
+                          'InquiryData': 'SEAGATE ST9300605SS 6XP2GA01'})
+
+    def test_detect(self, mock_run, mock_path):
+        hw_lst = storcli.detect()
+        self.assertEqual(mock_run.call_count, 2)
+        self.assertIn(('megaraid', 'Controller_0', 'ProductName',
+                       'PERC H730P Mini'), hw_lst)
+        self.assertIn(('megaraid', 'Controller_0/Enclosure_0', 'DeviceId',
+                       '32'), hw_lst)
+        self.assertIn(('pdisk', 'disk1', 'id', '32:1'), hw_lst)
+        self.assertIn(('pdisk', 'disk1', 'DeviceId', '1'), hw_lst)
+        self.assertIn(('pdisk', 'disk1', 'size', '278.875'), hw_lst)
+        self.assertIn(('pdisk', 'disk1', 'DriveTemperature', '35'), hw_lst)
+        self.assertIn(('pdisk', 'disk1', 'InquiryData[2]', '6XP2GA01'),
+                      hw_lst)
+        self.assertIn(('pdisk', 'all', 'size', '557.75'), hw_lst)
+        self.assertIn(('ldisk', 'disk0', 'State', 'Optimal'), hw_lst)
+        self.assertIn(('ldisk', 'disk0', 'Size', '278.875'), hw_lst)
+        self.assertEqual(hw_lst[-1], ('disk', 'megaraid', 'count', '2'))
+
+    @mock.patch.object(megacli, 'detect', return_value=['megacli'])
+    def test_detect_fallback(self, mock_megacli, mock_run, mock_path):
+        mock_path.return_value = None
+        self.assertEqual(storcli.detect(), ['megacli'])
+        mock_run.assert_not_called()
+        mock_path.return_value = '/sbin/storcli64'
+        mock_run.side_effect = None
+        mock_run.return_value = ''
+        self.assertEqual(storcli.detect(), ['megacli'])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# test_storcli.py ends here